@@ -20,6 +20,21 @@ def create_app():
     
     # Initialize session secret key
     app.secret_key = app.config['SECRET_KEY']
+
+    # Client IP (per-IP login throttle, audit rows) from X-Forwarded-For,
+    # trusting exactly TRUSTED_PROXY_COUNT proxy hops
+    from config.settings import Config
+    if Config.TRUSTED_PROXY_COUNT:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_COUNT)
+
+    # Server-side session store (SESSION_BACKEND); the cookie only carries the id
+    from app.sessions import init_sessions
+    init_sessions(app)
+
+    # One pooled DB connection per request, released on teardown
+    from app.db import db
+    db.init_app(app)
     
     # Register blueprints IN THIS EXACT ORDER
     from app.auth import auth_bp
@@ -36,6 +51,18 @@ def create_app():
     
     from app.audit import audit_bp
     app.register_blueprint(audit_bp)
+
+    from app.search import search_bp
+    app.register_blueprint(search_bp)
+
+    # Background audit writer (also replays any spool left by a crashed worker)
+    from app.audit.writer import audit_writer
+    audit_writer.start()
+
+    # Daily risk heat-map snapshot (first worker past RISK_SNAPSHOT_HOUR takes it)
+    from app.risk.snapshots import snapshot_scheduler
+    snapshot_scheduler.start()
+
     # Root route - redirects to login
     @app.route('/')
     def index():
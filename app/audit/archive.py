@@ -0,0 +1,337 @@
+"""
+Audit log partitions and archive tier - PaySecure Technologies GRC Platform
+audit_logs is RANGE-partitioned by month (scripts/migrations/010):
+- ensure_partitions() splits the catch-all pmax partition so the next
+  AUDIT_PARTITION_MONTHS_AHEAD months always exist
+- archive_expired() moves months older than AUDIT_HOT_MONTHS out of MySQL:
+  each partition is written to a gzip'd JSON Lines file (newest row first,
+  user names denormalised), verified, recorded in manifest.json with its row
+  count and SHA-256, and only then dropped (DROP PARTITION is metadata-only)
+- purge_expired() deletes archives past AUDIT_RETENTION_YEARS, recording the
+  last chain_seq / row_hash they held as the manifest's 'purged' boundary,
+  from which chain verification starts
+- archived_batches() streams archived rows in the export's row format, so
+  /audit/audit/export spans both tiers; audit_log_search keeps its copy of
+  archived events, so /search does too
+Run from scripts/audit_maintenance.py (cron, daily).
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime
+
+from app.db import db
+from config.settings import Config
+from .writer import DETAILS_SQL
+
+PARTITION_RE = re.compile(r'^p(\d{4})(\d{2})$')
+MANIFEST_NAME = 'manifest.json'
+
+PARTITIONS_SQL = """
+    SELECT PARTITION_NAME AS name, TABLE_ROWS AS approx_rows
+    FROM INFORMATION_SCHEMA.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'audit_logs'
+    ORDER BY PARTITION_ORDINAL_POSITION
+"""
+
+ARCHIVE_SELECT_SQL = """
+    SELECT al.log_id, al.user_id, al.action, al.entity_type, al.entity_id,
+           {details} AS details, al.ip_address, al.created_at,
+           al.chain_seq, al.row_hash, u.full_name, u.username, u.job_title
+    FROM audit_logs PARTITION ({partition}) AS al
+    LEFT JOIN users u ON al.user_id = u.user_id
+    ORDER BY al.log_id DESC
+"""
+
+ARCHIVE_FIELDS = ('log_id', 'user_id', 'action', 'entity_type', 'entity_id', 'details',
+                  'ip_address', 'created_at', 'chain_seq', 'row_hash',
+                  'full_name', 'username', 'job_title')
+
+
+class ArchiveError(Exception):
+    """Partition maintenance cannot proceed (unpartitioned table, failed verification)."""
+
+
+# ── Months and partition names ───────────────────────────────────────────────
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    years, month = divmod(d.month - 1 + n, 12)
+    return date(d.year + years, month + 1, 1)
+
+
+def partition_name(month):
+    return 'p{:04d}{:02d}'.format(month.year, month.month)
+
+
+def partition_month(name):
+    """'p202401' -> date(2024, 1, 1); None for pmax or foreign names."""
+    match = PARTITION_RE.match(name or '')
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_partitions():
+    """[{'name', 'month', 'approx_rows'}] in boundary order; None if audit_logs is not partitioned."""
+    rows = db.execute_query(PARTITIONS_SQL, fetch=True)
+    if not rows or rows[0]['name'] is None:
+        return None
+    return [{'name': r['name'], 'month': partition_month(r['name']),
+             'approx_rows': int(r['approx_rows'] or 0)} for r in rows]
+
+
+# ── Partition creation ───────────────────────────────────────────────────────
+
+def ensure_partitions(months_ahead=None, today=None):
+    """
+    Split pmax into monthly partitions up to `months_ahead` months past the
+    current one. Returns the names created. The first run starts at the
+    month of the oldest row and moves existing rows out of pmax once.
+    """
+    months_ahead = Config.AUDIT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    today = today or date.today()
+    partitions = list_partitions()
+    if partitions is None:
+        raise ArchiveError('audit_logs is not partitioned; apply migration 010 first')
+
+    monthly = [p['month'] for p in partitions if p['month']]
+    if monthly:
+        start = add_months(monthly[-1], 1)
+    else:
+        oldest = db.execute_query("SELECT MIN(created_at) AS oldest FROM audit_logs", fetch=True)
+        start = month_start(oldest[0]['oldest'] or today)
+
+    end = add_months(month_start(today), months_ahead)
+    months = []
+    while start <= end:
+        months.append(start)
+        start = add_months(start, 1)
+    if not months:
+        return []
+
+    clauses = ["PARTITION {} VALUES LESS THAN (UNIX_TIMESTAMP('{} 00:00:00'))".format(
+        partition_name(m), add_months(m, 1).isoformat()) for m in months]
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    db.execute_query("ALTER TABLE audit_logs REORGANIZE PARTITION pmax INTO ({})".format(
+        ', '.join(clauses)))
+    return [partition_name(m) for m in months]
+
+
+# ── Manifest ─────────────────────────────────────────────────────────────────
+
+def _archive_dir():
+    return Config.AUDIT_ARCHIVE_DIR
+
+
+def load_manifest(archive_dir=None):
+    path = os.path.join(archive_dir or _archive_dir(), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'table': 'audit_logs', 'format': 'jsonl.gz', 'order': 'log_id desc',
+                'archives': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest, archive_dir):
+    """Atomic replace, so readers never see a half-written manifest."""
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    tmp = path + '.tmp'
+    manifest['archives'].sort(key=lambda a: a['month'])
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ── Archiving ────────────────────────────────────────────────────────────────
+
+def _record(row):
+    record = {field: row.get(field) for field in ARCHIVE_FIELDS}
+    record['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+    return record
+
+
+def archive_partition(name, archive_dir=None, drop=True):
+    """
+    Write one monthly partition to <dir>/audit_logs_YYYYMM.jsonl.gz, verify it,
+    record it in the manifest and (if drop) drop the partition. Safe to rerun
+    after a failure at any step. Returns the manifest entry.
+    """
+    month = partition_month(name)
+    if month is None:
+        raise ArchiveError('{!r} is not a monthly partition'.format(name))
+    archive_dir = archive_dir or _archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+
+    filename = 'audit_logs_{:04d}{:02d}.jsonl.gz'.format(month.year, month.month)
+    path = os.path.join(archive_dir, filename)
+    tmp = path + '.tmp'
+    rows, first, last = 0, None, None
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as gz:
+            batches = db.stream_query(
+                ARCHIVE_SELECT_SQL.format(details=DETAILS_SQL, partition=name),
+                batch_size=Config.AUDIT_EXPORT_BATCH_SIZE)
+            for batch in batches:
+                lines = []
+                for row in batch:
+                    record = _record(row)
+                    lines.append(json.dumps(record, separators=(',', ':'), default=str))
+                    first = first or record
+                    last = record
+                rows += len(batch)
+                gz.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    # Verify: the file decompresses to every row still in the partition
+    with gzip.open(tmp, 'rt', encoding='utf-8') as f:
+        written = sum(1 for _ in f)
+    live = db.execute_query(
+        "SELECT COUNT(*) AS n FROM audit_logs PARTITION ({})".format(name), fetch=True)[0]['n']
+    if written != rows or int(live) != rows:
+        os.remove(tmp)
+        raise ArchiveError('{}: wrote {} of {} rows ({} live); partition kept'.format(
+            name, written, rows, live))
+    os.replace(tmp, path)
+
+    entry = {
+        'month':          month.strftime('%Y-%m'),
+        'partition':      name,
+        'file':           filename,
+        'rows':           rows,
+        'bytes':          os.path.getsize(path),
+        'sha256':         _sha256(path),
+        'first_log_id':   last['log_id'] if last else None,     # file is newest-first
+        'last_log_id':    first['log_id'] if first else None,
+        'from_created_at': last['created_at'] if last else None,
+        'to_created_at':  first['created_at'] if first else None,
+        'archived_at':    datetime.now().isoformat(timespec='seconds'),
+    }
+    manifest = load_manifest(archive_dir)
+    manifest['archives'] = [a for a in manifest['archives'] if a['month'] != entry['month']]
+    manifest['archives'].append(entry)
+    _save_manifest(manifest, archive_dir)
+
+    if drop:
+        db.execute_query("ALTER TABLE audit_logs DROP PARTITION {}".format(name))
+    return entry
+
+
+def archive_expired(hot_months=None, today=None, archive_dir=None, dry_run=False):
+    """Archive (oldest first) every monthly partition older than the hot window."""
+    hot_months = Config.AUDIT_HOT_MONTHS if hot_months is None else hot_months
+    cutoff = add_months(month_start(today or date.today()), -hot_months)
+    partitions = list_partitions()
+    if partitions is None:
+        raise ArchiveError('audit_logs is not partitioned; apply migration 010 first')
+    due = [p['name'] for p in partitions if p['month'] and p['month'] < cutoff]
+    if dry_run:
+        return due
+    return [archive_partition(name, archive_dir) for name in due]
+
+
+def purge_expired(retention_years=None, today=None, archive_dir=None, dry_run=False):
+    """
+    Delete archive files (and their audit_log_search rows) for months that
+    ended more than retention_years ago. Returns the purged manifest entries.
+    """
+    retention_years = Config.AUDIT_RETENTION_YEARS if retention_years is None else retention_years
+    archive_dir = archive_dir or _archive_dir()
+    cutoff = add_months(month_start(today or date.today()), -12 * retention_years)
+    manifest = load_manifest(archive_dir)
+    expired = [a for a in manifest['archives']
+               if add_months(date.fromisoformat(a['month'] + '-01'), 1) <= cutoff]
+    if dry_run or not expired:
+        return expired
+
+    boundary = _chain_end(expired, archive_dir)
+    if boundary and boundary['last_seq'] > manifest.get('purged', {}).get('last_seq', 0):
+        manifest['purged'] = dict(boundary, through_month=expired[-1]['month'])
+
+    while db.execute_query(
+            "DELETE FROM audit_log_search WHERE created_at < %s LIMIT 5000", (cutoff,)):
+        pass
+    manifest['archives'] = [a for a in manifest['archives'] if a not in expired]
+    _save_manifest(manifest, archive_dir)
+    for entry in expired:
+        path = os.path.join(archive_dir, entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+    return expired
+
+
+def _chain_end(entries, archive_dir):
+    """{'last_seq', 'last_hash'} of the newest chained row in the archives, or None."""
+    for entry in sorted(entries, key=lambda a: a['month'], reverse=True):
+        path = os.path.join(archive_dir, entry['file'])
+        if not os.path.exists(path):
+            continue
+        last = None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('chain_seq') and (last is None or
+                                                record['chain_seq'] > last['chain_seq']):
+                    last = record
+        if last is not None:
+            return {'last_seq': last['chain_seq'], 'last_hash': last['row_hash']}
+    return None
+
+
+# ── Reading the archive tier ─────────────────────────────────────────────────
+
+def archived_batches(since=None, before_id=None, batch_size=1000, archive_dir=None):
+    """
+    Yield archived rows newest-first, in lists of batch_size, as dicts shaped
+    like the export query (created_at as datetime). Only archives that can
+    hold rows at or after `since` are opened.
+    """
+    archive_dir = archive_dir or _archive_dir()
+    for entry in sorted(load_manifest(archive_dir)['archives'],
+                        key=lambda a: a['month'], reverse=True):
+        if since and entry['to_created_at'] and \
+                datetime.fromisoformat(entry['to_created_at']) < since:
+            break
+        if before_id and entry['first_log_id'] and entry['first_log_id'] >= before_id:
+            continue
+        batch = []
+        with gzip.open(os.path.join(archive_dir, entry['file']), 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                record['created_at'] = (datetime.fromisoformat(record['created_at'])
+                                        if record['created_at'] else None)
+                if since and record['created_at'] and record['created_at'] < since:
+                    break       # newest-first: the rest of this file is older
+                if before_id and record['log_id'] >= before_id:
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+def status(archive_dir=None):
+    """Partition layout and archive manifest summary for the maintenance command."""
+    manifest = load_manifest(archive_dir)
+    return {
+        'partitions': [dict(p, month=p['month'].strftime('%Y-%m') if p['month'] else None)
+                       for p in (list_partitions() or [])],
+        'archives':   manifest['archives'],
+        'archived_rows': sum(a['rows'] for a in manifest['archives']),
+    }
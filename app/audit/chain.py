@@ -0,0 +1,469 @@
+"""
+Tamper-evident audit chain - PaySecure Technologies GRC Platform
+PCI-DSS Req 10.3: audit records are protected from modification.
+- Each audit row carries chain_seq (gap-free) and row_hash =
+  SHA-256(previous row_hash || canonical record). The writer takes the chain
+  head row FOR UPDATE once per batch, hashes the batch in Python and advances
+  the head in the same transaction: no extra round trips per event
+- Every CHECKPOINT_SIZE rows form a block whose Merkle root (RFC 6962 style,
+  over the row hashes) and closing chain hash go to audit_checkpoints; a
+  time range is proven against those roots with O(log n) sibling hashes
+- verify_chain() re-hashes the whole log (live partitions and archive files)
+  in parallel, one segment per task, and checks every checkpoint root
+Run the bulk verifier from scripts/verify_audit_chain.py.
+"""
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app.db import db
+from app.procpool import process_context
+from config.settings import Config
+
+CHECKPOINT_SIZE = 4096          # leaves per Merkle block (a power of two)
+GENESIS_HASH = '0' * 64
+
+HEAD_FOR_UPDATE_SQL = "SELECT last_seq, last_hash FROM audit_chain_head WHERE chain_id = 1 FOR UPDATE"
+HEAD_SQL = "SELECT last_seq, last_hash FROM audit_chain_head WHERE chain_id = 1"
+ADVANCE_HEAD_SQL = "UPDATE audit_chain_head SET last_seq = %s, last_hash = %s WHERE chain_id = 1"
+
+BLOCK_HASHES_SQL = """
+    SELECT chain_seq, row_hash FROM audit_logs
+    WHERE chain_seq BETWEEN %s AND %s
+    ORDER BY chain_seq
+"""
+CHECKPOINT_COUNT_SQL = "SELECT COUNT(*) AS n FROM audit_checkpoints WHERE block_no < %s"
+CHECKPOINT_BLOCKS_SQL = "SELECT block_no FROM audit_checkpoints WHERE block_no < %s"
+CHECKPOINT_INSERT_SQL = """INSERT IGNORE INTO audit_checkpoints
+    (block_no, first_seq, last_seq, merkle_root, chain_hash)
+    VALUES (%s, %s, %s, %s, %s)"""
+
+SEGMENT_SQL = """
+    SELECT chain_seq, user_id, action, entity_type, entity_id,
+           COALESCE(CAST(details_json AS CHAR), details) AS details,
+           ip_address, created_at, row_hash
+    FROM audit_logs
+    WHERE chain_seq BETWEEN %s AND %s
+    ORDER BY chain_seq
+"""
+
+
+# ── Row hashing ──────────────────────────────────────────────────────────────
+
+def _canonical(seq, user_id, action, entity_type, entity_id, details, ip_address, created_at):
+    """
+    Byte form of a record that survives a round trip through MySQL: details
+    are compared as parsed JSON (the JSON column re-serialises them), ids as
+    ints and created_at as 'YYYY-MM-DD HH:MM:SS'.
+    """
+    if isinstance(details, str):
+        try:
+            details = json.loads(details)
+        except ValueError:
+            pass
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    return json.dumps(
+        [seq, None if user_id is None else int(user_id), action, entity_type,
+         None if entity_id is None else int(entity_id), details, ip_address, created_at],
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    ).encode('utf-8')
+
+
+def link_hash(prev_hash, canonical):
+    return hashlib.sha256(bytes.fromhex(prev_hash) + canonical).hexdigest()
+
+
+def chain_rows(prev_hash, first_seq, rows):
+    """
+    Hash writer rows (user_id, action, entity_type, entity_id, details, ip,
+    created_at) onto the chain. Returns [(seq, row_hash)] for the rows.
+    """
+    out = []
+    seq = first_seq
+    for row in rows:
+        prev_hash = link_hash(prev_hash, _canonical(seq, *row))
+        out.append((seq, prev_hash))
+        seq += 1
+    return out
+
+
+# ── Merkle trees over row hashes ─────────────────────────────────────────────
+
+def _leaf(row_hash):
+    return hashlib.sha256(b'\x00' + bytes.fromhex(row_hash)).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _split(n):
+    """Largest power of two below n (RFC 6962 tree shape)."""
+    k = 1
+    while k * 2 < n:
+        k *= 2
+    return k
+
+
+def _root(leaves):
+    if len(leaves) == 1:
+        return leaves[0]
+    k = _split(len(leaves))
+    return _node(_root(leaves[:k]), _root(leaves[k:]))
+
+
+def merkle_root(row_hashes):
+    return _root([_leaf(h) for h in row_hashes]).hex()
+
+
+def range_proof(row_hashes, lo, hi):
+    """
+    Sibling hashes proving leaves [lo, hi) of a block: the roots of the
+    subtrees entirely outside the range, in traversal order (O(log n)).
+    """
+    proof = []
+
+    def walk(leaves, start):
+        end = start + len(leaves)
+        if end <= lo or start >= hi:
+            proof.append(_root(leaves).hex())
+            return
+        if lo <= start and end <= hi:
+            return
+        k = _split(len(leaves))
+        walk(leaves[:k], start)
+        walk(leaves[k:], start + k)
+
+    walk([_leaf(h) for h in row_hashes], 0)
+    return proof
+
+
+def root_from_range(size, lo, range_hashes, proof):
+    """Recompute a block root from the row hashes of [lo, lo+len) and range_proof()'s siblings."""
+    hi = lo + len(range_hashes)
+    siblings = iter(proof)
+    leaves = [_leaf(h) for h in range_hashes]
+
+    def walk(start, n):
+        end = start + n
+        if end <= lo or start >= hi:
+            return bytes.fromhex(next(siblings))
+        if lo <= start and end <= hi:
+            return _root(leaves[start - lo:end - lo])
+        k = _split(n)
+        return _node(walk(start, k), walk(start + k, n - k))
+
+    return walk(0, size).hex()
+
+
+def block_of(seq):
+    """Checkpoint block number of a chain_seq (blocks hold seq b*S+1 .. (b+1)*S)."""
+    return (seq - 1) // CHECKPOINT_SIZE
+
+
+# ── Checkpoints ──────────────────────────────────────────────────────────────
+
+def write_checkpoints(head_seq):
+    """
+    Checkpoint every completed block up to head_seq that has none: the blocks
+    a batch just completed, and any a flush left behind by failing or dying
+    after its commit. One COUNT(*) when nothing is missing.
+    """
+    completed = head_seq // CHECKPOINT_SIZE
+    if not completed:
+        return 0
+    if db.execute_query(CHECKPOINT_COUNT_SQL, (completed,), fetch=True)[0]['n'] >= completed:
+        return 0
+    have = {r['block_no'] for r in db.execute_query(
+        CHECKPOINT_BLOCKS_SQL, (completed,), fetch=True)}
+    return sum(build_checkpoint(b) for b in range(completed) if b not in have)
+
+
+def build_checkpoint(block):
+    """Compute and store one block's Merkle root. Returns 1 if stored, 0 if incomplete."""
+    first, last = block * CHECKPOINT_SIZE + 1, (block + 1) * CHECKPOINT_SIZE
+    rows = db.execute_query(BLOCK_HASHES_SQL, (first, last), fetch=True, prepared=True)
+    if len(rows) != CHECKPOINT_SIZE:
+        return 0
+    hashes = [r['row_hash'] for r in rows]
+    db.execute_query(CHECKPOINT_INSERT_SQL,
+                     (block, first, last, merkle_root(hashes), hashes[-1]))
+    return 1
+
+
+def missing_checkpoints():
+    """Checkpoint any completed block below the chain head that has none."""
+    head = db.execute_query(HEAD_SQL, fetch=True)[0]
+    return write_checkpoints(int(head['last_seq']))
+
+
+# ── Range proofs ─────────────────────────────────────────────────────────────
+
+class ProofError(ValueError):
+    """A range proof cannot be built from the live table alone."""
+
+
+def _row_canonical(row):
+    """_canonical() for a SEGMENT_SQL row (or an archived record)."""
+    return _canonical(int(row['chain_seq']), row['user_id'], row['action'], row['entity_type'],
+                      row['entity_id'], row['details'], row['ip_address'], row['created_at'])
+
+
+def _relink(prev_hash, rows):
+    """Recompute row hashes from the stored content; returns (hashes, first bad seq or None)."""
+    hashes, bad = [], None
+    for row in rows:
+        prev_hash = link_hash(prev_hash, _row_canonical(row))
+        hashes.append(prev_hash)
+        if bad is None and prev_hash != row['row_hash']:
+            bad = int(row['chain_seq'])
+    return hashes, bad
+
+
+def prove_range(start, end):
+    """
+    Proof that the audit rows created in [start, end] are intact. Every row
+    in the range is re-hashed from its stored content, linked onto its
+    predecessor's hash (or the previous block's checkpoint chain_hash):
+    - rows in checkpointed blocks: the recomputed hashes, the sibling hashes
+      and the stored root, which the hashes must reproduce
+    - rows after the last checkpoint ("tail"): re-linked from the last
+      checkpoint up to the chain head, whose hash they must reproduce
+    'verified' is True only when every row of the range passed one of these.
+    Raises ProofError for a block that is partly archived.
+    """
+    bounds = db.execute_query(
+        "SELECT MIN(chain_seq) AS lo, MAX(chain_seq) AS hi FROM audit_logs "
+        "WHERE created_at BETWEEN %s AND %s AND chain_seq IS NOT NULL",
+        (start, end), fetch=True)[0]
+    if bounds['lo'] is None:
+        return {'first_seq': None, 'last_seq': None, 'blocks': [], 'tail': None,
+                'verified': False}
+    lo, hi = int(bounds['lo']), int(bounds['hi'])
+
+    blocks = []
+    checkpoints = {r['block_no']: r for r in db.execute_query(
+        "SELECT block_no, merkle_root, chain_hash FROM audit_checkpoints "
+        "WHERE block_no BETWEEN %s AND %s", (block_of(lo) - 1, block_of(hi)), fetch=True)}
+
+    def anchor(block):
+        """Chain hash just before the block's first row; None if unknown."""
+        if block == 0:
+            return GENESIS_HASH
+        previous = checkpoints.get(block - 1)
+        return previous['chain_hash'] if previous else None
+
+    tail = None
+    for block in range(block_of(lo), block_of(hi) + 1):
+        first = block * CHECKPOINT_SIZE + 1
+        if block not in checkpoints:
+            tail = _prove_tail(first, max(lo, first), anchor(block))
+            break
+        hashes = [r['row_hash'] for r in db.execute_query(
+            BLOCK_HASHES_SQL, (first, first + CHECKPOINT_SIZE - 1), fetch=True, prepared=True)]
+        if len(hashes) != CHECKPOINT_SIZE:
+            raise ProofError(
+                'Block {} has {} of {} rows in audit_logs (partly archived, or rows deleted); '
+                'run scripts/verify_audit_chain.py verify'.format(
+                    block, len(hashes), CHECKPOINT_SIZE))
+        r_lo, r_hi = max(lo, first) - first, min(hi, first + CHECKPOINT_SIZE - 1) - first + 1
+        rows = db.execute_query(SEGMENT_SQL, (first + r_lo, first + r_hi - 1), fetch=True)
+        prev_hash = hashes[r_lo - 1] if r_lo else anchor(block)
+        if prev_hash is None or len(rows) != r_hi - r_lo:
+            recomputed, bad = [], first + r_lo
+        else:
+            recomputed, bad = _relink(prev_hash, rows)
+        proof = range_proof(hashes, r_lo, r_hi)
+        stored = checkpoints[block]['merkle_root']
+        blocks.append({
+            'block':       block,
+            'first_seq':   first + r_lo,
+            'row_hashes':  hashes[r_lo:r_hi],
+            'siblings':    proof,
+            'merkle_root': stored,
+            'verified':    bad is None and
+                           root_from_range(CHECKPOINT_SIZE, r_lo, recomputed, proof) == stored,
+        })
+    verified = all(b['verified'] for b in blocks) and (tail is None or tail['verified'])
+    return {'first_seq': lo, 'last_seq': hi, 'blocks': blocks, 'tail': tail,
+            'verified': verified}
+
+
+def _prove_tail(block_first, from_seq, prev_hash):
+    """Re-link every row from block_first (after the last checkpoint) to the chain head."""
+    head = db.execute_query(HEAD_SQL, fetch=True)[0]
+    head_seq = int(head['last_seq'])
+    tail = {'from_seq': from_seq, 'head_seq': head_seq, 'head_hash': head['last_hash'],
+            'verified': False}
+    if prev_hash is None:
+        tail['error'] = 'no checkpoint before seq {}'.format(block_first)
+        return tail
+    rows = db.execute_query(SEGMENT_SQL, (block_first, head_seq), fetch=True)
+    if [int(r['chain_seq']) for r in rows] != list(range(block_first, head_seq + 1)):
+        tail['error'] = 'rows missing between seq {} and the head'.format(block_first)
+        return tail
+    recomputed, bad = _relink(prev_hash, rows)
+    if bad is not None:
+        tail['error'] = 'hash mismatch at seq {}'.format(bad)
+    elif (recomputed[-1] if recomputed else prev_hash) != head['last_hash']:
+        tail['error'] = 'chain does not end at the head hash'
+    else:
+        tail['verified'] = True
+    return tail
+
+
+# ── Bulk verification ────────────────────────────────────────────────────────
+
+def _connect():
+    import mysql.connector
+    return mysql.connector.connect(
+        host=Config.MYSQL_HOST, user=Config.MYSQL_USER, password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB, charset='utf8mb4', use_unicode=True, ssl_disabled=True)
+
+
+def _check_rows(rows, checkpoints):
+    """
+    Verify links between consecutive rows (each a dict with chain_seq,
+    row_hash and the record fields) and every block fully inside them.
+    Returns the segment summary; the first row's own link is left to the
+    caller, which knows its predecessor.
+    """
+    errors = []
+    prev = None
+    block_hashes = {}
+    for row in rows:
+        seq = int(row['chain_seq'])
+        canonical = _row_canonical(row)
+        if prev is not None:
+            if seq != prev[0] + 1:
+                errors.append({'seq': prev[0] + 1, 'error': 'missing rows {}..{}'.format(
+                    prev[0] + 1, seq - 1)})
+            elif link_hash(prev[1], canonical) != row['row_hash']:
+                errors.append({'seq': seq, 'error': 'hash mismatch'})
+        else:
+            first = (seq, canonical.decode('utf-8'), row['row_hash'])
+        prev = (seq, row['row_hash'])
+        block_hashes.setdefault(block_of(seq), []).append(row['row_hash'])
+
+    partial = {}
+    for block, hashes in block_hashes.items():
+        if len(hashes) == CHECKPOINT_SIZE:
+            if block in checkpoints and merkle_root(hashes) != checkpoints[block]:
+                errors.append({'seq': block * CHECKPOINT_SIZE + 1,
+                               'error': 'checkpoint {} root mismatch'.format(block)})
+        else:
+            partial[block] = hashes     # completed by a neighbouring segment
+    if prev is None:
+        return {'rows': 0, 'errors': errors, 'partial': partial}
+    return {'rows': len(rows), 'first': first, 'last': prev,
+            'errors': errors, 'partial': partial}
+
+
+def _verify_db_segment(lo, hi, checkpoints):
+    conn = _connect()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(SEGMENT_SQL, (lo, hi))
+        return _check_rows(cur.fetchall(), checkpoints)
+    finally:
+        conn.close()
+
+
+def _verify_archive_file(path, checkpoints):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        rows = [r for r in (json.loads(line) for line in f) if r.get('chain_seq')]
+    rows.sort(key=lambda r: r['chain_seq'])     # files are newest-first
+    for r in rows:
+        r['created_at'] = datetime.fromisoformat(r['created_at'])
+    return _check_rows(rows, checkpoints)
+
+
+def verify_chain(workers=None, segment_blocks=16, archive_dir=None, mp_context=None):
+    """
+    Re-hash the entire chain. Live rows are split into segments of
+    segment_blocks checkpoint blocks, archive files are one segment each;
+    all run in a process pool. The chain is stitched from the genesis hash,
+    or from the boundary purge_expired() recorded once archives past
+    retention were deleted. Returns a report dict ('ok', 'rows', 'errors').
+    mp_context defaults to the app's fork-server context; only a standalone
+    process (scripts/verify_audit_chain.py) should pass a 'fork' one.
+    """
+    from .archive import load_manifest
+
+    head = db.execute_query(HEAD_SQL, fetch=True)[0]
+    checkpoints = {r['block_no']: r['merkle_root'] for r in db.execute_query(
+        "SELECT block_no, merkle_root FROM audit_checkpoints", fetch=True)}
+    span = db.execute_query(
+        "SELECT MIN(chain_seq) AS lo, MAX(chain_seq) AS hi FROM audit_logs", fetch=True)[0]
+
+    archive_dir = archive_dir or Config.AUDIT_ARCHIVE_DIR
+    manifest = load_manifest(archive_dir)
+    errors = []
+    tasks = []
+    for entry in manifest['archives']:
+        path = os.path.join(archive_dir, entry['file'])
+        if not os.path.exists(path):
+            errors.append({'seq': None, 'error': 'archive {} missing'.format(entry['file'])})
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != entry['sha256']:
+            errors.append({'seq': None, 'error': 'archive {} checksum mismatch'.format(entry['file'])})
+        tasks.append((_verify_archive_file, path))
+    if span['lo'] is not None:
+        step = CHECKPOINT_SIZE * segment_blocks
+        start = block_of(int(span['lo'])) * CHECKPOINT_SIZE + 1
+        for lo in range(start, int(span['hi']) + 1, step):
+            tasks.append((_verify_db_segment, lo, lo + step - 1))
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=mp_context or process_context(__name__)) as pool:
+        futures = [pool.submit(fn, *args, checkpoints) for fn, *args in tasks]
+        segments = [f.result() for f in futures]
+
+    # Stitch segments: contiguity, first-row links, blocks split across segments
+    segments = sorted((s for s in segments if s['rows']), key=lambda s: s['first'][0])
+    rows = 0
+    purged = manifest.get('purged')
+    prev_seq, prev_hash = (purged['last_seq'], purged['last_hash']) if purged else (0, GENESIS_HASH)
+    partial = {}
+    for seg in segments:
+        rows += seg['rows']
+        errors.extend(seg['errors'])
+        seq, canonical, row_hash = seg['first']
+        if seq <= prev_seq:
+            errors.append({'seq': seq, 'error': 'rows present in more than one tier'})
+        elif seq != prev_seq + 1:
+            errors.append({'seq': prev_seq + 1, 'error': 'missing rows {}..{}'.format(
+                prev_seq + 1, seq - 1)})
+        elif link_hash(prev_hash, canonical.encode('utf-8')) != row_hash:
+            errors.append({'seq': seq, 'error': 'hash mismatch'})
+        prev_seq, prev_hash = seg['last']
+        for block, hashes in seg['partial'].items():
+            partial.setdefault(block, []).extend(hashes)
+    for block, hashes in partial.items():
+        if len(hashes) == CHECKPOINT_SIZE and block in checkpoints \
+                and merkle_root(hashes) != checkpoints[block]:
+            errors.append({'seq': block * CHECKPOINT_SIZE + 1,
+                           'error': 'checkpoint {} root mismatch'.format(block)})
+
+    if (prev_seq, prev_hash) != (head['last_seq'], head['last_hash']):
+        errors.append({'seq': prev_seq, 'error': 'chain ends at {} but head is at {}'.format(
+            prev_seq, head['last_seq'])})
+    errors.sort(key=lambda e: e['seq'] or 0)
+    return {
+        'ok':          not errors,
+        'rows':        rows,
+        'head_seq':    head['last_seq'],
+        'checkpoints': len(checkpoints),
+        'segments':    len(segments),
+        'purged_seq':  purged['last_seq'] if purged else 0,
+        'errors':      errors[:1000],
+    }
@@ -3,98 +3,147 @@ Audit Trail routes - PaySecure Technologies GRC Platform
 ISO 27001:2022 A.8.15 · PCI-DSS Req 10 · 7-year retention
 Python 3.8+ safe (no backslashes inside f-string expressions).
 """
+import base64
+import binascii
 import csv
 import io
+import itertools
 import json
+import re
 import traceback
+import zlib
+from datetime import datetime, timedelta
 
-from flask import (Blueprint, render_template, request,
+from flask import (Blueprint, render_template, request, jsonify,
                    Response, session, flash, redirect, url_for)
 
 from app.auth.utils import login_required, any_role_required
 from app.db import db
+from app.reference import get_active_users, get_audit_actions
+from config.settings import Config
 from . import audit_bp
+from . import chain
+from .archive import archived_batches
+from .writer import DETAILS_SQL, audit_writer
 
 
 def _write_log(action, entity_type, entity_id, details_dict):
-    """Persist an audit event."""
+    """Queue an audit event for the background writer."""
+    audit_writer.submit(
+        session.get('user_id'), action, entity_type, entity_id,
+        details_dict, request.remote_addr,
+    )
+
+
+# ── Keyset pagination ────────────────────────────────────────────────────────
+# Pages are ordered by (created_at, log_id) DESC and seek past the last row
+# of the previous page via idx_time_id, so page N costs the same as page 1.
+
+TRAIL_PAGE_SIZE = 500
+API_PAGE_SIZE   = 100
+API_MAX_PAGE    = 1000
+
+
+def _trail_filters(args):
+    """Translate query-string filters into (days, user_id, action, conditions, params)."""
+    days_str = args.get('date', '7')
+    user_id  = args.get('user_id', 'all')
+    action   = args.get('action', 'all')
+
     try:
-        db.execute_query(
-            """INSERT INTO audit_logs
-               (user_id, action, entity_type, entity_id, details, ip_address)
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (
-                session.get('user_id'), action, entity_type, entity_id,
-                json.dumps(details_dict), request.remote_addr,
-            ),
-        )
-    except Exception as exc:
-        print("Audit log write error: {}".format(exc))
+        days = int(days_str)
+    except (TypeError, ValueError):
+        days = 7
 
+    conditions = ["al.created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)"]
+    params: list = [days]
 
-# ── Audit Trail View ─────────────────────────────────────────────────────────
+    if user_id != 'all':
+        conditions.append("al.user_id = %s")
+        params.append(user_id)
 
-@audit_bp.route('/audit')
-@any_role_required('admin', 'auditor')
-def trail():
-    """Audit trail with user / action / date filters."""
+    if action != 'all':
+        conditions.append("al.action = %s")
+        params.append(action)
+
+    return days, user_id, action, conditions, params
+
+
+def _encode_cursor(log):
+    raw = '{}|{}'.format(log['created_at'].strftime('%Y-%m-%d %H:%M:%S'), log['log_id'])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    """Return (created_at, log_id) from an opaque cursor; ValueError if malformed."""
     try:
-        days_str = request.args.get('date', '7')
-        user_id  = request.args.get('user_id', 'all')
-        action   = request.args.get('action', 'all')
+        padded = token + '=' * (-len(token) % 4)
+        created_at, log_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), int(log_id)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
 
-        try:
-            days = int(days_str)
-        except (TypeError, ValueError):
-            days = 7
 
-        conditions = ["al.created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)"]
-        params: list = [days]
+def _fetch_trail_page(conditions, params, cursor=None, limit=TRAIL_PAGE_SIZE):
+    """One page of audit rows plus the cursor for the next page (None at the end)."""
+    conditions = list(conditions)
+    params = list(params)
+    if cursor:
+        created_at, log_id = _decode_cursor(cursor)
+        conditions.append(
+            "(al.created_at < %s OR (al.created_at = %s AND al.log_id < %s))")
+        params.extend([created_at, created_at, log_id])
 
-        if user_id != 'all':
-            conditions.append("al.user_id = %s")
-            params.append(user_id)
+    rows = db.execute_query(
+        """SELECT al.log_id, al.user_id, al.action, al.entity_type, al.entity_id,
+                  {details} AS details, al.ip_address, al.created_at,
+                  u.full_name, u.username, u.job_title
+           FROM audit_logs al
+           LEFT JOIN users u ON al.user_id = u.user_id
+           WHERE {where}
+           ORDER BY al.created_at DESC, al.log_id DESC
+           LIMIT %s""".format(details=DETAILS_SQL, where=" AND ".join(conditions)),
+        tuple(params) + (limit + 1,),
+        fetch=True,
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
-        if action != 'all':
-            conditions.append("al.action = %s")
-            params.append(action)
 
-        where = "WHERE " + " AND ".join(conditions)
+# ── Audit Trail View ─────────────────────────────────────────────────────────
 
-        logs = db.execute_query(
-            """SELECT al.log_id, al.action, al.entity_type, al.entity_id,
-                      al.details, al.ip_address, al.created_at,
-                      u.full_name, u.username, u.job_title
-               FROM audit_logs al
-               LEFT JOIN users u ON al.user_id = u.user_id
-               {where}
-               ORDER BY al.created_at DESC
-               LIMIT 500""".format(where=where),
-            tuple(params),
-            fetch=True,
-        )
+@audit_bp.route('/audit')
+@any_role_required('admin', 'auditor')
+def trail():
+    """Audit trail with user / action / date filters (first page; older pages via the API)."""
+    try:
+        days, user_id, action, conditions, params = _trail_filters(request.args)
+        where = "WHERE " + " AND ".join(conditions)
 
-        users = db.execute_query(
-            "SELECT DISTINCT user_id, full_name FROM users "
-            "WHERE is_active=TRUE ORDER BY full_name",
-            fetch=True,
-        )
+        logs, next_cursor = _fetch_trail_page(conditions, params)
 
-        actions = db.execute_query(
-            "SELECT DISTINCT action FROM audit_logs ORDER BY action",
-            fetch=True,
-        )
+        users = get_active_users()
+        actions = get_audit_actions()
 
-        stats_row = db.execute_query(
-            """SELECT COUNT(*)                 AS total_logs,
-                      COUNT(DISTINCT al.user_id) AS unique_users,
-                      COUNT(DISTINCT al.action)  AS unique_actions,
-                      MAX(al.created_at)         AS last_activity
-               FROM audit_logs al
-               {where}""".format(where=where),
-            tuple(params),
-            fetch=True,
-        )[0]
+        if next_cursor is None:
+            # The whole window fits on the first page - no second scan needed
+            stats_row = {
+                'total_logs':     len(logs),
+                'unique_users':   len({l['user_id'] for l in logs if l['user_id'] is not None}),
+                'unique_actions': len({l['action'] for l in logs}),
+                'last_activity':  logs[0]['created_at'] if logs else None,
+            }
+        else:
+            stats_row = db.execute_query(
+                """SELECT COUNT(*)                 AS total_logs,
+                          COUNT(DISTINCT al.user_id) AS unique_users,
+                          COUNT(DISTINCT al.action)  AS unique_actions,
+                          MAX(al.created_at)         AS last_activity
+                   FROM audit_logs al
+                   {where}""".format(where=where),
+                tuple(params),
+                fetch=True,
+            )[0]
 
         username = session.get('username', 'unknown')
         _write_log('AUDIT_TRAIL_VIEWED', 'audit_logs', None, {
@@ -111,6 +160,7 @@ def trail():
             actions=actions,
             stats=stats_row,
             filters={'date': str(days), 'user_id': user_id, 'action': action},
+            next_cursor=next_cursor,
         )
 
     except Exception:
@@ -124,15 +174,209 @@ def trail():
                 'unique_actions': 0, 'last_activity': None,
             },
             filters={},
+            next_cursor=None,
         )
 
 
+@audit_bp.route('/api/logs')
+@any_role_required('admin', 'auditor')
+def logs_api():
+    """
+    JSON page of audit events, newest first.
+    Accepts the trail filters (date, user_id, action) plus ?cursor= from the
+    previous page's next_cursor and ?limit= (max 1000).
+    """
+    _, _, _, conditions, params = _trail_filters(request.args)
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE))
+    try:
+        logs, next_cursor = _fetch_trail_page(
+            conditions, params, request.args.get('cursor'), limit)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+    return jsonify({
+        'logs': [
+            dict(log, created_at=log['created_at'].isoformat() if log['created_at'] else None)
+            for log in logs
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+# ── Structured detail queries ────────────────────────────────────────────────
+# details_json keys with an indexed generated column (scripts/migrations/009);
+# any other key can be matched with ?detail.<key>=value, unindexed.
+
+DETAIL_COLUMNS = {
+    'risk_code':       'al.d_risk_code',
+    'new_status':      'al.d_new_status',
+    'previous_status': 'al.d_previous_status',
+    'control':         'al.d_control',
+    'affected_user':   'al.d_affected_user',
+}
+DETAIL_KEY_RE   = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+MAX_DETAIL_KEYS = 3
+
+
+def _event_filters(args):
+    """Query-string filters for /api/events -> (conditions, params); ValueError if invalid."""
+    conditions, params = [], []
+    for name, column in DETAIL_COLUMNS.items():
+        if args.get(name):
+            conditions.append(column + " = %s")
+            params.append(args[name])
+    for name in ('action', 'entity_type'):
+        if args.get(name):
+            conditions.append("al.{} = %s".format(name))
+            params.append(args[name])
+    for name in ('user_id', 'entity_id'):
+        if args.get(name):
+            value = args.get(name, type=int)
+            if value is None:
+                raise ValueError('{} must be an integer'.format(name))
+            conditions.append("al.{} = %s".format(name))
+            params.append(value)
+    try:
+        if args.get('since'):
+            conditions.append("al.created_at >= %s")
+            params.append(datetime.strptime(args['since'], '%Y-%m-%d'))
+        if args.get('until'):
+            conditions.append("al.created_at < DATE_ADD(%s, INTERVAL 1 DAY)")
+            params.append(datetime.strptime(args['until'], '%Y-%m-%d'))
+    except ValueError:
+        raise ValueError('since/until must be dates in YYYY-MM-DD format')
+
+    extra = [k for k in args if k.startswith('detail.')]
+    if len(extra) > MAX_DETAIL_KEYS:
+        raise ValueError('At most {} detail.<key> filters'.format(MAX_DETAIL_KEYS))
+    for name in extra:
+        key = name[len('detail.'):]
+        if not DETAIL_KEY_RE.match(key):
+            raise ValueError('Invalid detail key {!r}'.format(key))
+        conditions.append("JSON_UNQUOTE(JSON_EXTRACT(al.details_json, %s)) = %s")
+        params.extend(['$.' + key, args[name]])
+
+    return conditions or ["TRUE"], params
+
+
+def _parse_details(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return {'text': text}
+
+
+@audit_bp.route('/api/events')
+@any_role_required('admin', 'auditor')
+def events_api():
+    """
+    Audit events filtered on structured details, newest first, e.g.
+    ?new_status=Closed&user_id=7 or ?risk_code=RISK-2024-003&since=2024-01-01.
+    Indexed keys: risk_code, new_status, previous_status, control,
+    affected_user; plus action, entity_type, entity_id, user_id, since/until,
+    up to three ?detail.<key>= matches, ?cursor= and ?limit= (max 1000).
+    """
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE))
+    try:
+        conditions, params = _event_filters(request.args)
+        events, next_cursor = _fetch_trail_page(
+            conditions, params, request.args.get('cursor'), limit)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+    return jsonify({
+        'events': [
+            dict(event,
+                 details=_parse_details(event['details']),
+                 created_at=event['created_at'].isoformat() if event['created_at'] else None)
+            for event in events
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@audit_bp.route('/api/integrity/proof')
+@any_role_required('admin', 'auditor')
+def integrity_proof():
+    """
+    Proof that the audit rows created between ?from= and ?to= (YYYY-MM-DD,
+    inclusive) are intact: every row is re-hashed from its content; per
+    checkpointed block, the rows' hashes, the O(log n) sibling hashes and the
+    checkpoint root; rows past the last checkpoint are re-linked to the chain
+    head. 409 when a block in the range is partly archived.
+    """
+    try:
+        start = datetime.strptime(request.args.get('from', ''), '%Y-%m-%d')
+        end = datetime.strptime(request.args.get('to', ''), '%Y-%m-%d')
+        end += timedelta(days=1, seconds=-1)
+    except ValueError:
+        return jsonify({'error': 'from/to must be dates in YYYY-MM-DD format'}), 400
+    try:
+        proof = chain.prove_range(start, end)
+    except chain.ProofError as exc:
+        return jsonify({'error': str(exc)}), 409
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    return jsonify(proof)
+
+
 # ── CSV Export ───────────────────────────────────────────────────────────────
 
+EXPORT_COLUMNS = [
+    'Log ID', 'Action', 'Entity Type', 'Entity ID',
+    'Details', 'IP Address', 'Timestamp',
+    'User Name', 'Username', 'Job Title',
+]
+
+
+def _csv_chunks(batches):
+    """Render row batches as CSV text, one chunk per batch."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        for log in rows:
+            writer.writerow([
+                log['log_id'], log['action'],
+                log['entity_type'], log['entity_id'],
+                log['details'], log['ip_address'],
+                log['created_at'].isoformat() if log['created_at'] else '',
+                log['full_name'], log['username'], log['job_title'],
+            ])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _gzip_chunks(chunks):
+    """Compress a stream of text chunks into a single gzip member on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 @audit_bp.route('/audit/export')
 @any_role_required('admin')
 def export():
-    """Export audit logs as CSV (admin only)."""
+    """
+    Stream audit logs as CSV (admin only).
+    Rows are emitted newest-first by log_id, live partitions first, then
+    months moved to the archive tier. A dropped download can be resumed
+    with ?before_id=<last Log ID received>; ?gzip=1 compresses the stream
+    on the fly.
+    """
     try:
         days_str = request.args.get('date', '30')
         try:
@@ -140,48 +384,84 @@ def export():
         except (TypeError, ValueError):
             days = 30
 
-        logs = db.execute_query(
+        before_id = request.args.get('before_id', type=int)
+        use_gzip  = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+
+        conditions = ["al.created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)"]
+        params: list = [days]
+        if before_id:
+            conditions.append("al.log_id < %s")
+            params.append(before_id)
+
+        batches = db.stream_query(
             """SELECT al.log_id, al.action, al.entity_type, al.entity_id,
-                      al.details, al.ip_address, al.created_at,
+                      {details} AS details, al.ip_address, al.created_at,
                       u.full_name, u.username, u.job_title
                FROM audit_logs al
                LEFT JOIN users u ON al.user_id = u.user_id
-               WHERE al.created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
-               ORDER BY al.created_at DESC""",
-            (days,),
-            fetch=True,
+               WHERE {where}
+               ORDER BY al.log_id DESC""".format(details=DETAILS_SQL,
+                                                  where=" AND ".join(conditions)),
+            tuple(params),
+            batch_size=Config.AUDIT_EXPORT_BATCH_SIZE,
         )
 
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            'Log ID', 'Action', 'Entity Type', 'Entity ID',
-            'Details', 'IP Address', 'Timestamp',
-            'User Name', 'Username', 'Job Title',
-        ])
-        for log in logs:
-            writer.writerow([
-                log['log_id'], log['action'],
-                log['entity_type'], log['entity_id'],
-                log['details'], log['ip_address'],
-                log['created_at'].isoformat() if log['created_at'] else '',
-                log['full_name'], log['username'], log['job_title'],
-            ])
+        # Archived months continue below the oldest live row (skipping any
+        # month whose partition is archived but not dropped yet)
+        hot_floor = db.execute_query(
+            "SELECT MIN(log_id) AS floor FROM audit_logs", fetch=True)[0]['floor']
+        bounds = [i for i in (before_id, hot_floor) if i]
+        batches = itertools.chain(batches, archived_batches(
+            since=datetime.now() - timedelta(days=days),
+            before_id=min(bounds) if bounds else None,
+            batch_size=Config.AUDIT_EXPORT_BATCH_SIZE,
+        ))
 
-        username = session.get('username', 'unknown')
-        _write_log('AUDIT_LOG_EXPORTED', 'audit_logs', None, {
-            'exported_by':   username,
-            'record_count':  len(logs),
-            'last_n_days':   days,
-        })
+        # Captured now: the stream is consumed after the view has returned
+        user_id   = session.get('user_id')
+        username  = session.get('username', 'unknown')
+        remote_ip = request.remote_addr
+
+        def generate():
+            stats = {'rows': 0, 'last_id': None}
+
+            def counted(source):
+                for rows in source:
+                    stats['rows'] += len(rows)
+                    stats['last_id'] = rows[-1]['log_id']
+                    yield rows
+
+            completed = False
+            try:
+                chunks = _csv_chunks(counted(batches))
+                if use_gzip:
+                    chunks = _gzip_chunks(chunks)
+                for chunk in chunks:
+                    yield chunk
+                completed = True
+            except Exception:
+                print(traceback.format_exc())
+            finally:
+                audit_writer.submit(user_id, 'AUDIT_LOG_EXPORTED', 'audit_logs', None, {
+                    'exported_by':  username,
+                    'record_count': stats['rows'],
+                    'last_n_days':  days,
+                    'before_id':    before_id,
+                    'last_log_id':  stats['last_id'],
+                    'gzip':         use_gzip,
+                    'completed':    completed,
+                }, remote_ip)
 
-        filename = 'paysecure_audit_log_{}d.csv'.format(days)
+        filename = 'paysecure_audit_log_{}d{}.csv'.format(
+            days, '_before_{}'.format(before_id) if before_id else '')
+        if use_gzip:
+            filename += '.gz'
         return Response(
-            output.getvalue(),
-            mimetype='text/csv',
+            generate(),
+            mimetype='application/gzip' if use_gzip else 'text/csv',
             headers={'Content-Disposition': 'attachment;filename=' + filename},
         )
 
     except Exception as exc:
         flash('Export error: {}'.format(exc), 'danger')
-        return redirect(url_for('audit.trail'))
\ No newline at end of file
+        return redirect(url_for('audit.trail'))
@@ -0,0 +1,502 @@
+"""
+Asynchronous audit-log writer - PaySecure Technologies GRC Platform
+Request handlers enqueue audit events; a background thread drains the queue
+and flushes them to audit_logs with multi-row INSERTs in one transaction.
+Every event is appended to a per-process spool before it is queued so that
+events accepted but not yet committed survive a process crash; spools left
+behind by dead workers are adopted and replayed on the next start. The spool
+is a series of segment files (<pid>.<n>.jsonl) rolled over at
+AUDIT_SPOOL_SEGMENT_BYTES: after each committed batch, segments holding only
+committed events are deleted, so it stays bounded under sustained load.
+Events written synchronously because the queue stayed full are spooled too,
+and retried by the flusher if that write fails.
+Each batch is hash-chained onto the tamper-evident audit chain (app/audit/chain)
+inside the same transaction as its INSERT.
+"""
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config.settings import Config
+from app.db import db
+from app.reference import invalidate_audit_actions
+from .chain import (ADVANCE_HEAD_SQL, HEAD_FOR_UPDATE_SQL, chain_rows,
+                    write_checkpoints)
+
+INSERT_SQL = """INSERT INTO audit_logs
+   (user_id, action, entity_type, entity_id, details_json, ip_address, created_at,
+    chain_seq, row_hash)
+   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+# Details as JSON text for readers of audit_logs (alias al): new rows keep them
+# in details_json, rows not yet converted by scripts/backfill_audit_details.py
+# still have the legacy details TEXT
+DETAILS_SQL = "COALESCE(CAST(al.details_json AS CHAR), al.details)"
+
+ACTION_LOOKUP_SQL = "INSERT IGNORE INTO audit_actions (action) VALUES (%s)"
+
+# Copy committed events into the full-text side table (app/search).
+# A consistent read does not wait for other transactions: a row whose
+# auto-increment log_id is below one already visible may still be
+# uncommitted. The feed therefore only reads up to an upper bound that was
+# the newest log_id at least AUDIT_SEARCH_FEED_LAG seconds ago; every row at
+# or below it has committed by then. INSERT IGNORE absorbs workers indexing
+# the same rows.
+SEARCH_FEED_SQL = """INSERT IGNORE INTO audit_log_search
+   (log_id, action, entity_type, entity_id, created_at, body)
+   SELECT log_id, action, entity_type, entity_id, created_at,
+          CONCAT_WS(' ', action, entity_type, COALESCE(CAST(details_json AS CHAR), details))
+   FROM audit_logs
+   WHERE log_id > %s AND log_id <= %s"""
+SEARCH_WATERMARK_SQL = (
+    "SELECT COALESCE(MAX(log_id), 0) AS last_id FROM audit_log_search WHERE log_id <= %s")
+LATEST_LOG_ID_SQL = "SELECT COALESCE(MAX(log_id), 0) AS last_id FROM audit_logs"
+SEARCH_FEED_BATCH = 5000
+
+EVENT_FIELDS = ('user_id', 'action', 'entity_type', 'entity_id',
+                'details', 'ip_address', 'created_at')
+
+
+class AuditWriter:
+    """Bounded queue + background flusher + crash spool for audit events."""
+
+    def __init__(self, spool_dir, max_queue=10000, batch_size=200,
+                 flush_interval=1.0, enqueue_timeout=0.05, fsync=False, search_lag=30.0,
+                 segment_bytes=1 << 20):
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.fsync = fsync
+        self.search_lag = search_lag
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()       # guards spool appends / truncation
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._spool = None                  # open segment file
+        self._segment = 0                   # its number
+        self._segments = deque()            # (path, last seq) of full segments, oldest first
+        self._seq = 0                       # last sequence number given to a spooled event
+        self._spool_seq = 0                 # last seq written to the open segment
+        self._queued_seqs = deque()         # seqs of queued / pending events, ascending
+        self._fallback = {}                 # seq -> event being written on a caller's thread
+        self._retry = {}                    # seq -> fallback event whose write failed
+        self._thread = None
+        self._pid = None
+        self._pending = []                  # (seq, event) taken off the queue, not yet committed
+        self._listeners = []                # in-process subscribers, called on submit
+        self._known_actions = set()         # already present in the audit_actions lookup
+        self._search_watermark = None       # log_id up to which audit_log_search is complete
+        self._search_bounds = deque()       # (monotonic time seen, newest log_id) not yet safe
+
+        self.stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'fallback_writes': 0,
+            'fallback_retries': 0,
+            'recovered': 0,
+            'search_indexed': 0,
+            'chain_seq': None,
+            'checkpoints': 0,
+        }
+
+    # ── Lifecycle ────────────────────────────────────────────────────────────
+
+    def start(self):
+        """Start the flusher thread (idempotent, re-armed after fork)."""
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+
+            self._segments = deque()
+            self._seq = self._spool_seq = 0
+            self._queued_seqs, self._fallback, self._retry = deque(), {}, {}
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._pending = self._recover_spools()
+
+            self._thread = threading.Thread(
+                target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def shutdown(self, timeout=5.0):
+        """Flush everything still queued, then stop the flusher thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if self._spool:
+            self._spool.close()
+            self._spool = None
+
+    def add_listener(self, callback):
+        """Register callback(event) to observe every submitted event in-process."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def queue_depth(self):
+        """Events accepted but not yet committed."""
+        return self._queue.qsize() + len(self._pending)
+
+    # ── Producer side ────────────────────────────────────────────────────────
+
+    def submit(self, user_id, action, entity_type=None, entity_id=None,
+               details=None, ip_address=None):
+        """
+        Queue an audit event for asynchronous persistence.
+        Falls back to a synchronous INSERT when the queue stays full for
+        longer than AUDIT_ENQUEUE_TIMEOUT. Either way the event is spooled
+        first; a failed synchronous write is retried by the flusher, so
+        events are never dropped.
+        """
+        if details is not None and not isinstance(details, str):
+            details = json.dumps(details)
+        event = {
+            'user_id':     user_id,
+            'action':      action,
+            'entity_type': entity_type,
+            'entity_id':   entity_id,
+            'details':     details,
+            'ip_address':  ip_address,
+            'created_at':  datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as exc:
+                print("Audit listener error: {}".format(exc))
+
+        try:
+            self.start()
+            deadline = time.monotonic() + self.enqueue_timeout
+            while True:
+                with self._lock:
+                    try:
+                        self._queue.put_nowait((self._seq + 1, event))
+                    except queue.Full:
+                        pass
+                    else:
+                        self._seq += 1
+                        self._queued_seqs.append(self._seq)
+                        self._append_spool(self._seq, event)
+                        self.stats['enqueued'] += 1
+                        return
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.005)
+        except Exception as exc:
+            print("Audit queue error: {}".format(exc))
+
+        # Backpressure exhausted – write on the caller's thread instead
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._fallback[seq] = event
+            self.stats['fallback_writes'] += 1
+            try:
+                self._append_spool(seq, event)
+            except Exception as exc:
+                print("Audit spool error: {}".format(exc))
+        try:
+            self._write_batch([event])
+        except Exception as exc:
+            print("Audit log write error (kept for retry): {}".format(exc))
+            with self._lock:
+                self._retry[seq] = self._fallback.pop(seq)
+            return
+        with self._lock:
+            del self._fallback[seq]
+        self._register_actions([event])
+        self._release_spool()
+
+    # ── Consumer side ────────────────────────────────────────────────────────
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            flushed = self._flush_pending() if self._pending else True
+            if flushed and self._retry:
+                self._flush_retries()
+            if not self._pending and self._search_bounds:
+                self._feed_search()     # rows that were too recent at the last flush
+
+            # Anything still unflushed at shutdown stays in the spool for recovery
+            if self._stopping.is_set() and (self._queue.empty() or not flushed):
+                break
+
+    def _flush_pending(self):
+        """Commit pending events in batch_size chunks; True when all were written."""
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            try:
+                self._write_batch([event for _, event in batch])
+            except Exception as exc:
+                self.stats['failed_batches'] += 1
+                print("Audit batch flush error: {}".format(exc))
+                if not self._stopping.is_set():
+                    time.sleep(min(self.flush_interval * 5, 10))
+                return False
+            del self._pending[:len(batch)]
+            self.stats['flushed'] += len(batch)
+            self.stats['batches'] += 1
+            self._register_actions([event for _, event in batch])
+            self._release_spool(batch[-1][0])
+        self._feed_search()
+        return True
+
+    def _flush_retries(self):
+        """Commit fallback events whose write on the caller's thread failed."""
+        with self._lock:
+            retry = sorted(self._retry.items())
+        for offset in range(0, len(retry), self.batch_size):
+            batch = retry[offset:offset + self.batch_size]
+            try:
+                self._write_batch([event for _, event in batch])
+            except Exception as exc:
+                self.stats['failed_batches'] += 1
+                print("Audit fallback retry error: {}".format(exc))
+                return
+            with self._lock:
+                for seq, _ in batch:
+                    del self._retry[seq]
+            self.stats['fallback_retries'] += len(batch)
+            self._register_actions([event for _, event in batch])
+            self._release_spool()
+
+    def _write_batch(self, batch):
+        """
+        INSERT a batch as the next links of the audit chain. The head row lock
+        serialises writers across processes; it costs one SELECT ... FOR UPDATE
+        and one UPDATE per batch, the hashes are computed here.
+        """
+        rows = [self._row(e) for e in batch]
+        with db.transaction():
+            head = db.execute_query(HEAD_FOR_UPDATE_SQL, fetch=True)[0]
+            last_seq = int(head['last_seq'])
+            links = chain_rows(head['last_hash'], last_seq + 1, rows)
+            db.execute_many(INSERT_SQL, [row + link for row, link in zip(rows, links)])
+            db.execute_query(ADVANCE_HEAD_SQL, links[-1])
+        self.stats['chain_seq'] = links[-1][0]
+        try:
+            # Blocks completed by this batch, plus any an earlier flush (in any
+            # process) committed but failed to checkpoint
+            self.stats['checkpoints'] += write_checkpoints(links[-1][0])
+        except Exception as exc:
+            print("Audit checkpoint error: {}".format(exc))
+
+    def _feed_search(self):
+        """
+        Index committed audit rows (including fallback writes) for /search,
+        up to the newest log_id seen at least search_lag seconds ago.
+        """
+        try:
+            now = time.monotonic()
+            latest = db.execute_query(LATEST_LOG_ID_SQL, fetch=True)[0]['last_id']
+            known = self._search_bounds[-1][1] if self._search_bounds else self._search_watermark
+            if known is None or latest > known:
+                self._search_bounds.append((now, latest))
+            upper = None
+            while self._search_bounds and self._search_bounds[0][0] <= now - self.search_lag:
+                upper = self._search_bounds.popleft()[1]
+            if upper is None:
+                return
+            if self._search_watermark is None:
+                self._search_watermark = db.execute_query(
+                    SEARCH_WATERMARK_SQL, (upper,), fetch=True)[0]['last_id']
+            while self._search_watermark < upper:
+                # log_id windows rather than LIMIT: rows another worker already
+                # indexed are ignored, so the insert count cannot show the end
+                end = min(self._search_watermark + SEARCH_FEED_BATCH, upper)
+                # execute_many for the affected-row count (execute_query returns lastrowid)
+                added = db.execute_many(SEARCH_FEED_SQL, [(self._search_watermark, end)])
+                self.stats['search_indexed'] += added or 0
+                self._search_watermark = end
+        except Exception as exc:
+            # Not fatal: the next flush resumes from the same watermark
+            print("Audit search index error: {}".format(exc))
+
+    def _register_actions(self, batch):
+        """Keep the audit_actions lookup (filter dropdown) in step with new action names."""
+        new_actions = {e['action'] for e in batch} - self._known_actions
+        if not new_actions:
+            return
+        self._known_actions |= new_actions
+        try:
+            if db.execute_many(ACTION_LOOKUP_SQL, [(a,) for a in sorted(new_actions)]):
+                invalidate_audit_actions()
+        except Exception as exc:
+            print("Audit action lookup error: {}".format(exc))
+
+    # ── Spool file ───────────────────────────────────────────────────────────
+
+    def _append_spool(self, seq, event):
+        """Append under self._lock; seq must increase, as the queue order does."""
+        if not self._spool:
+            return
+        self._spool.write(json.dumps(event) + '\n')
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+        self._spool_seq = seq
+        if self._spool.tell() >= self.segment_bytes:
+            # Durable before it is closed: recovery re-spools through here
+            os.fsync(self._spool.fileno())
+            self._spool.close()
+            self._segments.append((self._spool_path(self._pid, self._segment), seq))
+            self._segment += 1
+            self._spool = open(self._spool_path(self._pid, self._segment), 'a', encoding='utf-8')
+
+    def _release_spool(self, committed_seq=None):
+        """
+        Drop the spooled events that are all committed: queued events up to
+        committed_seq (committed in order), less anything below a fallback
+        event still being written or awaiting retry.
+        """
+        with self._lock:
+            while self._queued_seqs and committed_seq is not None \
+                    and self._queued_seqs[0] <= committed_seq:
+                self._queued_seqs.popleft()
+            outstanding = list(self._fallback) + list(self._retry)
+            if self._queued_seqs:
+                outstanding.append(self._queued_seqs[0])
+            settled = min(outstanding) - 1 if outstanding else self._seq
+            while self._segments and self._segments[0][1] <= settled:
+                path, _ = self._segments.popleft()
+                try:
+                    os.remove(path)
+                except OSError as exc:
+                    print("Audit spool cleanup error: {}".format(exc))
+            if self._spool and self._spool_seq <= settled:
+                self._spool.truncate(0)
+
+    def _spool_path(self, pid, segment):
+        return os.path.join(self.spool_dir, '{}.{}.jsonl'.format(pid, segment))
+
+    def _recover_spools(self):
+        """
+        Open this process's first segment and adopt the events left behind by
+        processes that died before flushing (or by an earlier start() of this
+        one). A dead process's file is first claimed by renaming it to
+        <own pid>.claim-<name>.jsonl, so when several workers start together
+        exactly one of them replays it. Adopted events are re-spooled under
+        new sequence numbers and fsynced before the old files are removed, so
+        a second crash cannot lose them. Returns them as (seq, event), oldest
+        first.
+        """
+        found, paths, segment = [], [], 0
+        # <pid>.<n>.jsonl; claimed files and <pid>.jsonl from before
+        # segmenting sort as n = -1
+        for pid, n, path in sorted(_spool_files(self.spool_dir)):
+            if pid == self._pid:
+                segment = max(segment, n + 1)
+            elif _pid_alive(pid):
+                continue
+            else:
+                claimed = os.path.join(self.spool_dir, '{}.claim-{}.jsonl'.format(
+                    self._pid, os.path.basename(path)[:-len('.jsonl')].replace('.', '-')))
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue        # another worker claimed it first
+                path = claimed
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        found.append(json.loads(line))
+                    except ValueError:
+                        continue    # torn final line from the crash
+            paths.append(path)
+
+        with self._lock:
+            self._segment = segment
+            self._spool = open(self._spool_path(self._pid, segment), 'a', encoding='utf-8')
+            events = []
+            for event in found:
+                self._seq += 1
+                self._queued_seqs.append(self._seq)
+                self._append_spool(self._seq, event)
+                events.append((self._seq, event))
+            if events:
+                os.fsync(self._spool.fileno())
+        for path in paths:
+            os.remove(path)
+        self.stats['recovered'] += len(events)
+        return events
+
+    @staticmethod
+    def _row(event):
+        return tuple(_json_details(event.get(field)) if field == 'details' else event.get(field)
+                     for field in EVENT_FIELDS)
+
+
+def _json_details(details):
+    """Details as valid JSON text for the JSON column; free text is wrapped as {"text": ...}."""
+    if details is None:
+        return None
+    try:
+        json.loads(details)
+    except ValueError:
+        return json.dumps({'text': details})
+    return details
+
+
+def _spool_files(spool_dir):
+    """(pid, segment number or -1, path) for each spool file in spool_dir."""
+    for path in glob.glob(os.path.join(spool_dir, '*.jsonl')):
+        parts = os.path.basename(path)[:-len('.jsonl')].split('.')
+        try:
+            pid = int(parts[0])
+        except ValueError:
+            continue
+        yield pid, int(parts[1]) if len(parts) == 2 and parts[1].isdigit() else -1, path
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+audit_writer = AuditWriter(
+    spool_dir=Config.AUDIT_SPOOL_DIR,
+    max_queue=Config.AUDIT_QUEUE_SIZE,
+    batch_size=Config.AUDIT_BATCH_SIZE,
+    flush_interval=Config.AUDIT_FLUSH_INTERVAL,
+    enqueue_timeout=Config.AUDIT_ENQUEUE_TIMEOUT,
+    fsync=Config.AUDIT_SPOOL_FSYNC,
+    search_lag=Config.AUDIT_SEARCH_FEED_LAG,
+    segment_bytes=Config.AUDIT_SPOOL_SEGMENT_BYTES,
+)
+
+# Flush-on-shutdown hook
+atexit.register(audit_writer.shutdown)
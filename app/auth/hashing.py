@@ -0,0 +1,181 @@
+"""
+Password hashing off the request thread
+bcrypt at cost 12 is ~250 ms of CPU per call; running it inline lets a burst
+of logins starve every other route. HashingPool runs it in a small process
+pool instead:
+- At most AUTH_HASH_MAX_PENDING checks are queued or running; further logins
+  are rejected immediately with HashingBusy instead of piling up
+- verify() can also re-hash a correct password whose cost differs from
+  AUTH_BCRYPT_ROUNDS, so stored hashes migrate as users log in
+- stats/latency feed the /dashboard/metrics endpoint
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from app.procpool import process_context
+from config.settings import Config
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated (or timed out); the caller should ask the user to retry."""
+
+
+def hash_rounds(password_hash):
+    """Cost factor encoded in a $2a$/$2b$/$2y$ hash, or None if unparseable."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+# Worker-side functions: module level so they pickle by reference
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, password_hash, rehash_rounds=None):
+    """Return (matches, new_hash); new_hash is set only when a rehash was requested."""
+    try:
+        ok = bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False, None      # malformed stored hash
+    if ok and rehash_rounds:
+        return True, _hash(password, rehash_rounds)
+    return ok, None
+
+
+class HashingPool:
+    """Bounded bcrypt executor; workers=0 runs hashes inline (still bounded)."""
+
+    def __init__(self, workers=2, max_pending=16, timeout=5.0, rounds=12):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._latencies = deque(maxlen=512)     # seconds, most recent calls
+        self.stats = {'verified': 0, 'hashed': 0, 'rehashed': 0,
+                      'rejected': 0, 'timeouts': 0, 'in_flight': 0}
+
+    # ── Public API ───────────────────────────────────────────────────────────
+
+    def verify(self, password, password_hash, upgrade=False):
+        """
+        Check password against password_hash. Returns (matches, new_hash):
+        with upgrade=True and a hash whose cost differs from self.rounds,
+        new_hash is a fresh hash at self.rounds for the caller to persist.
+        Raises HashingBusy when saturated.
+        """
+        rehash_rounds = None
+        if upgrade and hash_rounds(password_hash) != self.rounds:
+            rehash_rounds = self.rounds
+        ok, new_hash = self._run(_verify, password, password_hash, rehash_rounds)
+        self._count('verified')
+        if new_hash:
+            self._count('rehashed')
+        return ok, new_hash
+
+    def hash(self, password, rounds=None):
+        """bcrypt hash of password at the configured (or given) cost."""
+        result = self._run(_hash, password, rounds or self.rounds)
+        self._count('hashed')
+        return result
+
+    def latency_stats(self):
+        samples = sorted(self._latencies)
+        if not samples:
+            return {'samples': 0}
+        return {
+            'samples': len(samples),
+            'p50_ms':  round(samples[len(samples) // 2] * 1000, 1),
+            'p95_ms':  round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+            'max_ms':  round(samples[-1] * 1000, 1),
+        }
+
+    def snapshot_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats, workers=self.workers, max_pending=self.max_pending,
+                    rounds=self.rounds, latency=self.latency_stats())
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ── Internals ────────────────────────────────────────────────────────────
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingBusy('password hashing pool saturated')
+        self._count('in_flight')
+        started = time.monotonic()
+
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._done(started)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._done(started)
+            with self._lock:
+                self._executor = None
+            raise
+        # The slot is held until the worker actually finishes, even if we give up waiting
+        future.add_done_callback(lambda _f: self._done(started))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._count('timeouts')
+            raise HashingBusy('password hashing timed out')
+        except BrokenProcessPool:
+            # A worker died (OOM kill etc.): start a fresh pool on the next call
+            with self._lock:
+                self._executor = None
+            raise
+
+    def _count(self, key, delta=1):
+        # Request threads and executor callback threads both update stats
+        with self._lock:
+            self.stats[key] += delta
+
+    def _done(self, started):
+        self._latencies.append(time.monotonic() - started)
+        self._count('in_flight', -1)
+        self._slots.release()
+
+    def _get_executor(self):
+        with self._lock:
+            # Executors don't survive fork (gunicorn --preload): build one per process
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=process_context(__name__),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+
+hashing_pool = HashingPool(
+    workers=Config.AUTH_HASH_WORKERS,
+    max_pending=Config.AUTH_HASH_MAX_PENDING,
+    timeout=Config.AUTH_HASH_TIMEOUT,
+    rounds=Config.AUTH_BCRYPT_ROUNDS,
+)
+atexit.register(hashing_pool.shutdown)
@@ -2,7 +2,10 @@
 Authentication routes: login, logout, access control
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from app.auth.utils import login_user, logout_user, get_user_roles, verify_password
+from app.auth.hashing import HashingBusy
+from app.auth.throttle import STORED_STATE_COLUMNS, login_throttle
+from app.auth.utils import login_user, logout_user, get_user_roles, verify_login_password
+from app.audit.writer import audit_writer
 from app.db import db
 
 from . import auth_bp
@@ -23,54 +26,77 @@ def login():
             flash('Username and password are required.', 'danger')
             return render_template('auth/login.html'), 400
         
+        # Throttle before any DB or bcrypt work
+        blocked = login_throttle.check(username, request.remote_addr)
+        if blocked:
+            return _blocked_response(*blocked)
+        
         try:
             # Retrieve user with password hash
             users = db.execute_query(
-                "SELECT user_id, username, password_hash, is_active FROM users WHERE username = %s",
+                "SELECT user_id, username, password_hash, is_active, roles_epoch, "
+                + STORED_STATE_COLUMNS + " FROM users WHERE username = %s",
                 (username,),
-                fetch=True
+                fetch=True,
+                prepared=True
             )
             
             if not users:
+                # Unknown names build a failure streak too, so lockouts don't reveal which exist
+                login_throttle.record_failure(username, known=False)
                 flash('Invalid username or password.', 'danger')
                 return render_template('auth/login.html'), 401
             
             user = users[0]
             
+            # Lock persisted by another worker or set by an administrator
+            blocked = login_throttle.check_stored(user)
+            if blocked:
+                return _blocked_response(*blocked)
+            
             # Check if user is active
             if not user['is_active']:
                 flash('Account is deactivated. Contact administrator.', 'danger')
                 return render_template('auth/login.html'), 403
             
-            # Verify password
-            if not verify_password(password, user['password_hash']):
+            # Verify password (bcrypt runs in the bounded hashing pool)
+            if not verify_login_password(user['user_id'], password, user['password_hash']):
+                if login_throttle.record_failure(username):
+                    audit_writer.submit(
+                        None,
+                        'USER_ACCOUNT_LOCKED',
+                        'users',
+                        user['user_id'],
+                        {
+                            'event': 'account_locked_max_attempts',
+                            'affected_user': username,
+                            'failed_attempts': login_throttle.lockout_threshold,
+                            'locked_duration_minutes': login_throttle.lockout_seconds // 60,
+                        },
+                        request.remote_addr,
+                    )
                 flash('Invalid username or password.', 'danger')
                 return render_template('auth/login.html'), 401
             
+            login_throttle.record_success(username)
+            
             # Get user roles
-            user_roles = get_user_roles(user['user_id'])
+            user_roles = get_user_roles(user['user_id'], user['roles_epoch'])
             
             if not user_roles:
                 flash('User has no assigned roles. Contact administrator.', 'danger')
                 return render_template('auth/login.html'), 403
             
             # Create session
-            login_user(user['user_id'], user['username'], user_roles)
+            login_user(user['user_id'], user['username'], user_roles, user['roles_epoch'])
             
-            # Log audit event
-            try:
-                db.execute_query(
-                    """INSERT INTO audit_logs (user_id, action, details, ip_address)
-                       VALUES (%s, %s, %s, %s)""",
-                    (
-                        user['user_id'],
-                        'USER_LOGIN',
-                        '{"event": "successful_login"}',
-                        request.remote_addr,
-                    )
-                )
-            except Exception as e:
-                print(f"Audit log failed: {e}")
+            # Log audit event (persisted asynchronously)
+            audit_writer.submit(
+                user['user_id'],
+                'USER_LOGIN',
+                details='{"event": "successful_login"}',
+                ip_address=request.remote_addr,
+            )
             
             flash(f'Welcome back, {user["username"]}!', 'success')
             
@@ -86,6 +112,9 @@ def login():
             else:
                 return redirect(url_for('dashboard.view'))
                 
+        except HashingBusy:
+            flash('The login service is busy. Please try again in a few seconds.', 'warning')
+            return render_template('auth/login.html'), 503, {'Retry-After': '5'}
         except Exception as e:
             flash('An error occurred during login. Please try again.', 'danger')
             print(f"Login error: {e}")
@@ -93,6 +122,19 @@ def login():
     
     return render_template('auth/login.html')
 
+def _blocked_response(reason, retry_after):
+    """Login rejected by the throttle: 403 for a locked account, 429 otherwise"""
+    headers = {'Retry-After': str(max(1, int(retry_after)))} if retry_after else {}
+    if reason == 'locked':
+        if retry_after:
+            flash(f'Account locked after repeated failed logins. '
+                  f'Try again in {max(1, int(retry_after) // 60)} minute(s).', 'danger')
+        else:
+            flash('Account locked. Contact administrator.', 'danger')
+        return render_template('auth/login.html'), 403, headers
+    flash('Too many login attempts. Please wait and try again.', 'warning')
+    return render_template('auth/login.html'), 429, headers
+
 @auth_bp.route('/logout')
 def logout():
     """Logout handler"""
@@ -100,19 +142,12 @@ def logout():
     
     # Log audit event before clearing session
     if user_id:
-        try:
-            db.execute_query(
-                """INSERT INTO audit_logs (user_id, action, details, ip_address)
-                   VALUES (%s, %s, %s, %s)""",
-                (
-                    user_id,
-                    'USER_LOGOUT',
-                    '{"event": "user_logout"}',
-                    request.remote_addr,
-                )
-            )
-        except Exception as e:
-            print(f"Audit log failed: {e}")
+        audit_writer.submit(
+            user_id,
+            'USER_LOGOUT',
+            details='{"event": "user_logout"}',
+            ip_address=request.remote_addr,
+        )
     
     logout_user()
     flash('You have been logged out successfully.', 'info')
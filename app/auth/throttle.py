@@ -0,0 +1,266 @@
+"""
+Login throttling and account lockout - PaySecure Technologies GRC Platform
+Rejects brute-force attempts in memory, before the user lookup and before any
+bcrypt work, so a credential-stuffing wave cannot turn auth.login into a CPU
+amplifier.
+- Sliding-window attempt limits per username and per client IP
+- Lockout after LOGIN_LOCKOUT_THRESHOLD consecutive failures (PCI-DSS 8.3.4),
+  for LOGIN_LOCKOUT_SECONDS
+- Failure counts and lock state are written to users.failed_login_count /
+  account_locked / locked_until every LOGIN_THROTTLE_PERSIST_INTERVAL seconds,
+  so locks survive restarts and are honoured by every worker once persisted;
+  lock expiry is computed and compared by MySQL (NOW()), never against the
+  app server's clock or timezone
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from app.db import db
+from config.settings import Config
+
+ADD_FAILURES_SQL = (
+    "UPDATE users SET failed_login_count = COALESCE(failed_login_count, 0) + %s "
+    "WHERE username = %s"
+)
+SET_UNLOCKED_SQL = (
+    "UPDATE users SET failed_login_count = %s, account_locked = FALSE, locked_until = NULL "
+    "WHERE username = %s"
+)
+SET_LOCKED_SQL = (
+    "UPDATE users SET failed_login_count = %s, account_locked = TRUE, "
+    "locked_until = NOW() + INTERVAL %s SECOND "
+    "WHERE username = %s"
+)
+# Columns check_stored() needs; lock_seconds is the lock time left by the DB clock
+STORED_STATE_COLUMNS = (
+    "failed_login_count, account_locked, "
+    "TIMESTAMPDIFF(SECOND, NOW(), locked_until) AS lock_seconds"
+)
+
+
+class LoginThrottle:
+    """In-memory login limiter with periodic persistence of per-user lock state."""
+
+    def __init__(self, user_limit=10, user_window=300, ip_limit=30, ip_window=300,
+                 lockout_threshold=5, lockout_seconds=1800, persist_interval=10,
+                 max_keys=100000):
+        self.user_limit = user_limit
+        self.user_window = user_window
+        self.ip_limit = ip_limit
+        self.ip_window = ip_window
+        self.lockout_threshold = lockout_threshold
+        self.lockout_seconds = lockout_seconds
+        self.persist_interval = persist_interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._user_attempts = {}     # username -> deque of attempt times
+        self._ip_attempts = {}       # ip -> deque of attempt times
+        self._failures = {}          # username -> consecutive failures
+        self._locked_until = {}      # username -> unlock time (time.time())
+        self._pending = {}           # username -> {'reset', 'count', 'locked_until'} to persist
+                                     # (locked_until is a time.time() value)
+        self._pid = None
+        self._thread = None
+        self.stats = {'allowed': 0, 'throttled': 0, 'locked_out': 0,
+                      'lockouts': 0, 'persisted': 0}
+
+    # ── Login-path API ───────────────────────────────────────────────────────
+
+    def check(self, username, ip):
+        """
+        Admit one login attempt. Returns None when allowed (the attempt is
+        counted against both windows), else (reason, retry_after_seconds)
+        with reason 'locked' or 'throttled'.
+        """
+        self._ensure_started()
+        now = time.time()
+        with self._lock:
+            until = self._locked_until.get(username)
+            if until is not None:
+                if until > now:
+                    self.stats['locked_out'] += 1
+                    return 'locked', until - now
+                del self._locked_until[username]
+
+            user_q = self._window(self._user_attempts, username, now - self.user_window)
+            ip_q = self._window(self._ip_attempts, ip, now - self.ip_window)
+            if len(ip_q) >= self.ip_limit:
+                self.stats['throttled'] += 1
+                return 'throttled', ip_q[0] + self.ip_window - now
+            if len(user_q) >= self.user_limit:
+                self.stats['throttled'] += 1
+                return 'throttled', user_q[0] + self.user_window - now
+
+            user_q.append(now)
+            ip_q.append(now)
+            self.stats['allowed'] += 1
+            return None
+
+    def check_stored(self, user):
+        """
+        Apply lock state persisted on the users row (another worker's lockout,
+        or an administrative lock with no locked_until). `user` carries
+        STORED_STATE_COLUMNS. Returns None or ('locked', retry_after_seconds_or_None).
+        A lock whose time has passed is cleared on the row at the next flush.
+        """
+        username = user['username']
+        if user.get('account_locked'):
+            remaining = user.get('lock_seconds')
+            if remaining is None:
+                self.stats['locked_out'] += 1
+                return 'locked', None
+            if remaining > 0:
+                with self._lock:
+                    self._locked_until[username] = time.time() + remaining
+                self.stats['locked_out'] += 1
+                return 'locked', remaining
+            with self._lock:
+                # Expired: nothing else would reset account_locked on the row
+                self._pending.setdefault(username, {'reset': True, 'count': 0,
+                                                    'locked_until': None})['reset'] = True
+            return None
+        # Failures recorded by other workers count towards this worker's lockout
+        stored = user.get('failed_login_count') or 0
+        with self._lock:
+            if stored > self._failures.get(username, 0):
+                self._failures[username] = stored
+        return None
+
+    def record_failure(self, username, known=True):
+        """Count a failed password; returns True if this failure locked the account."""
+        with self._lock:
+            count = self._failures.get(username, 0) + 1
+            pending = self._pending.setdefault(username, {'reset': False, 'count': 0,
+                                                          'locked_until': None}) if known else None
+            if count < self.lockout_threshold:
+                self._failures[username] = count
+                if pending is not None:
+                    pending['count'] += 1
+                return False
+
+            until = time.time() + self.lockout_seconds
+            self._locked_until[username] = until
+            self._failures.pop(username, None)
+            if pending is not None:
+                pending.update(reset=True, count=0, locked_until=until)
+            self.stats['lockouts'] += 1
+            return True
+
+    def record_success(self, username):
+        """Clear the failure streak after a successful login."""
+        with self._lock:
+            had_failures = self._failures.pop(username, 0)
+            self._locked_until.pop(username, None)
+            if had_failures or username in self._pending:
+                self._pending[username] = {'reset': True, 'count': 0, 'locked_until': None}
+
+    def unlock(self, username):
+        """Administrative unlock (memory and, on next flush, the users row)."""
+        self.record_success(username)
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self.stats,
+                        tracked_users=len(self._user_attempts),
+                        tracked_ips=len(self._ip_attempts),
+                        locked_users=len(self._locked_until),
+                        pending_writes=len(self._pending))
+
+    # ── Persistence / housekeeping ───────────────────────────────────────────
+
+    def flush(self):
+        """Write pending per-user counters and lock state to the users table."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        adds, unlocked, locked = [], [], []
+        now = time.time()
+        for username, p in pending.items():
+            if p['locked_until'] is not None:
+                # Seconds still to run: the DB derives locked_until from its own clock
+                locked.append((p['count'], max(round(p['locked_until'] - now), 1), username))
+            elif p['reset']:
+                unlocked.append((p['count'], username))
+            elif p['count']:
+                adds.append((p['count'], username))
+        try:
+            with db.transaction():
+                for sql, rows in ((ADD_FAILURES_SQL, adds), (SET_UNLOCKED_SQL, unlocked),
+                                  (SET_LOCKED_SQL, locked)):
+                    if rows:
+                        db.execute_many(sql, rows)
+        except Exception:
+            # Put the updates back (newer in-memory changes win) and retry next tick
+            with self._lock:
+                for username, p in pending.items():
+                    self._pending.setdefault(username, p)
+            raise
+        self.stats['persisted'] += len(pending)
+        return len(pending)
+
+    def sweep(self):
+        """Drop windows, streaks and locks that can no longer affect a decision."""
+        now = time.time()
+        with self._lock:
+            for attempts, window in ((self._user_attempts, self.user_window),
+                                     (self._ip_attempts, self.ip_window)):
+                for key in [k for k, q in attempts.items() if not q or q[-1] < now - window]:
+                    del attempts[key]
+            for key in [k for k, t in self._locked_until.items() if t <= now]:
+                del self._locked_until[key]
+            # Streaks are only kept while the username is still being tried
+            for key in [k for k in self._failures if k not in self._user_attempts]:
+                del self._failures[key]
+
+    def _window(self, table, key, cutoff):
+        q = table.get(key)
+        if q is None:
+            if len(table) >= self.max_keys:
+                # Oldest-inserted keys go first; bounded memory beats perfect recall
+                for stale in list(table)[:max(1, self.max_keys // 10)]:
+                    del table[stale]
+            q = table[key] = deque()
+        while q and q[0] < cutoff:
+            q.popleft()
+        return q
+
+    def _ensure_started(self):
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(
+                        target=self._run, name='login-throttle', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.persist_interval)
+            try:
+                self.sweep()
+                self.flush()
+            except Exception as exc:
+                print("Login throttle persist error: {}".format(exc))
+
+    def shutdown(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            print("Login throttle persist error: {}".format(exc))
+
+
+login_throttle = LoginThrottle(
+    user_limit=Config.LOGIN_USER_MAX_ATTEMPTS,
+    user_window=Config.LOGIN_USER_WINDOW,
+    ip_limit=Config.LOGIN_IP_MAX_ATTEMPTS,
+    ip_window=Config.LOGIN_IP_WINDOW,
+    lockout_threshold=Config.LOGIN_LOCKOUT_THRESHOLD,
+    lockout_seconds=Config.LOGIN_LOCKOUT_SECONDS,
+    persist_interval=Config.LOGIN_THROTTLE_PERSIST_INTERVAL,
+)
+atexit.register(login_throttle.shutdown)
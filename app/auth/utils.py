@@ -1,27 +1,51 @@
 """
 Authentication utilities: password hashing, session management, RBAC checks
 """
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, g, current_app
 from functools import wraps
+from app.auth.hashing import hashing_pool
+from app.cache import cache
 from app.db import db
-from flask_bcrypt import Bcrypt
+from config.settings import Config
 
-bcrypt = Bcrypt()
+# Authorization cache keys. users.roles_epoch is bumped by triggers whenever a
+# user's roles or active flag change (migration 003), so role lists are cached
+# per (user, epoch) and never need explicit invalidation.
+AUTH_STATE_KEY = 'auth:user:{}'
+AUTH_ROLES_KEY = 'auth:roles:{}:{}'
 
 def hash_password(password):
-    """Hash password using bcrypt (cost factor 12)"""
-    return bcrypt.generate_password_hash(password).decode('utf-8')
+    """Hash password using bcrypt (cost AUTH_BCRYPT_ROUNDS) in the hashing pool"""
+    return hashing_pool.hash(password)
 
 def verify_password(password, password_hash):
-    """Verify password against hash"""
-    return bcrypt.check_password_hash(password_hash, password)
+    """Verify password against hash (raises HashingBusy when the pool is saturated)"""
+    return hashing_pool.verify(password, password_hash)[0]
 
-def login_user(user_id, username, roles):
+def verify_login_password(user_id, password, password_hash):
+    """
+    Verify a login password; on success, transparently migrate the stored hash
+    to AUTH_BCRYPT_ROUNDS if it was created at a different cost.
+    """
+    ok, new_hash = hashing_pool.verify(password, password_hash, upgrade=True)
+    if ok and new_hash:
+        try:
+            # Guard on the old hash so a concurrent password change is not overwritten
+            db.execute_query(
+                "UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s",
+                (new_hash, user_id, password_hash)
+            )
+        except Exception as e:
+            print(f"Warning: Failed to upgrade password hash: {e}")
+    return ok
+
+def login_user(user_id, username, roles, roles_epoch=0):
     """Create authenticated session"""
     session.clear()  # Clear any existing session data
     session['user_id'] = user_id
     session['username'] = username
     session['roles'] = roles  # List of role names
+    session['roles_epoch'] = roles_epoch  # users.roles_epoch the roles were read at
     session['logged_in'] = True
     session.permanent = True  # Use app.config['PERMANENT_SESSION_LIFETIME']
     
@@ -29,7 +53,8 @@ def login_user(user_id, username, roles):
     try:
         db.execute_query(
             "UPDATE users SET last_login = NOW() WHERE user_id = %s",
-            (user_id,)
+            (user_id,),
+            prepared=True
         )
     except Exception as e:
         print(f"Warning: Failed to update last_login: {e}")
@@ -38,19 +63,34 @@ def logout_user():
     """Destroy session"""
     session.clear()
 
+def get_auth_state(user_id):
+    """
+    Cached identity + authorization version for a user:
+    {user_id, username, full_name, email, is_active, roles_epoch}, or None.
+    Cached for AUTH_CACHE_TTL seconds, which bounds how long another worker
+    can keep honouring revoked roles when the cache is per-process.
+    """
+    return cache.get_or_load(AUTH_STATE_KEY.format(user_id), lambda: (db.execute_query(
+        "SELECT user_id, username, full_name, email, is_active, roles_epoch "
+        "FROM users WHERE user_id = %s",
+        (user_id,),
+        fetch=True,
+        prepared=True
+    ) or [None])[0], ttl=Config.AUTH_CACHE_TTL)
+
+def invalidate_user_auth(user_id):
+    """Drop the cached auth state (call after changing a user's roles or status)."""
+    cache.invalidate(AUTH_STATE_KEY.format(user_id))
+
 def get_current_user():
     """Get current authenticated user data"""
     if not session.get('logged_in'):
         return None
     
     try:
-        user = db.execute_query(
-            "SELECT user_id, username, full_name, email FROM users WHERE user_id = %s AND is_active = TRUE",
-            (session['user_id'],),
-            fetch=True
-        )
-        if user:
-            return user[0]
+        state = get_auth_state(session['user_id'])
+        if state and state['is_active']:
+            return {k: state[k] for k in ('user_id', 'username', 'full_name', 'email')}
         else:
             logout_user()  # User not found or inactive
             return None
@@ -58,15 +98,52 @@ def get_current_user():
         print(f"Error retrieving current user: {e}")
         return None
 
-def get_user_roles(user_id):
-    """Get all role names for a user"""
-    roles = db.execute_query("""
-        SELECT r.role_name
-        FROM user_roles ur
-        INNER JOIN roles r ON ur.role_id = r.role_id
-        WHERE ur.user_id = %s
-    """, (user_id,), fetch=True)
-    return [role['role_name'] for role in roles]
+def get_user_roles(user_id, roles_epoch=None):
+    """Get all role names for a user (cached per roles_epoch when given)"""
+    def load():
+        roles = db.execute_query("""
+            SELECT r.role_name
+            FROM user_roles ur
+            INNER JOIN roles r ON ur.role_id = r.role_id
+            WHERE ur.user_id = %s
+        """, (user_id,), fetch=True, prepared=True)
+        return [role['role_name'] for role in roles]
+
+    if roles_epoch is None:
+        return load()
+    return list(cache.get_or_load(AUTH_ROLES_KEY.format(user_id, roles_epoch), load, ttl=3600))
+
+def refresh_session_roles():
+    """
+    Validate the session's role list against the user's current roles_epoch.
+    Costs one cached lookup per request; roles are re-read only when the epoch
+    moved. Returns False (and clears the session) if the user is gone or
+    deactivated.
+    """
+    if not session.get('logged_in'):
+        return False
+    if g.get('_roles_checked'):
+        return True
+    
+    try:
+        state = get_auth_state(session['user_id'])
+    except Exception as e:
+        # Database unavailable: keep the session copy rather than lock everyone out
+        print(f"Warning: Failed to validate session roles: {e}")
+        return True
+    
+    if not state or not state['is_active']:
+        # Deactivated/deleted: end this user's sessions everywhere, not just this one
+        from app.sessions import revoke_user_sessions
+        revoke_user_sessions(current_app, session['user_id'])
+        logout_user()
+        return False
+    
+    if session.get('roles_epoch') != state['roles_epoch']:
+        session['roles'] = get_user_roles(state['user_id'], state['roles_epoch'])
+        session['roles_epoch'] = state['roles_epoch']
+    g._roles_checked = True
+    return True
 
 def has_role(required_role):
     """Check if current user has required role"""
@@ -90,7 +167,7 @@ def login_required(f):
     """Decorator: Require authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('logged_in'):
+        if not refresh_session_roles():
             flash('Please log in to access this page.', 'warning')
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
@@ -104,7 +181,7 @@ def role_required(role_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not session.get('logged_in'):
+            if not refresh_session_roles():
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('auth.login'))
             
@@ -132,7 +209,7 @@ def any_role_required(*role_names):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not session.get('logged_in'):
+            if not refresh_session_roles():
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('auth.login'))
             
@@ -0,0 +1,227 @@
+"""
+Shared cache layer with per-key TTL, LRU size bound and explicit invalidation
+Backends:
+- MemoryBackend: in-process (default); per worker, bounded by CACHE_MAX_ENTRIES
+- RedisBackend:  any Redis-protocol server named by CACHE_URL, shared by all
+                 workers (requires the optional `redis` package); values are
+                 JSON via Flask's tagged serializer, never pickled
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.tag import JSONTag, TaggedJSONSerializer
+
+from config.settings import Config
+
+_MISSING = object()
+
+
+# ── Encoding (shared backends) ───────────────────────────────────────────────
+# Cached values are query rows and payloads built from them: dicts, lists,
+# tuples, bytes, DECIMAL columns, DATE and DATETIME columns. The stock tags
+# cover the containers; these keep the column types exact.
+
+class TagDecimal(JSONTag):
+    __slots__ = ()
+    key = ' dec'
+
+    def check(self, value):
+        return isinstance(value, Decimal)
+
+    def to_json(self, value):
+        return str(value)
+
+    def to_python(self, value):
+        return Decimal(value)
+
+
+class TagIsoDatetime(JSONTag):
+    """ISO 8601 rather than the stock HTTP date, which drops microseconds"""
+    __slots__ = ()
+    key = ' dt'
+
+    def check(self, value):
+        return isinstance(value, datetime)
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return datetime.fromisoformat(value)
+
+
+class TagDate(JSONTag):
+    __slots__ = ()
+    key = ' da'
+
+    def check(self, value):
+        return isinstance(value, date) and not isinstance(value, datetime)
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return date.fromisoformat(value)
+
+
+_serializer = TaggedJSONSerializer()
+for _tag in (TagDecimal, TagIsoDatetime, TagDate):
+    _serializer.register(_tag, index=0)
+
+
+def encode(value):
+    return _serializer.dumps(value).encode('utf-8')
+
+
+def decode(raw):
+    return _serializer.loads(raw.decode('utf-8'))
+
+
+class MemoryBackend:
+    """Thread-safe LRU dict whose entries also expire after their TTL"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value); right end = most recent
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis-protocol backend; values are tagged JSON, TTL enforced server-side"""
+
+    def __init__(self, url, namespace='grc:'):
+        import redis    # optional dependency, only needed when CACHE_URL is set
+        self._client = redis.Redis.from_url(url)
+        self._ns = namespace
+
+    def get(self, key):
+        raw = self._client.get(self._ns + key)
+        return _MISSING if raw is None else decode(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(self._ns + key, encode(value), px=max(1, int(ttl * 1000)))
+        return 0    # eviction is governed by the server's maxmemory-policy
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self._ns + k for k in keys])
+
+    def delete_prefix(self, prefix):
+        batch = list(self._client.scan_iter(match=self._ns + prefix + '*', count=500))
+        if batch:
+            self._client.delete(*batch)
+
+    def size(self):
+        return None
+
+
+class Cache:
+    """Read-through cache facade with hit/miss accounting"""
+
+    def __init__(self, backend, default_ttl=300):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                      'invalidations': 0, 'errors': 0}
+
+    def get_or_load(self, key, loader, ttl=None):
+        """
+        Return the cached value for key, calling loader() to fill it on a miss.
+        Cached values are shared between callers and must be treated as read-only.
+        """
+        try:
+            value = self.backend.get(key)
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print("Cache read error: {}".format(exc))
+            return loader()
+
+        if value is not _MISSING:
+            self.stats['hits'] += 1
+            return value
+
+        self.stats['misses'] += 1
+        value = loader()
+        try:
+            self.stats['evictions'] += self.backend.set(key, value, ttl or self.default_ttl)
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print("Cache write error: {}".format(exc))
+        return value
+
+    def invalidate(self, *keys):
+        """Drop the given keys (call after writing the rows they were built from)."""
+        self.stats['invalidations'] += 1
+        try:
+            self.backend.delete(*keys)
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print("Cache invalidation error: {}".format(exc))
+
+    def invalidate_prefix(self, prefix):
+        """Drop every key starting with prefix."""
+        self.stats['invalidations'] += 1
+        try:
+            self.backend.delete_prefix(prefix)
+        except Exception as exc:
+            self.stats['errors'] += 1
+            print("Cache invalidation error: {}".format(exc))
+
+    def snapshot_stats(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            backend=type(self.backend).__name__,
+            entries=self.backend.size(),
+            hit_ratio=round(self.stats['hits'] / lookups, 4) if lookups else None,
+        )
+
+
+def _make_backend():
+    if Config.CACHE_URL:
+        try:
+            return RedisBackend(Config.CACHE_URL)
+        except ImportError:
+            print("Warning: CACHE_URL set but the redis package is not installed; "
+                  "using the in-process cache")
+    return MemoryBackend(max_entries=Config.CACHE_MAX_ENTRIES)
+
+
+cache = Cache(_make_backend(), default_ttl=Config.CACHE_DEFAULT_TTL)
@@ -0,0 +1,342 @@
+"""
+Risk-control graph index - PaySecure Technologies GRC Platform
+The bipartite graph of risks and active controls (risk_compliance_mapping)
+held in memory, so coverage and gap questions are answered without joins:
+- Nodes are dense indexes; per-node attributes live in typed arrays and each
+  node's neighbours in a compact array('I') adjacency list
+- Per risk, the number of mapped Implemented controls is maintained, so a
+  risk is "covered" (>= 1 Implemented control), "mapped" (controls, none
+  Implemented) or "unmapped"; coverage tallies and per-level gap sets are
+  updated on every change
+- Per control, the summed score of the open risks it maps to (centrality)
+- Mapping, control-status and risk write paths call the on_* hooks; a
+  background reconcile reloads the graph every CONTROL_GRAPH_RECONCILE_INTERVAL
+  seconds, which bounds drift between worker processes
+Only open risks (not Accepted / Closed) count towards coverage, gaps and
+centrality. scripts/control_graph_report.py prints the same reports.
+"""
+import heapq
+from array import array
+
+from app.db import db
+from app.reconcile import ReconcilingIndex
+from config.settings import Config
+
+LEVELS = ('Low', 'Medium', 'High')
+CLOSED_STATUSES = ('Accepted', 'Closed')
+UNMAPPED, MAPPED, COVERED = 0, 1, 2
+STATE_NAMES = ('unmapped', 'mapped_not_implemented', 'covered')
+
+RISKS_SQL = "SELECT risk_id, risk_code, risk_title, risk_score, risk_level, status FROM risks"
+CONTROLS_SQL = """
+    SELECT control_id, control_code, control_name, regulation, implementation_status
+    FROM compliance_controls
+    WHERE is_active = TRUE
+"""
+MAPPINGS_SQL = "SELECT risk_id, control_id FROM risk_compliance_mapping"
+
+# Per-risk-node sequences, indexed by node
+RISK_FIELDS = ('_risk_ids', '_risk_codes', '_risk_titles', '_risk_score', '_risk_level',
+               '_risk_open', '_risk_cover', '_risk_adj')
+
+
+class ControlGraph(ReconcilingIndex):
+    """In-memory risk/control bipartite graph with incrementally kept coverage."""
+
+    thread_name = 'control-graph-reconcile'
+    label = 'Control graph'
+
+    def __init__(self, reconcile_interval=300):
+        super().__init__(reconcile_interval)
+        self.stats = {'reconciles': 0, 'deltas': 0, 'risks': 0, 'controls': 0, 'edges': 0}
+        self._reset()
+
+    def _reset(self):
+        # Risk nodes
+        self._risk_index = {}               # risk_id -> node
+        self._risk_ids = array('I')
+        self._risk_codes = []
+        self._risk_titles = []
+        self._risk_score = array('H')
+        self._risk_level = array('B')       # index into LEVELS
+        self._risk_open = array('B')
+        self._risk_cover = array('H')       # mapped Implemented controls
+        self._risk_adj = []                 # node -> array('I') of control nodes
+        # Control nodes
+        self._control_index = {}            # control_id -> node
+        self._control_ids = array('I')
+        self._control_codes = []
+        self._control_names = []
+        self._control_regulation = []
+        self._control_impl = array('B')
+        self._control_weight = array('Q')   # summed score of mapped open risks
+        self._control_adj = []              # node -> array('I') of risk nodes
+        # Tallies over open risks
+        self._coverage = [[0, 0, 0] for _ in LEVELS]    # level -> state -> risks
+        self._gaps = [set() for _ in LEVELS]            # level -> risk nodes not covered
+
+    # ── Queries ──────────────────────────────────────────────────────────────
+
+    def coverage(self):
+        """Open risks per level by state (unmapped / mapped_not_implemented / covered)."""
+        self._ensure_started()
+        with self._lock:
+            levels = {}
+            for li, level in enumerate(LEVELS):
+                counts = self._coverage[li]
+                total = sum(counts)
+                levels[level] = dict(zip(STATE_NAMES, counts), total=total,
+                                     covered_pct=round(counts[COVERED] * 100.0 / total, 1)
+                                     if total else 0)
+            return {
+                'levels':   levels,
+                'risks':    sum(l['total'] for l in levels.values()),
+                'controls': len(self._control_ids),
+                'edges':    self.stats['edges'],
+            }
+
+    def gaps(self, level='High', limit=50):
+        """Open risks at `level` without an Implemented control, highest score first."""
+        self._ensure_started()
+        with self._lock:
+            nodes = heapq.nlargest(limit, self._gaps[LEVELS.index(level)],
+                                   key=lambda r: (self._risk_score[r], self._risk_ids[r]))
+            out = []
+            for r in nodes:
+                controls = sorted(self._risk_adj[r], key=self._control_codes.__getitem__)
+                out.append(dict(self._risk(r), controls=[self._control(c) for c in controls]))
+            return out
+
+    def centrality(self, limit=20, regulation=None):
+        """Controls ranked by the total score of the open risks they cover."""
+        self._ensure_started()
+        with self._lock:
+            nodes = range(len(self._control_ids))
+            if regulation:
+                nodes = [c for c in nodes if self._control_regulation[c] == regulation]
+            top = heapq.nlargest(limit, nodes, key=lambda c: (self._control_weight[c],
+                                                               len(self._control_adj[c])))
+            return [dict(self._control(c),
+                         risk_score=self._control_weight[c],
+                         risks=sum(self._risk_open[r] for r in self._control_adj[c]))
+                    for c in top]
+
+    def blast_radius(self, control_id):
+        """
+        What breaks if a control fails: its open risks split into those left
+        without any Implemented control ("exposed") and those still covered by
+        another control ("degraded"). None for an unknown control.
+        """
+        self._ensure_started()
+        with self._lock:
+            c = self._control_index.get(control_id)
+            if c is None:
+                return None
+            exposed, degraded = [], []
+            for r in self._control_adj[c]:
+                if not self._risk_open[r]:
+                    continue
+                remaining = self._risk_cover[r] - self._control_impl[c]
+                (degraded if remaining > 0 else exposed).append(dict(self._risk(r),
+                                                                     other_implemented=remaining))
+            exposed.sort(key=lambda r: (-r['score'], r['risk_id']))
+            degraded.sort(key=lambda r: (-r['score'], r['risk_id']))
+            return dict(self._control(c),
+                        exposed=exposed, degraded=degraded,
+                        exposed_score=sum(r['score'] for r in exposed),
+                        newly_exposed_high=sum(r['level'] == 'High' for r in exposed))
+
+    def _risk(self, r):
+        return {'risk_id': self._risk_ids[r], 'risk_code': self._risk_codes[r],
+                'risk_title': self._risk_titles[r], 'score': self._risk_score[r],
+                'level': LEVELS[self._risk_level[r]],
+                'state': STATE_NAMES[self._state(r)]}
+
+    def _control(self, c):
+        return {'control_id': self._control_ids[c], 'control_code': self._control_codes[c],
+                'control_name': self._control_names[c],
+                'regulation': self._control_regulation[c],
+                'implemented': bool(self._control_impl[c])}
+
+    # ── Incremental maintenance ──────────────────────────────────────────────
+
+    def _state(self, r):
+        if self._risk_cover[r]:
+            return COVERED
+        return MAPPED if self._risk_adj[r] else UNMAPPED
+
+    def _detach(self, r):
+        """Remove risk node r's contribution to the tallies (before changing it)."""
+        if not self._risk_open[r]:
+            return
+        self._coverage[self._risk_level[r]][self._state(r)] -= 1
+        self._gaps[self._risk_level[r]].discard(r)
+        for c in self._risk_adj[r]:
+            self._control_weight[c] -= self._risk_score[r]
+
+    def _attach(self, r):
+        if not self._risk_open[r]:
+            return
+        state = self._state(r)
+        self._coverage[self._risk_level[r]][state] += 1
+        if state != COVERED:
+            self._gaps[self._risk_level[r]].add(r)
+        for c in self._risk_adj[r]:
+            self._control_weight[c] += self._risk_score[r]
+
+    def _add_risk(self, row):
+        r = len(self._risk_ids)
+        self._risk_index[row['risk_id']] = r
+        self._risk_ids.append(row['risk_id'])
+        self._risk_codes.append(row['risk_code'])
+        self._risk_titles.append(row['risk_title'])
+        self._risk_score.append(int(row['risk_score']))
+        self._risk_level.append(LEVELS.index(row['risk_level']))
+        self._risk_open.append(int(row['status'] not in CLOSED_STATUSES))
+        self._risk_cover.append(0)
+        self._risk_adj.append(array('I'))
+        return r
+
+    def _add_edge(self, r, c):
+        self._risk_adj[r].append(c)
+        self._control_adj[c].append(r)
+        self._risk_cover[r] += self._control_impl[c]
+        self.stats['edges'] += 1
+
+    def _remove_edge(self, r, c):
+        self._risk_adj[r].remove(c)
+        self._control_adj[c].remove(r)
+        self._risk_cover[r] -= self._control_impl[c]
+        self.stats['edges'] -= 1
+
+    def _nodes(self, risk_id, control_id):
+        """(risk node, control node), or None after scheduling a reload for unknown ids."""
+        if not self._loaded:
+            return None
+        r, c = self._risk_index.get(risk_id), self._control_index.get(control_id)
+        if r is None or c is None:
+            self._loaded = False        # a node we have not seen: rebuild on next read
+            return None
+        return r, c
+
+    def on_mapping_added(self, risk_id, control_id):
+        with self._lock:
+            nodes = self._nodes(risk_id, control_id)
+            if nodes is None or nodes[1] in self._risk_adj[nodes[0]]:
+                return
+            r, c = nodes
+            self._detach(r)
+            self._add_edge(r, c)
+            self._attach(r)
+            self.stats['deltas'] += 1
+
+    def on_mapping_removed(self, risk_id, control_id):
+        with self._lock:
+            nodes = self._nodes(risk_id, control_id)
+            if nodes is None or nodes[1] not in self._risk_adj[nodes[0]]:
+                return
+            r, c = nodes
+            self._detach(r)
+            self._remove_edge(r, c)
+            self._attach(r)
+            self.stats['deltas'] += 1
+
+    def on_control_status_changed(self, control_id, new_status):
+        with self._lock:
+            c = self._control_index.get(control_id) if self._loaded else None
+            if c is None:
+                return
+            implemented = int(new_status == 'Implemented')
+            delta = implemented - self._control_impl[c]
+            if not delta:
+                return
+            for r in self._control_adj[c]:
+                self._detach(r)
+                self._risk_cover[r] += delta
+            self._control_impl[c] = implemented
+            for r in self._control_adj[c]:
+                self._attach(r)
+            self.stats['deltas'] += 1
+
+    def on_risk_created(self, risk_id, risk_code, risk_title, score, level, status):
+        with self._lock:
+            if not self._loaded or risk_id in self._risk_index:
+                return
+            r = self._add_risk({'risk_id': risk_id, 'risk_code': risk_code,
+                                'risk_title': risk_title, 'risk_score': score,
+                                'risk_level': level, 'status': status})
+            self._attach(r)
+            self.stats['risks'] += 1
+            self.stats['deltas'] += 1
+
+    def on_risk_status_changed(self, risk_id, new_status):
+        with self._lock:
+            r = self._risk_index.get(risk_id) if self._loaded else None
+            if r is None:
+                return
+            self._detach(r)
+            self._risk_open[r] = int(new_status not in CLOSED_STATUSES)
+            self._attach(r)
+            self.stats['deltas'] += 1
+
+    def on_risk_deleted(self, risk_id):
+        """Remove the risk node and its edges; the last risk node moves into its slot."""
+        with self._lock:
+            r = self._risk_index.pop(risk_id, None) if self._loaded else None
+            if r is None:
+                return
+            self._detach(r)
+            for c in self._risk_adj[r]:
+                self._control_adj[c].remove(r)
+            self.stats['edges'] -= len(self._risk_adj[r])
+
+            last = len(self._risk_ids) - 1
+            if r != last:
+                self._detach(last)
+                for c in self._risk_adj[last]:
+                    adj = self._control_adj[c]
+                    adj[adj.index(last)] = r
+                for name in RISK_FIELDS:
+                    getattr(self, name)[r] = getattr(self, name)[last]
+                self._risk_index[self._risk_ids[r]] = r
+                self._attach(r)
+            for name in RISK_FIELDS:
+                getattr(self, name).pop()
+            self.stats['risks'] -= 1
+            self.stats['deltas'] += 1
+
+    # ── Reconcile ────────────────────────────────────────────────────────────
+
+    def reconcile(self):
+        """Rebuild the graph from the database."""
+        risk_rows = db.execute_query(RISKS_SQL, fetch=True)
+        control_rows = db.execute_query(CONTROLS_SQL, fetch=True)
+        mapping_rows = db.execute_query(MAPPINGS_SQL, fetch=True)
+
+        with self._lock:
+            self._reset()
+            self.stats['edges'] = 0
+            for row in risk_rows:
+                self._add_risk(row)
+            for row in control_rows:
+                self._control_index[row['control_id']] = len(self._control_ids)
+                self._control_ids.append(row['control_id'])
+                self._control_codes.append(row['control_code'])
+                self._control_names.append(row['control_name'])
+                self._control_regulation.append(row['regulation'])
+                self._control_impl.append(int(row['implementation_status'] == 'Implemented'))
+                self._control_weight.append(0)
+                self._control_adj.append(array('I'))
+            for row in mapping_rows:
+                r = self._risk_index.get(row['risk_id'])
+                c = self._control_index.get(row['control_id'])
+                if r is not None and c is not None:     # inactive controls are not nodes
+                    self._add_edge(r, c)
+            for r in range(len(self._risk_ids)):
+                self._attach(r)
+            self._loaded = True
+            self.stats.update(risks=len(self._risk_ids), controls=len(self._control_ids))
+            self.stats['reconciles'] += 1
+
+
+control_graph = ControlGraph(reconcile_interval=Config.CONTROL_GRAPH_RECONCILE_INTERVAL)
@@ -0,0 +1,150 @@
+"""
+Bulk risk-control mapping editor - PaySecure Technologies GRC Platform
+Applies a set of mapping adds / removes across many risks for
+POST /compliance/api/mappings in one transaction:
+- Risks and controls are resolved with one IN query each, the
+  affected mappings read once (FOR UPDATE), so the changes are known exactly
+- Adds are one multi-row INSERT ... ON DUPLICATE KEY UPDATE (an existing
+  mapping gets the new mapping_type, mapped_by and mapped_at), removes one
+  multi-row DELETE
+- One consolidated audit event per request instead of one per mapping;
+  the posture engine and the control graph receive per-mapping deltas
+"""
+from app.audit.writer import audit_writer
+from app.db import db
+from config.settings import Config
+from .graph import control_graph
+from .posture import compliance_posture
+
+MAPPING_TYPES = ('Mitigating', 'Compensating', 'Detective', 'Preventive')
+
+UPSERT_SQL = """INSERT INTO risk_compliance_mapping
+    (risk_id, control_id, mapping_type, mapped_by)
+    VALUES (%s, %s, %s, %s) AS new
+    ON DUPLICATE KEY UPDATE mapping_type = new.mapping_type,
+                            mapped_by = new.mapped_by,
+                            mapped_at = CURRENT_TIMESTAMP"""
+
+
+class MappingError(ValueError):
+    """Malformed request, or it references risks / controls that do not exist."""
+
+
+def _pair(item, index, section):
+    if not isinstance(item, dict):
+        raise MappingError('{}[{}]: expected an object'.format(section, index))
+    try:
+        return int(item['risk_id']), int(item['control_id'])
+    except (KeyError, TypeError, ValueError):
+        raise MappingError('{}[{}]: risk_id and control_id must be integers'.format(
+            section, index))
+
+
+def parse_changes(payload):
+    """
+    Request JSON -> (adds {(risk_id, control_id): mapping_type}, removes set).
+    Accepts {"add": [{"risk_id", "control_id", "mapping_type"?}, ...],
+             "remove": [{"risk_id", "control_id"}, ...]}.
+    """
+    if not isinstance(payload, dict):
+        raise MappingError('Request body must be a JSON object')
+    add, remove = payload.get('add') or [], payload.get('remove') or []
+    if not isinstance(add, list) or not isinstance(remove, list):
+        raise MappingError('"add" and "remove" must be lists')
+    if len(add) + len(remove) > Config.MAPPING_BULK_MAX_CHANGES:
+        raise MappingError('At most {} changes per request'.format(
+            Config.MAPPING_BULK_MAX_CHANGES))
+
+    adds = {}
+    for i, item in enumerate(add):
+        pair = _pair(item, i, 'add')
+        mapping_type = item.get('mapping_type') or 'Mitigating'
+        if mapping_type not in MAPPING_TYPES:
+            raise MappingError('add[{}]: mapping_type must be one of {}'.format(
+                i, ', '.join(MAPPING_TYPES)))
+        adds[pair] = mapping_type
+    removes = {_pair(item, i, 'remove') for i, item in enumerate(remove)}
+    both = set(adds) & removes
+    if both:
+        raise MappingError('Mapping risk {} / control {} is both added and removed'.format(
+            *sorted(both)[0]))
+    if not adds and not removes:
+        raise MappingError('Nothing to change')
+    return adds, removes
+
+
+def _in(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def apply_changes(adds, removes, user_id, username=None, ip_address=None):
+    """
+    Apply parsed changes atomically. Raises MappingError (nothing written)
+    when a risk does not exist or an add targets a missing / inactive
+    control (mappings to retired controls can still be removed).
+    """
+    pairs = list(adds) + list(removes)
+    risk_ids = sorted({r for r, _ in pairs})
+    control_ids = sorted({c for _, c in pairs})
+
+    with db.transaction():
+        risks = {r['risk_id']: r['risk_code'] for r in db.execute_query(
+            "SELECT risk_id, risk_code FROM risks WHERE risk_id IN ({})".format(_in(risk_ids)),
+            risk_ids, fetch=True)}
+        control_rows = db.execute_query(
+            "SELECT control_id, control_code, is_active FROM compliance_controls "
+            "WHERE control_id IN ({})".format(_in(control_ids)),
+            control_ids, fetch=True)
+        controls = {c['control_id']: c['control_code'] for c in control_rows}
+        active = {c['control_id'] for c in control_rows if c['is_active']}
+        missing_risks = [r for r in risk_ids if r not in risks]
+        missing_controls = sorted({c for _, c in adds if c not in active}
+                                  | {c for _, c in removes if c not in controls})
+        if missing_risks or missing_controls:
+            raise MappingError('Unknown risk ids {} / control ids {}'.format(
+                missing_risks or '-', missing_controls or '-'))
+
+        existing = {(m['risk_id'], m['control_id']): m['mapping_type'] for m in db.execute_query(
+            "SELECT risk_id, control_id, mapping_type FROM risk_compliance_mapping "
+            "WHERE (risk_id, control_id) IN ({}) FOR UPDATE".format(
+                ', '.join(['(%s, %s)'] * len(pairs))),
+            [v for pair in pairs for v in pair], fetch=True)}
+
+        added = sorted(p for p in adds if p not in existing)
+        retyped = sorted(p for p in adds if p in existing and existing[p] != adds[p])
+        removed = sorted(p for p in removes if p in existing)
+        if added or retyped:
+            db.execute_many(UPSERT_SQL, [(r, c, adds[(r, c)], user_id) for r, c in added + retyped])
+        if removed:
+            db.execute_query(
+                "DELETE FROM risk_compliance_mapping WHERE (risk_id, control_id) IN ({})".format(
+                    ', '.join(['(%s, %s)'] * len(removed))),
+                [v for pair in removed for v in pair])
+
+    # Committed: per-mapping deltas for the in-memory indexes, one audit event
+    for risk_id, control_id in added:
+        compliance_posture.on_mapping_added(control_id)
+        control_graph.on_mapping_added(risk_id, control_id)
+    for risk_id, control_id in removed:
+        compliance_posture.on_mapping_removed(control_id)
+        control_graph.on_mapping_removed(risk_id, control_id)
+
+    def label(pair):
+        return '{} -> {}'.format(risks[pair[0]], controls[pair[1]])
+
+    summary = {
+        'added':     len(added),
+        'retyped':   len(retyped),
+        'removed':   len(removed),
+        'unchanged': len(adds) - len(added) - len(retyped),
+        'not_found': len(removes) - len(removed),
+        'risks':     len(risk_ids),
+    }
+    if added or retyped or removed:
+        audit_writer.submit(user_id, 'RISK_CONTROL_MAPPINGS_UPDATED', 'risk_compliance_mapping',
+                            None, dict(summary,
+                                       mapped=[label(p) for p in added],
+                                       remapped=[label(p) + ' ({})'.format(adds[p]) for p in retyped],
+                                       unmapped=[label(p) for p in removed],
+                                       updated_by=username), ip_address)
+    return summary
@@ -0,0 +1,188 @@
+"""
+Compliance posture engine - PaySecure Technologies GRC Platform
+Keeps per-framework and per-category control counters in memory so the
+controls page and /compliance/api/posture read precomputed figures instead of
+re-aggregating compliance_controls and risk_compliance_mapping on every hit.
+- Control status / mapping write paths apply deltas through the on_* hooks
+- Weighted score: each control contributes its STATUS_CREDIT, weighted by
+  COMPLIANCE_MANDATORY_WEIGHT when is_mandatory (optional controls weigh 1);
+  'Not Applicable' controls are counted but left out of both percentages
+- A background reconcile reloads everything every
+  COMPLIANCE_POSTURE_RECONCILE_INTERVAL seconds, which bounds drift between
+  worker processes
+"""
+from collections import Counter
+
+from app.db import db
+from app.reconcile import ReconcilingIndex
+from config.settings import Config
+
+# Share of a control's weight earned in each implementation status
+STATUS_CREDIT = {'Implemented': 1.0, 'In Progress': 0.5}
+STATUSES = ('Implemented', 'In Progress', 'Under Review', 'Not Started', 'Not Applicable')
+NOT_APPLICABLE = 'Not Applicable'
+
+CONTROLS_SQL = """
+    SELECT control_id, regulation, COALESCE(control_category, 'Uncategorised') AS category,
+           implementation_status, is_mandatory
+    FROM compliance_controls
+    WHERE is_active = TRUE
+"""
+MAPPING_COUNTS_SQL = """
+    SELECT control_id, COUNT(*) AS n
+    FROM risk_compliance_mapping
+    GROUP BY control_id
+"""
+
+
+def _bucket():
+    return {'total': 0, 'applicable': 0, 'mandatory': 0, 'statuses': Counter(),
+            'weight': 0.0, 'earned': 0.0, 'mapped_controls': 0, 'mappings': 0}
+
+
+def _summary(b):
+    implemented = b['statuses']['Implemented']
+    return {
+        'total_controls': b['total'],
+        'applicable_controls': b['applicable'],
+        'implemented':    implemented,
+        'mandatory':      b['mandatory'],
+        'statuses':       {s: b['statuses'][s] for s in STATUSES if b['statuses'][s]},
+        'compliance_pct': round(implemented * 100.0 / b['applicable'], 1) if b['applicable'] else 0,
+        'weighted_pct':   round(b['earned'] * 100.0 / b['weight'], 1) if b['weight'] else 0,
+        'mapped_controls': b['mapped_controls'],
+        'mappings':       b['mappings'],
+    }
+
+
+class CompliancePosture(ReconcilingIndex):
+    """Incrementally maintained compliance counters with periodic reconcile."""
+
+    thread_name = 'posture-reconcile'
+    label = 'Compliance posture'
+
+    def __init__(self, mandatory_weight=2.0, reconcile_interval=60):
+        super().__init__(reconcile_interval)
+        self.mandatory_weight = mandatory_weight
+        self.stats = {'reconciles': 0, 'deltas': 0}
+        self._reset()
+
+    def _reset(self):
+        self._controls = {}         # control_id -> [regulation, category, status, mandatory]
+        self._mapped = Counter()    # control_id -> mapped risks
+        self._regulations = {}      # regulation -> bucket
+        self._categories = {}       # (regulation, category) -> bucket
+
+    # ── Read path ────────────────────────────────────────────────────────────
+
+    def posture(self, regulation=None):
+        """
+        {regulation: summary + per-category summaries}, or one regulation's
+        entry (None if unknown). Reads counters only.
+        """
+        self._ensure_started()
+        with self._lock:
+            if regulation is not None:
+                if regulation not in self._regulations:
+                    return None
+                return self._framework(regulation)
+            return {reg: self._framework(reg) for reg in sorted(self._regulations)}
+
+    def framework_stats(self):
+        """Per-regulation totals in the shape compliance/controls.html expects."""
+        self._ensure_started()
+        with self._lock:
+            return [dict(_summary(self._regulations[reg]), regulation=reg,
+                         active_controls=self._regulations[reg]['statuses']['Implemented'])
+                    for reg in sorted(self._regulations)]
+
+    def mapping_counts(self):
+        """control_id -> number of mapped risks."""
+        self._ensure_started()
+        with self._lock:
+            return dict(self._mapped)
+
+    def _framework(self, regulation):
+        summary = _summary(self._regulations[regulation])
+        summary['categories'] = {cat: _summary(b) for (reg, cat), b
+                                 in sorted(self._categories.items()) if reg == regulation}
+        return summary
+
+    # ── Write-path hooks ─────────────────────────────────────────────────────
+
+    def on_control_status_changed(self, control_id, new_status):
+        with self._lock:
+            control = self._controls.get(control_id) if self._loaded else None
+            if control is None:
+                return
+            self._apply_control(control, -1)
+            control[2] = new_status
+            self._apply_control(control, +1)
+            self.stats['deltas'] += 1
+
+    def on_mapping_added(self, control_id, count=1):
+        self._apply_mapping(control_id, count)
+
+    def on_mapping_removed(self, control_id, count=1):
+        self._apply_mapping(control_id, -count)
+
+    def _weight(self, mandatory):
+        return self.mandatory_weight if mandatory else 1.0
+
+    def _buckets(self, regulation, category):
+        return (self._regulations.setdefault(regulation, _bucket()),
+                self._categories.setdefault((regulation, category), _bucket()))
+
+    def _apply_control(self, control, sign):
+        regulation, category, status, mandatory = control
+        applicable = int(status != NOT_APPLICABLE)
+        weight = self._weight(mandatory) * applicable
+        for b in self._buckets(regulation, category):
+            b['total'] += sign
+            b['applicable'] += sign * applicable
+            b['mandatory'] += sign * int(mandatory)
+            b['statuses'][status] += sign
+            b['weight'] += sign * weight
+            b['earned'] += sign * weight * STATUS_CREDIT.get(status, 0.0)
+
+    def _apply_mapping(self, control_id, delta):
+        with self._lock:
+            control = self._controls.get(control_id) if self._loaded else None
+            if control is None:
+                return
+            before = self._mapped[control_id]
+            after = max(before + delta, 0)
+            self._mapped[control_id] = after
+            for b in self._buckets(control[0], control[1]):
+                b['mappings'] += after - before
+                b['mapped_controls'] += int(after > 0) - int(before > 0)
+            self.stats['deltas'] += 1
+
+    # ── Reconcile ────────────────────────────────────────────────────────────
+
+    def reconcile(self):
+        """Recompute every counter from the database."""
+        control_rows = db.execute_query(CONTROLS_SQL, fetch=True)
+        mapping_rows = db.execute_query(MAPPING_COUNTS_SQL, fetch=True)
+
+        with self._lock:
+            self._reset()
+            mapped = {r['control_id']: int(r['n']) for r in mapping_rows}
+            for r in control_rows:
+                control = [r['regulation'], r['category'],
+                           r['implementation_status'], bool(r['is_mandatory'])]
+                self._controls[r['control_id']] = control
+                self._apply_control(control, +1)
+                n = mapped.get(r['control_id'], 0)
+                self._mapped[r['control_id']] = n
+                for b in self._buckets(control[0], control[1]):
+                    b['mappings'] += n
+                    b['mapped_controls'] += int(n > 0)
+            self._loaded = True
+            self.stats['reconciles'] += 1
+
+
+compliance_posture = CompliancePosture(
+    mandatory_weight=Config.COMPLIANCE_MANDATORY_WEIGHT,
+    reconcile_interval=Config.COMPLIANCE_POSTURE_RECONCILE_INTERVAL,
+)
@@ -3,31 +3,27 @@ Compliance routes - PaySecure Technologies GRC Platform
 Manages PCI-DSS v4.0, GDPR, ISO 27001:2022, and RBI PA/PG controls.
 Python 3.8+ safe (no backslashes inside f-string expressions).
 """
-import json
 import traceback
 
 from flask import (Blueprint, render_template, request,
-                   redirect, url_for, flash, session)
+                   redirect, url_for, flash, jsonify, session)
 
+from app.audit.writer import audit_writer
 from app.auth.utils import login_required, any_role_required
 from app.db import db
+from app.reference import get_active_controls, invalidate_controls
 from . import compliance_bp
+from .graph import LEVELS, control_graph
+from .mappings import MappingError, apply_changes, parse_changes
+from .posture import STATUSES, compliance_posture
 
 
 def _log(action, entity_type, entity_id, details_dict):
-    """Write an audit record."""
-    try:
-        db.execute_query(
-            """INSERT INTO audit_logs
-               (user_id, action, entity_type, entity_id, details, ip_address)
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (
-                session.get('user_id'), action, entity_type, entity_id,
-                json.dumps(details_dict), request.remote_addr,
-            ),
-        )
-    except Exception as exc:
-        print("Audit log error: {}".format(exc))
+    """Queue an audit record for the background writer."""
+    audit_writer.submit(
+        session.get('user_id'), action, entity_type, entity_id,
+        details_dict, request.remote_addr,
+    )
 
 
 # ── Compliance Controls List ─────────────────────────────────────────────────
@@ -47,23 +43,9 @@ def controls():
             fetch=True,
         )
 
-        stats = db.execute_query(
-            """SELECT regulation,
-                      COUNT(*) AS total_controls,
-                      SUM(CASE WHEN implementation_status = 'Implemented' THEN 1 ELSE 0 END) AS active_controls
-               FROM compliance_controls
-               WHERE is_active = TRUE
-               GROUP BY regulation
-               ORDER BY regulation""",
-            fetch=True,
-        )
-
-        mapping_rows = db.execute_query(
-            "SELECT control_id, COUNT(risk_id) AS cnt "
-            "FROM risk_compliance_mapping GROUP BY control_id",
-            fetch=True,
-        )
-        mapping_dict = {r['control_id']: r['cnt'] for r in mapping_rows}
+        # Framework totals and mapped-risk counts from the posture engine
+        stats = compliance_posture.framework_stats()
+        mapping_dict = compliance_posture.mapping_counts()
 
         _log('COMPLIANCE_CONTROLS_VIEWED', 'compliance_controls', None, {
             'viewed_by':     session.get('username', 'unknown'),
@@ -75,6 +57,7 @@ def controls():
             controls=ctrl_list,
             stats=stats,
             mapping_dict=mapping_dict,
+            statuses=STATUSES,
         )
 
     except Exception:
@@ -86,6 +69,151 @@ def controls():
         )
 
 
+# ── Posture ──────────────────────────────────────────────────────────────────
+
+@compliance_bp.route('/api/posture')
+@login_required
+def posture_api():
+    """
+    Compliance posture per framework (or ?regulation=): control counts by
+    status, plain and weighted (mandatory-first) scores, mapping coverage and
+    the same figures per control category.
+    """
+    regulation = request.args.get('regulation')
+    try:
+        posture = compliance_posture.posture(regulation)
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    if posture is None:
+        return jsonify({'error': 'Unknown regulation'}), 404
+    return jsonify(posture)
+
+
+@compliance_bp.route('/controls/<int:control_id>/status', methods=['POST'])
+@any_role_required('admin', 'compliance_officer')
+def update_status(control_id):
+    """Change a control's implementation status (form post from the controls page)."""
+    new_status = request.form.get('implementation_status', '')
+    if new_status not in STATUSES:
+        flash('Invalid implementation status.', 'danger')
+        return redirect(url_for('compliance.controls'))
+    try:
+        with db.transaction():
+            rows = db.execute_query(
+                "SELECT control_code, implementation_status "
+                "FROM compliance_controls WHERE control_id = %s FOR UPDATE",
+                (control_id,),
+                fetch=True,
+            )
+            if rows and rows[0]['implementation_status'] != new_status:
+                db.execute_query(
+                    "UPDATE compliance_controls SET implementation_status = %s "
+                    "WHERE control_id = %s",
+                    (new_status, control_id),
+                )
+        if not rows:
+            flash('Control not found.', 'danger')
+            return redirect(url_for('compliance.controls'))
+
+        ctrl = rows[0]
+        old_status = ctrl['implementation_status']
+        if old_status != new_status:
+            compliance_posture.on_control_status_changed(control_id, new_status)
+            control_graph.on_control_status_changed(control_id, new_status)
+            invalidate_controls()
+            _log('CONTROL_STATUS_CHANGED', 'compliance_controls', control_id, {
+                'control':         ctrl['control_code'],
+                'previous_status': old_status,
+                'new_status':      new_status,
+                'changed_by':      session.get('username', 'unknown'),
+            })
+            flash('Control {} set to {}.'.format(ctrl['control_code'], new_status), 'success')
+
+    except Exception:
+        print(traceback.format_exc())
+        flash('Error updating control status.', 'danger')
+    return redirect(url_for('compliance.controls'))
+
+
+# ── Risk-Control Graph ───────────────────────────────────────────────────────
+
+@compliance_bp.route('/api/graph/coverage')
+@login_required
+def graph_coverage():
+    """Open risks per level: unmapped, mapped without an Implemented control, covered."""
+    try:
+        return jsonify(control_graph.coverage())
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+
+@compliance_bp.route('/api/graph/gaps')
+@login_required
+def graph_gaps():
+    """Open risks at ?level= (default High) with no Implemented control, highest score first."""
+    level = request.args.get('level', 'High')
+    if level not in LEVELS:
+        return jsonify({'error': 'level must be one of {}'.format(', '.join(LEVELS))}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    try:
+        return jsonify({'level': level, 'risks': control_graph.gaps(level, limit)})
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+
+@compliance_bp.route('/api/graph/centrality')
+@login_required
+def graph_centrality():
+    """Controls ranked by the open risk score they cover (?regulation=, ?limit=)."""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 500))
+    try:
+        return jsonify({'controls': control_graph.centrality(
+            limit, request.args.get('regulation'))})
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+
+@compliance_bp.route('/api/graph/blast-radius/<int:control_id>')
+@login_required
+def graph_blast_radius(control_id):
+    """Open risks left without an Implemented control if this control fails."""
+    try:
+        result = control_graph.blast_radius(control_id)
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    if result is None:
+        return jsonify({'error': 'Control not found'}), 404
+    return jsonify(result)
+
+
+# ── Bulk Mapping Editor ──────────────────────────────────────────────────────
+
+@compliance_bp.route('/api/mappings', methods=['POST'])
+@any_role_required('admin', 'risk_manager', 'compliance_officer')
+def bulk_mappings():
+    """
+    Add / remove many risk-control mappings in one transaction, e.g.
+    {"add": [{"risk_id": 7, "control_id": 3, "mapping_type": "Preventive"}],
+     "remove": [{"risk_id": 7, "control_id": 9}]}.
+    Existing mappings in "add" take the new mapping_type. Returns counts.
+    """
+    try:
+        adds, removes = parse_changes(request.get_json(silent=True))
+        summary = apply_changes(adds, removes, session.get('user_id'),
+                                session.get('username', 'unknown'), request.remote_addr)
+    except MappingError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    return jsonify(summary)
+
+
 # ── Map Risk to Control ──────────────────────────────────────────────────────
 
 @compliance_bp.route('/map-risk/<int:risk_id>', methods=['GET', 'POST'])
@@ -120,27 +248,31 @@ def map_risk(risk_id):
             username   = session.get('username', 'unknown')
 
             if action_type == 'add':
-                exists = db.execute_query(
-                    "SELECT mapping_id FROM risk_compliance_mapping "
-                    "WHERE risk_id=%s AND control_id=%s",
-                    (risk_id, control_id),
-                    fetch=True,
-                )
+                with db.transaction():
+                    exists = db.execute_query(
+                        "SELECT mapping_id FROM risk_compliance_mapping "
+                        "WHERE risk_id=%s AND control_id=%s",
+                        (risk_id, control_id),
+                        fetch=True,
+                    )
+                    if not exists:
+                        db.execute_query(
+                            """INSERT INTO risk_compliance_mapping
+                               (risk_id, control_id, mapping_type, mapped_by)
+                               VALUES (%s, %s, %s, %s)""",
+                            (risk_id, control_id, mapping_type, session.get('user_id')),
+                        )
+                        ctrl = db.execute_query(
+                            "SELECT control_code FROM compliance_controls "
+                            "WHERE control_id=%s",
+                            (control_id,),
+                            fetch=True,
+                        )
                 if exists:
                     flash('This risk-control mapping already exists.', 'warning')
                 else:
-                    db.execute_query(
-                        """INSERT INTO risk_compliance_mapping
-                           (risk_id, control_id, mapping_type, mapped_by)
-                           VALUES (%s, %s, %s, %s)""",
-                        (risk_id, control_id, mapping_type, session.get('user_id')),
-                    )
-                    ctrl = db.execute_query(
-                        "SELECT control_code FROM compliance_controls "
-                        "WHERE control_id=%s",
-                        (control_id,),
-                        fetch=True,
-                    )
+                    compliance_posture.on_mapping_added(int(control_id))
+                    control_graph.on_mapping_added(risk_id, int(control_id))
                     ctrl_code = ctrl[0]['control_code'] if ctrl else str(control_id)
                     _log('RISK_CONTROL_MAPPED', 'risk_compliance_mapping', risk_id, {
                         'risk_code':    risk_code,
@@ -156,11 +288,21 @@ def map_risk(risk_id):
             elif action_type == 'remove':
                 mapping_id = request.form.get('mapping_id')
                 if mapping_id:
-                    db.execute_query(
-                        "DELETE FROM risk_compliance_mapping "
-                        "WHERE mapping_id = %s AND risk_id = %s",
-                        (mapping_id, risk_id),
-                    )
+                    with db.transaction():
+                        mapped = db.execute_query(
+                            "SELECT control_id FROM risk_compliance_mapping "
+                            "WHERE mapping_id = %s AND risk_id = %s FOR UPDATE",
+                            (mapping_id, risk_id),
+                            fetch=True,
+                        )
+                        db.execute_query(
+                            "DELETE FROM risk_compliance_mapping "
+                            "WHERE mapping_id = %s AND risk_id = %s",
+                            (mapping_id, risk_id),
+                        )
+                    if mapped:
+                        compliance_posture.on_mapping_removed(mapped[0]['control_id'])
+                        control_graph.on_mapping_removed(risk_id, mapped[0]['control_id'])
                     _log('RISK_CONTROL_UNMAPPED', 'risk_compliance_mapping', risk_id, {
                         'risk_code':  risk_code,
                         'mapping_id': mapping_id,
@@ -171,14 +313,7 @@ def map_risk(risk_id):
             return redirect(url_for('compliance.map_risk', risk_id=risk_id))
 
         # GET – fetch controls and existing mappings
-        all_controls = db.execute_query(
-            """SELECT control_id, control_code, control_name,
-                      regulation, implementation_status
-               FROM compliance_controls
-               WHERE is_active = TRUE
-               ORDER BY regulation, control_code""",
-            fetch=True,
-        )
+        all_controls = get_active_controls()
 
         existing_mappings = db.execute_query(
             """SELECT rcm.mapping_id, rcm.mapping_type, rcm.mapped_at,
@@ -0,0 +1,247 @@
+"""
+Dashboard metrics snapshot - PaySecure Technologies GRC Platform
+Keeps the dashboard aggregates in memory so dashboard.view reads one
+precomputed record instead of re-scanning risks and audit_logs on every
+hit. Per-framework compliance figures come from the posture engine
+(app/compliance/posture.py), which owns the control counters.
+- Risk write routes apply deltas through the on_* hooks
+- Audit events arrive through an audit_writer listener
+- A background reconcile recomputes everything from the database every
+  METRICS_RECONCILE_INTERVAL seconds, which also bounds drift between
+  worker processes and ages events out of the 7-day window
+"""
+from collections import Counter, deque
+from datetime import datetime
+
+from app.audit.writer import DETAILS_SQL, audit_writer
+from app.db import db
+from app.reconcile import ReconcilingIndex
+from config.settings import Config
+
+OPEN_EXCLUDED_STATUSES = ('Accepted', 'Closed')
+QUIET_ACTIONS          = ('USER_LOGIN', 'USER_LOGOUT', 'AUDIT_TRAIL_VIEWED')
+
+HIGH_RISKS_SQL = """
+    SELECT risk_code, risk_title, risk_score, status
+    FROM risks
+    WHERE risk_level = 'High'
+    ORDER BY risk_score DESC
+    LIMIT 3
+"""
+
+OPEN_FINDINGS_SQL = """
+    SELECT risk_code, risk_title, risk_level, status, risk_score
+    FROM risks
+    WHERE status IN ('Identified', 'Assessed')
+    ORDER BY risk_score DESC
+    LIMIT 5
+"""
+
+
+class DashboardMetrics(ReconcilingIndex):
+    """Incrementally maintained dashboard aggregates with periodic reconcile."""
+
+    thread_name = 'metrics-reconcile'
+    label = 'Metrics'
+
+    def __init__(self, reconcile_interval=60):
+        super().__init__(reconcile_interval)
+        self.stats = {'reconciles': 0, 'deltas': 0, 'list_refreshes': 0}
+        self._reset()
+
+    def _reset(self):
+        self._levels = Counter()             # risk_level -> count
+        self._open_risks = 0
+        self._score_sum = 0
+        self._category_scores = {}           # category_id -> Counter(score -> n)
+        self._category_names = {}            # category_id -> category_name
+        self._audit = Counter()              # total / login / risk events (7d)
+        self._audit_users = set()
+        self._users = {}                     # user_id -> (full_name, job_title)
+        self._recent_events = deque(maxlen=5)
+        self._high_risks = []
+        self._open_findings = []
+        self._lists_stale = False
+
+    # ── Read path ────────────────────────────────────────────────────────────
+
+    def snapshot(self):
+        """Current dashboard aggregates in the shape dashboard/index.html expects."""
+        self._ensure_started()
+        if self._lists_stale:
+            self._refresh_lists()
+        with self._lock:
+            total = sum(self._levels.values())
+            categories = []
+            for cid, scores in self._category_scores.items():
+                count = sum(scores.values())
+                if count:
+                    categories.append({
+                        'category_name': self._category_names.get(cid, str(cid)),
+                        'count':         count,
+                        'max_score':     max(s for s, n in scores.items() if n),
+                    })
+            categories.sort(key=lambda c: c['count'], reverse=True)
+
+            return {
+                'risk_summary': {
+                    'total_risks':    total,
+                    'high_risks':     self._levels['High'],
+                    'medium_risks':   self._levels['Medium'],
+                    'low_risks':      self._levels['Low'],
+                    'open_risks':     self._open_risks,
+                    'avg_risk_score': self._score_sum / total if total else None,
+                },
+                'high_risks':              list(self._high_risks),
+                'audit_stats': {
+                    'total_events_7d': self._audit['total'],
+                    'active_users_7d': len(self._audit_users),
+                    'login_events':    self._audit['login'],
+                    'risk_events':     self._audit['risk'],
+                },
+                'recent_events':    list(self._recent_events),
+                'open_findings':    list(self._open_findings),
+                'risk_by_category': categories,
+            }
+
+    # ── Write-path hooks ─────────────────────────────────────────────────────
+
+    def on_risk_created(self, level, score, status, category_id):
+        self._apply_risk(level, score, status, category_id, +1)
+
+    def on_risk_deleted(self, level, score, status, category_id):
+        self._apply_risk(level, score, status, category_id, -1)
+
+    def on_risk_status_changed(self, old_status, new_status):
+        with self._lock:
+            if not self._loaded:
+                return
+            was_open = old_status not in OPEN_EXCLUDED_STATUSES
+            is_open  = new_status not in OPEN_EXCLUDED_STATUSES
+            self._open_risks += int(is_open) - int(was_open)
+            self._lists_stale = True
+            self.stats['deltas'] += 1
+
+    def on_audit_event(self, event):
+        """audit_writer listener: count the event and feed the recent-activity list."""
+        with self._lock:
+            if not self._loaded:
+                return
+            action = event['action'] or ''
+            self._audit['total'] += 1
+            if action == 'USER_LOGIN':
+                self._audit['login'] += 1
+            if action.startswith('RISK_'):
+                self._audit['risk'] += 1
+            if event['user_id'] is not None:
+                self._audit_users.add(event['user_id'])
+            if action not in QUIET_ACTIONS:
+                full_name, job_title = self._users.get(event['user_id'], (None, None))
+                self._recent_events.appendleft({
+                    'action':     action,
+                    'details':    event['details'],
+                    'created_at': datetime.strptime(event['created_at'], '%Y-%m-%d %H:%M:%S'),
+                    'full_name':  full_name,
+                    'job_title':  job_title,
+                })
+            self.stats['deltas'] += 1
+
+    def _apply_risk(self, level, score, status, category_id, sign):
+        with self._lock:
+            if not self._loaded:
+                return
+            if category_id not in self._category_names:
+                # Unknown category: cheaper to rebuild than to guess its name
+                self._loaded = False
+                return
+            self._levels[level] += sign
+            self._score_sum += sign * score
+            if status not in OPEN_EXCLUDED_STATUSES:
+                self._open_risks += sign
+            scores = self._category_scores.setdefault(category_id, Counter())
+            scores[score] += sign
+            self._lists_stale = True
+            self.stats['deltas'] += 1
+
+    # ── Reconcile ────────────────────────────────────────────────────────────
+
+    def reconcile(self):
+        """Recompute every aggregate from the database."""
+        risk_rows = db.execute_query("""
+            SELECT category_id, risk_level, status, risk_score, COUNT(*) AS n
+            FROM risks
+            GROUP BY category_id, risk_level, status, risk_score
+        """, fetch=True)
+        category_rows = db.execute_query(
+            "SELECT category_id, category_name FROM risk_categories", fetch=True)
+        audit_row = db.execute_query("""
+            SELECT COUNT(*)                                             AS total,
+                   SUM(CASE WHEN action = 'USER_LOGIN' THEN 1 ELSE 0 END) AS login,
+                   SUM(CASE WHEN action LIKE 'RISK_%' THEN 1 ELSE 0 END)  AS risk
+            FROM audit_logs
+            WHERE created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+        """, fetch=True)[0]
+        audit_users = db.execute_query(
+            "SELECT DISTINCT user_id FROM audit_logs "
+            "WHERE created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY) AND user_id IS NOT NULL",
+            fetch=True)
+        user_rows = db.execute_query(
+            "SELECT user_id, full_name, job_title FROM users", fetch=True)
+        recent = db.execute_query("""
+            SELECT al.action, {details} AS details, al.created_at,
+                   u.full_name, u.job_title
+            FROM audit_logs al
+            LEFT JOIN users u ON al.user_id = u.user_id
+            WHERE al.action NOT IN ('USER_LOGIN', 'USER_LOGOUT', 'AUDIT_TRAIL_VIEWED')
+            ORDER BY al.created_at DESC
+            LIMIT 5
+        """.format(details=DETAILS_SQL), fetch=True)
+        high_risks, open_findings = self._query_lists()
+
+        with self._lock:
+            self._reset()
+            for r in risk_rows:
+                n = int(r['n'])
+                self._levels[r['risk_level']] += n
+                self._score_sum += n * r['risk_score']
+                if r['status'] not in OPEN_EXCLUDED_STATUSES:
+                    self._open_risks += n
+                self._category_scores.setdefault(r['category_id'], Counter())[r['risk_score']] += n
+            self._category_names = {c['category_id']: c['category_name'] for c in category_rows}
+            self._audit.update({
+                'total': int(audit_row['total'] or 0),
+                'login': int(audit_row['login'] or 0),
+                'risk':  int(audit_row['risk'] or 0),
+            })
+            self._audit_users = {u['user_id'] for u in audit_users}
+            self._users = {u['user_id']: (u['full_name'], u['job_title']) for u in user_rows}
+            self._recent_events.extend(recent)
+            self._high_risks, self._open_findings = high_risks, open_findings
+            self._loaded = True
+            self.stats['reconciles'] += 1
+
+    def _query_lists(self):
+        return (db.execute_query(HIGH_RISKS_SQL, fetch=True),
+                db.execute_query(OPEN_FINDINGS_SQL, fetch=True))
+
+    def _refresh_lists(self):
+        """
+        Re-read the short top-N lists after a mutation may have reordered them.
+        The queries run outside the lock so write hooks never wait on them; a
+        mutation landing meanwhile marks the lists stale again.
+        """
+        with self._lock:
+            self._lists_stale = False
+        try:
+            high_risks, open_findings = self._query_lists()
+        except Exception:
+            with self._lock:
+                self._lists_stale = True
+            raise
+        with self._lock:
+            self._high_risks, self._open_findings = high_risks, open_findings
+            self.stats['list_refreshes'] += 1
+
+
+dashboard_metrics = DashboardMetrics(reconcile_interval=Config.METRICS_RECONCILE_INTERVAL)
+audit_writer.add_listener(dashboard_metrics.on_audit_event)
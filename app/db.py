@@ -2,28 +2,302 @@
 Database connection layer using mysql-connector-python
 Implements connection pooling and parameterized queries for security
 """
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
 import mysql.connector
+from flask import g, has_app_context
 from mysql.connector import Error
-from mysql.connector.pooling import MySQLConnectionPool
 from config.settings import Config
 import os
 
+
+class PoolExhausted(Exception):
+    """Raised when no connection frees up within the checkout timeout"""
+
+
+class StatementCache:
+    """
+    Per-connection LRU of server-side prepared statements, keyed by SQL text
+    Each entry is a prepared dictionary cursor; the driver only re-prepares
+    when handed a different SQL string object, so the cached key is passed
+    back on every execution. Evicted cursors are closed, which deallocates
+    the statement on the server.
+    """
+
+    def __init__(self, capacity, counters):
+        self.capacity = capacity
+        self._counters = counters       # shared, process-wide
+        self._entries = OrderedDict()   # sql -> (sql, cursor); right end = most recent
+
+    @staticmethod
+    def for_connection(conn, capacity, counters):
+        cache = getattr(conn, '_grc_stmt_cache', None)
+        if cache is None:
+            cache = StatementCache(capacity, counters)
+            conn._grc_stmt_cache = cache
+        return cache
+
+    @staticmethod
+    def discard(conn):
+        """Drop a connection's cached statements (before a session reset or close)"""
+        cache = getattr(conn, '_grc_stmt_cache', None)
+        if cache is not None:
+            cache.clear()
+
+    def get(self, conn, query):
+        """Return (sql, cursor) for query, preparing it on a miss"""
+        label = ' '.join(query.split())[:80]
+        per_stmt = self._counters['statements'].setdefault(label, {'hits': 0, 'misses': 0})
+        entry = self._entries.get(query)
+        if entry is not None:
+            self._entries.move_to_end(query)
+            self._counters['hits'] += 1
+            per_stmt['hits'] += 1
+            return entry
+
+        self._counters['misses'] += 1
+        per_stmt['misses'] += 1
+        entry = (query, conn.cursor(prepared=True, dictionary=True))
+        self._entries[query] = entry
+        while len(self._entries) > self.capacity:
+            _, (_, old) = self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+            self._close_quietly(old)
+        return entry
+
+    def evict(self, query):
+        entry = self._entries.pop(query, None)
+        if entry is not None:
+            self._close_quietly(entry[1])
+
+    def clear(self):
+        while self._entries:
+            self._close_quietly(self._entries.popitem()[1][1])
+
+    @staticmethod
+    def _close_quietly(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded, instrumented connection pool
+    - Grows on demand from min_size up to max_size, and trims idle
+      connections back to min_size after idle_timeout seconds
+    - Checkout blocks (FIFO wait queue) for up to checkout_timeout seconds
+      before raising PoolExhausted
+    - Liveness ping only for connections idle longer than health_check_after
+    """
+
+    def __init__(self, min_size, max_size, checkout_timeout, health_check_after,
+                 idle_timeout, reset_session, **connect_args):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.idle_timeout = idle_timeout
+        self.reset_session = reset_session
+        self._connect_args = connect_args
+
+        self._cond = threading.Condition()
+        self._idle = deque()        # (conn, released_at); right end = most recently used
+        self._waiters = deque()     # FIFO tickets for blocked checkouts
+        self._size = 0              # open connections (idle + in use)
+        self._in_use = 0
+
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'exhausted': 0,
+            'created': 0,
+            'discarded': 0,
+            'health_checks': 0,
+        }
+
+        for _ in range(self.min_size):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self._connect_args)
+        self._counters['created'] += 1
+        return conn
+
+    def acquire(self):
+        """Check a connection out, waiting in line if the pool is at max_size"""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        conn = None
+        with self._cond:
+            ticket = object()
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if self._waiters[0] is ticket:
+                        if self._idle:
+                            conn, released_at = self._idle.pop()
+                            break
+                        if self._size < self.max_size:
+                            self._size += 1
+                            released_at = None
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['exhausted'] += 1
+                        raise PoolExhausted(
+                            "No database connection available after {:.1f}s "
+                            "({} in use, max {})".format(
+                                self.checkout_timeout, self._in_use, self.max_size))
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - released_at > self.health_check_after:
+                # Only ping connections that have sat idle long enough to go stale
+                self._counters['health_checks'] += 1
+                if not conn.is_connected():
+                    StatementCache.discard(conn)
+                    conn.reconnect(attempts=3, delay=2)
+        except Exception:
+            self._discard(conn)
+            raise
+
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._cond:
+            self._counters['checkouts'] += 1
+            if waited_ms >= 1:
+                self._counters['waits'] += 1
+            self._counters['wait_time_total_ms'] += waited_ms
+            self._counters['wait_time_max_ms'] = max(
+                self._counters['wait_time_max_ms'], waited_ms)
+        return conn
+
+    def release(self, conn):
+        """Return a connection; broken connections are dropped and replaced on demand"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self.reset_session:
+                # COM_RESET_CONNECTION deallocates server-side prepared statements
+                StatementCache.discard(conn)
+                conn.reset_session()
+        except Exception:
+            self._discard(conn)
+            return
+
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, now))
+            # Shrink back towards min_size once the burst has passed
+            while (self._size > self.min_size and self._idle
+                   and now - self._idle[0][1] > self.idle_timeout):
+                stale.append(self._idle.popleft()[0])
+                self._size -= 1
+                self._counters['discarded'] += 1
+            self._cond.notify_all()
+        for old in stale:
+            StatementCache.discard(old)
+            self._close_quietly(old)
+
+    def release_broken(self, conn):
+        """Drop a checked-out connection that cannot be reused"""
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify_all()
+        if conn is not None:
+            StatementCache.discard(conn)
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Snapshot of pool gauges and counters for capacity planning"""
+        with self._cond:
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size':     self._size,
+                'in_use':   self._in_use,
+                'idle':     len(self._idle),
+                'waiting':  len(self._waiters),
+            })
+        checkouts = snapshot['checkouts'] or 1
+        snapshot['wait_time_avg_ms'] = round(snapshot['wait_time_total_ms'] / checkouts, 3)
+        snapshot['wait_time_total_ms'] = round(snapshot['wait_time_total_ms'], 3)
+        snapshot['wait_time_max_ms'] = round(snapshot['wait_time_max_ms'], 3)
+        return snapshot
+
+
 class Database:
     _instance = None
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
-            cls._instance._initialize_pool()
+            cls._instance._local = threading.local()
+            cls._instance._stmt_counters = {
+                'hits': 0, 'misses': 0, 'evictions': 0, 'statements': {},
+            }
+            cls._instance._pool = None
+            cls._instance._pool_lock = threading.Lock()
         return cls._instance
+
+    @property
+    def pool(self):
+        """The connection pool, opened on first use so importing app modules
+        (e.g. in process-pool workers) never connects to MySQL"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._initialize_pool()
+        return self._pool
+
+    def init_app(self, app):
+        """Return the request-scoped connection to the pool when the app context ends"""
+        app.teardown_appcontext(self._teardown)
+
+    def _teardown(self, exc=None):
+        conn = g.pop('_db_conn', None)
+        g.pop('_db_tx_depth', None)
+        if conn is not None:
+            self.release_connection(conn)
     
     def _initialize_pool(self):
         """Initialize connection pool with security settings"""
         try:
-            self.pool = MySQLConnectionPool(
-                pool_name="grc_pool",
-                pool_size=5,
-                pool_reset_session=True,
+            self._pool = ConnectionPool(
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                checkout_timeout=Config.DB_POOL_CHECKOUT_TIMEOUT,
+                health_check_after=Config.DB_POOL_HEALTH_CHECK_AFTER,
+                idle_timeout=Config.DB_POOL_IDLE_TIMEOUT,
+                reset_session=Config.DB_POOL_RESET_SESSION,
                 host=Config.MYSQL_HOST,
                 user=Config.MYSQL_USER,
                 password=Config.MYSQL_PASSWORD,
@@ -36,38 +310,134 @@ class Database:
             print("✓ Database connection pool initialized")
         except Error as e:
             raise Exception(f"Database connection failed: {e}")
+
     def get_connection(self):
-        """Get connection from pool with validation"""
+        """Check a connection out of the pool (blocks up to DB_POOL_CHECKOUT_TIMEOUT)"""
         try:
-            conn = self.pool.get_connection()
-            # Verify connection is alive
-            if not conn.is_connected():
-                conn.reconnect(attempts=3, delay=2)
-            return conn
+            return self.pool.acquire()
         except Error as e:
             raise Exception(f"Failed to get database connection: {e}")
+
+    def release_connection(self, conn):
+        """Return a connection obtained from get_connection() to the pool"""
+        self.pool.release(conn)
+
+    def pool_stats(self):
+        """Connection pool gauges and counters"""
+        return self.pool.stats()
+
+    def statement_cache_stats(self):
+        """Prepared-statement cache hit/miss counters, overall and per statement"""
+        counters = self._stmt_counters
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'capacity_per_connection': Config.DB_STMT_CACHE_SIZE,
+            'hits':       counters['hits'],
+            'misses':     counters['misses'],
+            'evictions':  counters['evictions'],
+            'hit_ratio':  round(counters['hits'] / lookups, 4) if lookups else None,
+            'statements': {sql: dict(c) for sql, c in counters['statements'].items()},
+        }
+
+    # ── Connection scoping ───────────────────────────────────────────────────
+    # Inside a Flask app context every query of the request shares a single
+    # connection stored on g (checked out lazily, returned on teardown).
+    # Outside one (scripts, background threads) each call checks out its own
+    # connection unless it runs inside db.transaction().
+
+    def _scope(self):
+        return g if has_app_context() else self._local
+
+    def _checkout(self):
+        """Return (conn, owned); owned connections must be released by the caller"""
+        scope = self._scope()
+        conn = getattr(scope, '_db_conn', None)
+        if conn is not None:
+            return conn, False
+        conn = self.get_connection()
+        if has_app_context():
+            g._db_conn = conn
+            return conn, False
+        return conn, True
+
+    def in_transaction(self):
+        """True while inside a db.transaction() block"""
+        return getattr(self._scope(), '_db_tx_depth', 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work: every statement inside the block shares one connection
+        and is committed once on exit (rolled back if the block raises).
+        Nested blocks join the outermost transaction.
+        Usage:
+            with db.transaction():
+                db.execute_query("DELETE ...", (...))
+                db.execute_query("DELETE ...", (...))
+        """
+        scope = self._scope()
+        depth = getattr(scope, '_db_tx_depth', 0)
+        conn, owned = self._checkout()
+        if owned:
+            scope._db_conn = conn
+        scope._db_tx_depth = depth + 1
+        try:
+            yield conn
+            if depth == 0:
+                conn.commit()
+        except Exception:
+            if depth == 0:
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+            raise
+        finally:
+            scope._db_tx_depth = depth
+            if owned:
+                scope._db_conn = None
+                self.release_connection(conn)
+
+    def _commit(self, conn):
+        if not self.in_transaction():
+            conn.commit()
+
+    def _rollback(self, conn):
+        # Inside a transaction the block owner decides; otherwise undo this statement
+        if not self.in_transaction():
+            conn.rollback()
     
-    def execute_query(self, query, params=None, fetch=False):
+    def execute_query(self, query, params=None, fetch=False, prepared=False):
         """
         Execute parameterized query with automatic connection management
         Args:
             query: SQL query string with %s placeholders
             params: Tuple/list of parameters for query
             fetch: True to return results, False for INSERT/UPDATE/DELETE
+            prepared: True to run as a cached server-side prepared statement
+                      (for hot, fixed SQL strings only)
         Returns:
             Result set (if fetch=True) or lastrowid/rowcount (if fetch=False)
         """
         conn = None
+        owned = False
         cursor = None
+        stmt_cache = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            
-            # Execute with parameterized query (prevents SQL injection)
-            if params:
-                cursor.execute(query, params)
+            conn, owned = self._checkout()
+            if prepared:
+                stmt_cache = StatementCache.for_connection(
+                    conn, Config.DB_STMT_CACHE_SIZE, self._stmt_counters)
+                query, cursor = stmt_cache.get(conn, query)
+                cursor.execute(query, tuple(params or ()))
             else:
-                cursor.execute(query)
+                cursor = conn.cursor(dictionary=True, buffered=True)
+
+                # Execute with parameterized query (prevents SQL injection)
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
             
             if fetch:
                 result = cursor.fetchall()
@@ -76,22 +446,90 @@ class Database:
                 # For INSERT/UPDATE/DELETE
                 if query.strip().upper().startswith("INSERT"):
                     last_id = cursor.lastrowid
-                    conn.commit()
+                    self._commit(conn)
                     return last_id
                 else:
                     row_count = cursor.rowcount
-                    conn.commit()
+                    self._commit(conn)
                     return row_count
                     
         except Error as e:
+            if stmt_cache is not None:
+                stmt_cache.evict(query)
+                cursor = None
             if conn:
-                conn.rollback()
+                self._rollback(conn)
             raise Exception(f"Query execution failed: {e}")
+        finally:
+            # Cached prepared cursors stay open for the next execution
+            if cursor and stmt_cache is None:
+                cursor.close()
+            if owned:
+                self.release_connection(conn)
+
+    def execute_many(self, query, seq_params):
+        """
+        Execute one parameterized statement for many rows in a single commit
+        Args:
+            query: SQL query string with %s placeholders
+            seq_params: Sequence of parameter tuples, one per row
+        Returns:
+            Number of affected rows
+        """
+        conn = None
+        owned = False
+        cursor = None
+        try:
+            conn, owned = self._checkout()
+            cursor = conn.cursor()
+            # Multi-row INSERTs are rewritten into a single statement by the driver
+            cursor.executemany(query, seq_params)
+            row_count = cursor.rowcount
+            self._commit(conn)
+            return row_count
+
+        except Error as e:
+            if conn:
+                self._rollback(conn)
+            raise Exception(f"Batch execution failed: {e}")
         finally:
             if cursor:
                 cursor.close()
-            if conn and conn.is_connected():
-                conn.close()
+            if owned:
+                self.release_connection(conn)
+
+    def stream_query(self, query, params=None, batch_size=1000):
+        """
+        Yield result rows in fetchmany() batches from an unbuffered cursor
+        Rows are pulled from the server as the consumer iterates, so memory
+        stays bounded by batch_size regardless of the result size. Uses its
+        own pooled connection (not the request-scoped one) because the
+        generator usually outlives the view function.
+        Yields:
+            Lists of row dicts, at most batch_size long
+        """
+        conn = self.get_connection()
+        cursor = None
+        finished = False
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            finished = True
+        except Error as e:
+            raise Exception(f"Streaming query failed: {e}")
+        finally:
+            if finished:
+                cursor.close()
+                self.release_connection(conn)
+            else:
+                # Abandoned mid-result (client went away): the unread rows make
+                # the connection unusable, so drop it instead of draining it
+                self.pool.release_broken(conn)
 
 # Singleton instance for application-wide use
 db = Database()
\ No newline at end of file
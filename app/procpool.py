@@ -0,0 +1,32 @@
+"""
+Process pools started from inside the web app - PaySecure Technologies GRC Platform
+bcrypt (app/auth/hashing.py), the Monte Carlo model (app/risk/simulation.py)
+and the audit chain verifier (app/audit/chain.py) fan CPU work out to
+ProcessPoolExecutors. A running worker is multithreaded (audit writer,
+throttle flusher, session sweeper, reconcile loops), and a fork() copies any
+lock one of those threads holds - pool, logging, queue - into a child that
+has no thread left to release it. Pools created here therefore never fork
+the app process:
+- 'forkserver' where available: workers fork from a clean single-threaded
+  server process, which imports the preloaded worker modules once
+- 'spawn' elsewhere
+"""
+import multiprocessing
+
+_preload = set()
+
+
+def process_context(*preload):
+    """
+    multiprocessing context for a ProcessPoolExecutor created by the app.
+    `preload` names the modules holding the worker functions; the fork server
+    imports them before its first worker (modules named after it has started
+    are imported by each worker instead).
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    ctx = multiprocessing.get_context('forkserver')
+    if not _preload.issuperset(preload):
+        _preload.update(preload)
+        ctx.set_forkserver_preload(sorted(_preload))
+    return ctx
@@ -0,0 +1,58 @@
+"""
+Reconciling in-memory indexes - PaySecure Technologies GRC Platform
+Base class for the per-process aggregates that write paths keep current
+through on_* hooks and a background thread rebuilds from the database
+(dashboard metrics, compliance posture, risk-control graph).
+- Subclasses implement reconcile(): query outside self._lock, swap the new
+  state in under it and set self._loaded
+- Reads call _ensure_started(): the first one in a process loads the index
+  and starts the reconcile thread, under a start lock so concurrent first
+  requests neither load twice nor start two threads
+- A hook that cannot apply its delta sets _loaded = False, and a write path
+  too large for per-row deltas calls invalidate(); the next read reloads
+"""
+import os
+import threading
+import time
+
+
+class ReconcilingIndex:
+    """In-memory index with a reconcile thread; subclasses define reconcile()."""
+
+    thread_name = 'index-reconcile'
+    label = 'Index'         # for error messages
+
+    def __init__(self, reconcile_interval=60):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.RLock()
+        self._start_lock = threading.Lock()
+        self._loaded = False
+        self._pid = None
+        self._thread = None
+
+    def reconcile(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        """Drop the in-memory state; the next read in this process reloads it."""
+        self._loaded = False
+
+    def _ensure_started(self):
+        if self._loaded and self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if not self._loaded:
+                self.reconcile()
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._reconcile_loop, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+    def _reconcile_loop(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as exc:
+                print("{} reconcile error: {}".format(self.label, exc))
@@ -0,0 +1,65 @@
+"""
+Cached reference data shared by the risk, compliance and audit views
+Lookups that rarely change (categories, active users, active controls,
+audit action names) are served from app.cache.
+- Controls and audit actions have invalidate_* hooks, called by the code
+  that writes those rows
+- Categories and active users are TTL-only (1 hour / 5 minutes): the app has
+  no write path for them, they change only through scripts/reset_and_seed.py
+  or direct SQL, so a change shows up once the entry expires
+"""
+from app.cache import cache
+from app.db import db
+
+KEY_CATEGORIES    = 'ref:risk_categories'
+KEY_USERS         = 'ref:active_users'
+KEY_CONTROLS      = 'ref:active_controls'
+KEY_AUDIT_ACTIONS = 'ref:audit_actions'
+
+
+def get_risk_categories():
+    """All risk categories, ordered by name."""
+    return cache.get_or_load(KEY_CATEGORIES, lambda: db.execute_query(
+        "SELECT category_id, category_name, nist_csf_domain "
+        "FROM risk_categories ORDER BY category_name",
+        fetch=True,
+        prepared=True,
+    ), ttl=3600)
+
+
+def get_active_users():
+    """Active users (owner pickers, audit filters), ordered by name."""
+    return cache.get_or_load(KEY_USERS, lambda: db.execute_query(
+        "SELECT user_id, full_name, job_title "
+        "FROM users WHERE is_active = TRUE ORDER BY full_name",
+        fetch=True,
+        prepared=True,
+    ), ttl=300)
+
+
+def get_active_controls():
+    """Active compliance controls, ordered by regulation and code."""
+    return cache.get_or_load(KEY_CONTROLS, lambda: db.execute_query(
+        """SELECT control_id, control_code, control_name,
+                  regulation, implementation_status
+           FROM compliance_controls
+           WHERE is_active = TRUE
+           ORDER BY regulation, control_code""",
+        fetch=True,
+    ), ttl=600)
+
+
+def get_audit_actions():
+    """Distinct audit action names from the audit_actions lookup (not audit_logs)."""
+    return cache.get_or_load(KEY_AUDIT_ACTIONS, lambda: db.execute_query(
+        "SELECT action FROM audit_actions ORDER BY action",
+        fetch=True,
+    ), ttl=600)
+
+
+def invalidate_controls():
+    cache.invalidate(KEY_CONTROLS)
+
+
+def invalidate_audit_actions():
+    cache.invalidate(KEY_AUDIT_ACTIONS)
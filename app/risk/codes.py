@@ -0,0 +1,108 @@
+"""
+Risk code allocator - PaySecure Technologies GRC Platform
+Issues RISK-<year>-NNN codes from a per-year counter (risk_code_sequences)
+instead of SELECT MAX(risk_id), so concurrent creates never collide.
+- Numbers are reserved atomically with UPDATE ... LAST_INSERT_ID(next_value + n)
+  on a dedicated connection, committed immediately: the counter row is never
+  held for the length of the caller's transaction
+- Each worker reserves RISK_CODE_BLOCK_SIZE numbers at a time and hands them
+  out from memory; bulk imports reserve their whole range in one round trip
+- Codes are unique and increasing per worker, not gap-free: numbers left in a
+  block when a worker exits (or a create rolls back) are skipped
+"""
+import os
+import threading
+from datetime import date
+
+from app.db import db
+from config.settings import Config
+
+CODE_FORMAT = 'RISK-{year}-{number:03d}'
+
+# First use of a year: start after the highest code already issued for it
+SEED_SQL = """
+    INSERT IGNORE INTO risk_code_sequences (seq_year, next_value)
+    SELECT %s, COALESCE(MAX(CAST(SUBSTRING(risk_code, 11) AS UNSIGNED)), 0) + 1
+    FROM risks
+    WHERE risk_code LIKE %s
+"""
+RESERVE_SQL = (
+    "UPDATE risk_code_sequences "
+    "SET next_value = LAST_INSERT_ID(next_value + %s) "
+    "WHERE seq_year = %s"
+)
+
+
+class RiskCodeAllocator:
+    """Per-process cache of reserved risk-code numbers, refilled in blocks."""
+
+    def __init__(self, block_size=20):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._year = None
+        self._next = 0      # next number to hand out
+        self._end = 0       # first number not reserved by this worker
+        self._seeded = set()
+        self.stats = {'allocated': 0, 'reservations': 0}
+
+    def allocate(self, count=1, year=None):
+        """Return `count` new risk codes for `year` (default: the current year)."""
+        year = year or date.today().year
+        with self._lock:
+            if self._pid != os.getpid() or self._year != year:
+                # Never reuse a block inherited across fork, or carry one into a new year
+                self._pid, self._year = os.getpid(), year
+                self._next = self._end = 0
+
+            if count > self._end - self._next:
+                if count >= self.block_size:
+                    # Large requests get their own contiguous range; keep the current block
+                    start = self._reserve(year, count)
+                    numbers = range(start, start + count)
+                    self.stats['allocated'] += count
+                    return [CODE_FORMAT.format(year=year, number=n) for n in numbers]
+                self._next = self._reserve(year, self.block_size)
+                self._end = self._next + self.block_size
+
+            numbers = range(self._next, self._next + count)
+            self._next += count
+            self.stats['allocated'] += count
+            return [CODE_FORMAT.format(year=year, number=n) for n in numbers]
+
+    def next_code(self, year=None):
+        return self.allocate(1, year)[0]
+
+    def _reserve(self, year, count):
+        """Atomically advance the year's counter by count; returns the first number."""
+        conn = db.get_connection()
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            seed = year not in self._seeded
+            for attempt in range(2):
+                if seed:
+                    cursor.execute(SEED_SQL, (year, 'RISK-{}-%'.format(year)))
+                cursor.execute(RESERVE_SQL, (count, year))
+                if cursor.rowcount == 1:
+                    break
+                # No counter row (seed rolled back, row deleted): LAST_INSERT_ID()
+                # would be this connection's stale value, so seed and try again
+                seed = True
+            else:
+                raise RuntimeError('No risk_code_sequences row for {}'.format(year))
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            new_next = cursor.fetchone()[0]
+            conn.commit()
+            self._seeded.add(year)
+            self.stats['reservations'] += 1
+            return new_next - count
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if cursor is not None:
+                cursor.close()
+            db.release_connection(conn)
+
+risk_codes = RiskCodeAllocator(block_size=Config.RISK_CODE_BLOCK_SIZE)
@@ -0,0 +1,104 @@
+"""
+Risk heat-map aggregate - PaySecure Technologies GRC Platform
+The 5×5 probability × impact matrix is computed in SQL (GROUP BY for the
+counts, ROW_NUMBER() for the top-N risks per cell) and cached as a
+serialised JSON payload with its ETag, so serving it costs the same at 20
+risks or 20,000.
+Risk write paths call invalidate_heatmap(); HEATMAP_CACHE_TTL bounds how long
+other workers can serve a stale matrix with the in-process cache backend.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from app.cache import cache
+from app.db import db
+from config.settings import Config
+
+KEY_PREFIX = 'risk:heatmap:'
+
+CELL_COUNTS_SQL = """
+    SELECT probability, impact, risk_level, COUNT(*) AS n
+    FROM risks
+    GROUP BY probability, impact, risk_level
+"""
+
+# MySQL 8 window function: the highest-scoring risks in each cell
+CELL_TOP_SQL = """
+    SELECT probability, impact, risk_id, risk_code, risk_title, risk_level
+    FROM (
+        SELECT probability, impact, risk_id, risk_code, risk_title, risk_level,
+               ROW_NUMBER() OVER (PARTITION BY probability, impact
+                                  ORDER BY risk_score DESC, risk_id DESC) AS rn
+        FROM risks
+    ) ranked
+    WHERE rn <= %s
+    ORDER BY probability, impact, rn
+"""
+
+
+def _build(top_n):
+    """Heat-map payload: matrix[impact-1][probability-1] holds the cell's top risks."""
+    counts = [[0] * 5 for _ in range(5)]
+    matrix = [[[] for _ in range(5)] for _ in range(5)]
+    level_counts = {'Low': 0, 'Medium': 0, 'High': 0}
+
+    for row in db.execute_query(CELL_COUNTS_SQL, fetch=True):
+        n = int(row['n'])
+        counts[row['impact'] - 1][row['probability'] - 1] += n
+        level_counts[row['risk_level']] = level_counts.get(row['risk_level'], 0) + n
+
+    if top_n:
+        for row in db.execute_query(CELL_TOP_SQL, (top_n,), fetch=True, prepared=True):
+            matrix[row['impact'] - 1][row['probability'] - 1].append({
+                'id':    row['risk_id'],
+                'code':  row['risk_code'],
+                'title': row['risk_title'],
+                'level': row['risk_level'],
+            })
+
+    return {
+        'matrix':       matrix,
+        'cell_counts':  counts,
+        'level_counts': level_counts,
+        'total_risks':  sum(level_counts.values()),
+        'top_n':        top_n,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def get_heatmap(top_n=3):
+    """
+    Cached heat-map as (payload dict, JSON bytes, ETag value). The dict is shared
+    between callers and must be treated as read-only.
+    """
+    top_n = max(0, min(int(top_n), Config.HEATMAP_MAX_TOP_N))
+
+    def load():
+        payload = _build(top_n)
+        # ETag over the data only, so a rebuild with no changes still revalidates
+        data = dict(payload, generated_at=None)
+        etag = hashlib.sha1(json.dumps(data, separators=(',', ':')).encode('utf-8')).hexdigest()
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return payload, body, etag
+
+    return cache.get_or_load(KEY_PREFIX + str(top_n), load, ttl=Config.HEATMAP_CACHE_TTL)
+
+
+def heatmap_cells(payload):
+    """'<p>_<i>' -> {'count', 'codes'} for the register template's matrix."""
+    cells = {}
+    for i in range(5):
+        for p in range(5):
+            count = payload['cell_counts'][i][p]
+            if count:
+                cells['{}_{}'.format(p + 1, i + 1)] = {
+                    'count': count,
+                    'codes': [r['code'] for r in payload['matrix'][i][p]],
+                }
+    return cells
+
+
+def invalidate_heatmap():
+    """Drop every cached heat-map variant (call after any risk write)."""
+    cache.invalidate_prefix(KEY_PREFIX)
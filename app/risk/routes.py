@@ -3,15 +3,28 @@ Risk Management routes - PaySecure Technologies GRC Platform
 Handles risk register CRUD, heat-map data, and status lifecycle transitions.
 Compatible with Python 3.8+ (no backslashes inside f-string expressions).
 """
+import base64
+import binascii
 import json
 import traceback
+from datetime import date, datetime
 
-from flask import (Blueprint, render_template, request,
+from flask import (Blueprint, Response, render_template, request,
                    redirect, url_for, flash, jsonify, session)
+from werkzeug.datastructures import MultiDict
 
+from app.audit.writer import audit_writer
 from app.auth.utils import login_required, any_role_required
+from app.compliance.graph import control_graph
+from app.dashboard.metrics import dashboard_metrics
 from app.db import db
+from app.reference import get_active_users, get_risk_categories
+from config.settings import Config
 from . import risk_bp
+from .codes import risk_codes
+from .heatmap import get_heatmap, heatmap_cells, invalidate_heatmap
+from .ingest import IngestError, detect_format, import_text
+from . import simulation, snapshots
 
 # Valid lifecycle transitions
 RISK_LIFECYCLE = [
@@ -21,23 +34,179 @@ RISK_LIFECYCLE = [
 
 
 def _log(action, entity_type, entity_id, details_dict):
-    """Write a JSON-serialised audit record."""
+    """Queue a JSON-serialised audit record for the background writer."""
+    audit_writer.submit(
+        session.get('user_id'),
+        action,
+        entity_type,
+        entity_id,
+        details_dict,
+        request.remote_addr,
+    )
+
+
+# ── Register query (keyset pagination) ───────────────────────────────────────
+# Pages seek past the last row of the previous page on (sort column, risk_id),
+# backed by the idx_risks_* indexes (migration 006). TEXT columns are never
+# part of a list page; they are fetched per risk from /api/risks/<id>.
+
+REGISTER_PAGE_SIZE = 50
+API_PAGE_SIZE      = 100
+API_MAX_PAGE       = 500
+RISK_LEVELS        = ('High', 'Medium', 'Low')
+
+LIST_FIELDS = {
+    # name: (SQL expression, join alias it needs)
+    'risk_id':         ('r.risk_id', None),
+    'risk_code':       ('r.risk_code', None),
+    'risk_title':      ('r.risk_title', None),
+    'probability':     ('r.probability', None),
+    'impact':          ('r.impact', None),
+    'risk_score':      ('r.risk_score', None),
+    'risk_level':      ('r.risk_level', None),
+    'status':          ('r.status', None),
+    'treatment_type':  ('r.treatment_type', None),
+    'review_date':     ('r.review_date', None),
+    'created_at':      ('r.created_at', None),
+    'updated_at':      ('r.updated_at', None),
+    'category_id':     ('r.category_id', None),
+    'risk_owner_id':   ('r.risk_owner_id', None),
+    'category_name':   ('rc.category_name', 'rc'),
+    'nist_csf_domain': ('rc.nist_csf_domain', 'rc'),
+    'owner_name':      ('u.full_name', 'u'),
+    'owner_title':     ('u.job_title', 'u'),
+    'owner_dept':      ('u.department', 'u'),
+}
+DETAIL_SQL = (
+    "SELECT risk_id, risk_code, risk_description, business_impact, mitigation_plan "
+    "FROM risks WHERE risk_id = %s"
+)
+JOINS = {
+    # LEFT joins so the projection never changes which risks are returned
+    'rc': 'LEFT JOIN risk_categories rc ON r.category_id = rc.category_id',
+    'u':  'LEFT JOIN users u            ON r.risk_owner_id = u.user_id',
+}
+SORTS = {
+    # name: (column, cursor value parser)
+    'score':   ('r.risk_score', int),
+    'created': ('r.created_at', lambda v: datetime.strptime(v, '%Y-%m-%d %H:%M:%S')),
+    'updated': ('r.updated_at', lambda v: datetime.strptime(v, '%Y-%m-%d %H:%M:%S')),
+    'code':    ('r.risk_code', str),
+}
+
+
+def _csv_arg(args, name, allowed=None, cast=str):
+    """Comma-separated (or repeated) query arg as a list; ValueError on bad values."""
+    values = []
+    for raw in args.getlist(name):
+        values.extend(v.strip() for v in raw.split(',') if v.strip())
+    if allowed is not None and any(v not in allowed for v in values):
+        raise ValueError('Invalid {} filter'.format(name))
     try:
-        db.execute_query(
-            """INSERT INTO audit_logs
-               (user_id, action, entity_type, entity_id, details, ip_address)
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (
-                session.get('user_id'),
-                action,
-                entity_type,
-                entity_id,
-                json.dumps(details_dict),
-                request.remote_addr,
-            ),
-        )
-    except Exception as exc:
-        print(f"Audit log error: {exc}")
+        return [cast(v) for v in values]
+    except ValueError:
+        raise ValueError('Invalid {} filter'.format(name))
+
+
+def _register_filters(args):
+    """Translate query-string filters into (conditions, params)."""
+    conditions, params = [], []
+    for name, column, allowed, cast in (
+        ('level',       'r.risk_level',    RISK_LEVELS,    str),
+        ('status',      'r.status',        RISK_LIFECYCLE, str),
+        ('category_id', 'r.category_id',   None,           int),
+        ('owner_id',    'r.risk_owner_id', None,           int),
+    ):
+        values = _csv_arg(args, name, allowed, cast)
+        if values:
+            conditions.append('{} IN ({})'.format(column, ', '.join(['%s'] * len(values))))
+            params.extend(values)
+    return conditions, params
+
+
+def _encode_risk_cursor(sort, direction, value, risk_id):
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    raw = json.dumps([sort, direction, value, risk_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_risk_cursor(token, sort, direction):
+    """Return (sort value, risk_id); ValueError if malformed or from another ordering."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        c_sort, c_dir, value, risk_id = json.loads(base64.urlsafe_b64decode(padded))
+        if (c_sort, c_dir) != (sort, direction):
+            raise ValueError
+        return SORTS[sort][1](value), int(risk_id)
+    except (TypeError, ValueError, KeyError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+
+def _fetch_risk_page(args, cursor=None, limit=REGISTER_PAGE_SIZE):
+    """
+    One page of the register for the given filters / sort / fields, plus the
+    cursor for the next page (None at the end). ValueError on bad arguments.
+    """
+    fields = _csv_arg(args, 'fields', LIST_FIELDS) or list(LIST_FIELDS)
+    sort = args.get('sort', 'score')
+    direction = args.get('dir', 'desc').lower()
+    if sort not in SORTS or direction not in ('asc', 'desc'):
+        raise ValueError('Invalid sort')
+    sort_col = SORTS[sort][0]
+
+    conditions, params = _register_filters(args)
+    if cursor:
+        value, risk_id = _decode_risk_cursor(cursor, sort, direction)
+        op = '<' if direction == 'desc' else '>'
+        conditions.append('({col} {op} %s OR ({col} = %s AND r.risk_id {op} %s))'.format(
+            col=sort_col, op=op))
+        params.extend([value, value, risk_id])
+
+    aliases = {LIST_FIELDS[f][1] for f in fields} - {None}
+    columns = ['{} AS {}'.format(LIST_FIELDS[f][0], f) for f in fields]
+    columns += ['r.risk_id AS _rid', '{} AS _sk'.format(sort_col)]
+
+    rows = db.execute_query(
+        """SELECT {columns}
+           FROM risks r
+           {joins}
+           {where}
+           ORDER BY {col} {dir}, r.risk_id {dir}
+           LIMIT %s""".format(
+            columns=', '.join(columns),
+            joins='\n'.join(JOINS[a] for a in sorted(aliases)),
+            where='WHERE ' + ' AND '.join(conditions) if conditions else '',
+            col=sort_col,
+            dir=direction.upper(),
+        ),
+        tuple(params) + (limit + 1,),
+        fetch=True,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_risk_cursor(sort, direction, last['_sk'], last['_rid'])
+    page = []
+    for row in rows[:limit]:
+        row.pop('_rid')
+        row.pop('_sk')
+        page.append(row)
+    return page, next_cursor
+
+
+def _jsonable(row):
+    return {k: (v.isoformat() if isinstance(v, (date, datetime)) else v) for k, v in row.items()}
+
+
+def _register_counts():
+    """Total and per-level risk counts from one grouped scan."""
+    rows = db.execute_query(
+        "SELECT risk_level, COUNT(*) AS n FROM risks GROUP BY risk_level", fetch=True)
+    counts = {'High': 0, 'Medium': 0, 'Low': 0}
+    for r in rows:
+        counts[r['risk_level']] = int(r['n'])
+    return counts, sum(counts.values())
 
 
 # ── Risk Register ────────────────────────────────────────────────────────────
@@ -45,48 +214,39 @@ def _log(action, entity_type, entity_id, details_dict):
 @risk_bp.route('/register')
 @login_required
 def register():
-    """Risk register – full list with server-side heatmap data."""
+    """Risk register – KPI counts, heat-map and the first page of the inventory."""
+    filters = {
+        'level':       request.args.get('level', ''),
+        'status':      request.args.get('status', ''),
+        'category_id': request.args.get('category_id', ''),
+        'owner_id':    request.args.get('owner_id', ''),
+        'sort':        request.args.get('sort', 'score'),
+        'dir':         request.args.get('dir', 'desc'),
+    }
     try:
-        risks = db.execute_query(
-            """
-            SELECT r.risk_id, r.risk_code, r.risk_title, r.risk_description,
-                   r.probability, r.impact, r.risk_score, r.risk_level,
-                   r.status, r.treatment_type, r.business_impact,
-                   r.review_date, r.created_at, r.updated_at,
-                   rc.category_name, rc.nist_csf_domain,
-                   u.full_name  AS owner_name,
-                   u.job_title  AS owner_title,
-                   u.department AS owner_dept
-            FROM risks r
-            INNER JOIN risk_categories rc ON r.category_id = rc.category_id
-            INNER JOIN users u            ON r.risk_owner_id = u.user_id
-            ORDER BY r.risk_score DESC, r.created_at DESC
-            """,
-            fetch=True,
-        )
-
-        categories = db.execute_query(
-            "SELECT category_id, category_name, nist_csf_domain "
-            "FROM risk_categories ORDER BY category_name",
-            fetch=True,
-        )
-        users = db.execute_query(
-            "SELECT user_id, full_name, job_title "
-            "FROM users WHERE is_active = TRUE ORDER BY full_name",
-            fetch=True,
-        )
+        try:
+            risks, next_cursor = _fetch_risk_page(request.args)
+        except ValueError as exc:
+            flash('{} – showing the unfiltered register.'.format(exc), 'warning')
+            filters = {'sort': 'score', 'dir': 'desc'}
+            risks, next_cursor = _fetch_risk_page(MultiDict())
 
-        counts = {'High': 0, 'Medium': 0, 'Low': 0}
-        for r in risks:
-            counts[r['risk_level']] = counts.get(r['risk_level'], 0) + 1
+        counts, total = _register_counts()
+        categories = get_risk_categories()
+        users = get_active_users()
 
         return render_template(
             'risk/register.html',
             risks=risks,
+            next_cursor=next_cursor,
+            total_risks=total,
+            heatmap=heatmap_cells(get_heatmap()[0]),
             categories=categories,
             users=users,
             counts=counts,
             lifecycle=RISK_LIFECYCLE,
+            filters=filters,
+            page_size=REGISTER_PAGE_SIZE,
         )
 
     except Exception:
@@ -94,10 +254,57 @@ def register():
         flash('Error loading risk register.', 'danger')
         return render_template(
             'risk/register.html',
-            risks=[], categories=[], users=[],
+            risks=[], next_cursor=None, total_risks=0, heatmap={},
+            categories=[], users=[],
             counts={'High': 0, 'Medium': 0, 'Low': 0},
             lifecycle=RISK_LIFECYCLE,
+            filters={},
+            page_size=REGISTER_PAGE_SIZE,
+        )
+
+
+@risk_bp.route('/api/risks')
+@login_required
+def risks_api():
+    """
+    JSON page of the risk register.
+    Filters: level, status, category_id, owner_id (comma-separated lists).
+    Sorting: sort=score|created|updated|code, dir=asc|desc.
+    Paging: ?cursor= from the previous page's next_cursor, ?limit= (max 500).
+    Projection: ?fields=risk_code,risk_title,... (TEXT fields via /api/risks/<id>).
+    """
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE))
+    try:
+        risks, next_cursor = _fetch_risk_page(
+            request.args, request.args.get('cursor'), limit)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+    return jsonify({
+        'risks':       [_jsonable(r) for r in risks],
+        'next_cursor': next_cursor,
+    })
+
+
+@risk_bp.route('/api/risks/<int:risk_id>')
+@login_required
+def risk_detail_api(risk_id):
+    """Long-text fields of one risk, loaded on demand by the register."""
+    try:
+        rows = db.execute_query(
+            DETAIL_SQL,
+            (risk_id,),
+            fetch=True,
+            prepared=True,
         )
+    except Exception as exc:
+        return jsonify({'error': str(exc)}), 500
+    if not rows:
+        return jsonify({'error': 'Risk not found'}), 404
+    return jsonify(_jsonable(rows[0]))
 
 
 # ── Create Risk ──────────────────────────────────────────────────────────────
@@ -135,12 +342,8 @@ def create():
             flash('Probability and Impact must be integers between 1 and 5.', 'danger')
             return redirect(url_for('risk.register'))
 
-        # Generate risk_code
-        max_id = (
-            db.execute_query("SELECT MAX(risk_id) AS m FROM risks", fetch=True)[0]['m']
-            or 0
-        )
-        risk_code = "RISK-2025-{:03d}".format(max_id + 1)
+        # Race-free code from the per-year sequence (no MAX scan, no lock held here)
+        risk_code = risk_codes.next_code()
 
         risk_id = db.execute_query(
             """INSERT INTO risks
@@ -158,6 +361,9 @@ def create():
         score = probability * impact
         level = 'High' if score >= 16 else ('Medium' if score >= 6 else 'Low')
         username = session.get('username', 'unknown')
+        dashboard_metrics.on_risk_created(level, score, 'Identified', int(category_id))
+        control_graph.on_risk_created(risk_id, risk_code, risk_title, score, level, 'Identified')
+        invalidate_heatmap()
 
         _log('RISK_CREATED', 'risks', risk_id, {
             'risk_code':   risk_code,
@@ -181,6 +387,48 @@ def create():
         return redirect(url_for('risk.register'))
 
 
+# ── Bulk Import ──────────────────────────────────────────────────────────────
+
+@risk_bp.route('/import', methods=['POST'])
+@any_role_required('admin', 'risk_manager')
+def bulk_import():
+    """
+    Bulk-load risks from CSV or JSON Lines (multipart field `file`, or the raw
+    request body). Query flags: dry_run=1 validates only, skip_invalid=1
+    inserts the valid rows even when others fail. Returns a JSON summary.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        raw, filename, ctype = upload.read(), upload.filename, upload.mimetype
+    else:
+        raw, filename, ctype = request.get_data(), None, request.mimetype
+    fmt = request.args.get('format') or detect_format(filename, ctype)
+
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Import file must be UTF-8 encoded.'}), 400
+
+    try:
+        summary = import_text(
+            text, fmt,
+            created_by=session.get('user_id'),
+            ip_address=request.remote_addr,
+            source=filename or 'request-body',
+            dry_run=request.args.get('dry_run') == '1',
+            skip_invalid=request.args.get('skip_invalid') == '1',
+            default_owner_id=session.get('user_id'),
+        )
+    except IngestError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+
+    status = 422 if summary['invalid'] and not summary['inserted'] and not summary['dry_run'] else 200
+    return jsonify(summary), status
+
+
 # ── Update Status ────────────────────────────────────────────────────────────
 
 @risk_bp.route('/update-status/<int:risk_id>', methods=['POST'])
@@ -193,23 +441,29 @@ def update_status(risk_id):
             flash('Invalid status value.', 'danger')
             return redirect(url_for('risk.register'))
 
-        risk = db.execute_query(
-            "SELECT risk_code, risk_title, status FROM risks WHERE risk_id = %s",
-            (risk_id,),
-            fetch=True,
-        )
-        if not risk:
-            flash('Risk not found.', 'danger')
-            return redirect(url_for('risk.register'))
+        with db.transaction():
+            # Lock the row so the logged previous_status is the one we replace
+            risk = db.execute_query(
+                "SELECT risk_code, risk_title, status FROM risks "
+                "WHERE risk_id = %s FOR UPDATE",
+                (risk_id,),
+                fetch=True,
+            )
+            if not risk:
+                flash('Risk not found.', 'danger')
+                return redirect(url_for('risk.register'))
 
-        old_status = risk[0]['status']
-        risk_code  = risk[0]['risk_code']
-        risk_title = risk[0]['risk_title']
+            old_status = risk[0]['status']
+            risk_code  = risk[0]['risk_code']
+            risk_title = risk[0]['risk_title']
 
-        db.execute_query(
-            "UPDATE risks SET status = %s, updated_at = NOW() WHERE risk_id = %s",
-            (new_status, risk_id),
-        )
+            db.execute_query(
+                "UPDATE risks SET status = %s, updated_at = NOW() WHERE risk_id = %s",
+                (new_status, risk_id),
+            )
+        dashboard_metrics.on_risk_status_changed(old_status, new_status)
+        control_graph.on_risk_status_changed(risk_id, new_status)
+        invalidate_heatmap()
 
         _log('RISK_STATUS_UPDATED', 'risks', risk_id, {
             'risk_code':       risk_code,
@@ -238,7 +492,8 @@ def delete(risk_id):
     """Hard-delete a risk and its mappings (admin only)."""
     try:
         risk = db.execute_query(
-            "SELECT risk_code, risk_title FROM risks WHERE risk_id = %s",
+            "SELECT risk_code, risk_title, risk_level, risk_score, status, category_id "
+            "FROM risks WHERE risk_id = %s",
             (risk_id,),
             fetch=True,
         )
@@ -249,10 +504,17 @@ def delete(risk_id):
         risk_code  = risk[0]['risk_code']
         risk_title = risk[0]['risk_title']
 
-        db.execute_query(
-            "DELETE FROM risk_compliance_mapping WHERE risk_id = %s", (risk_id,)
+        with db.transaction():
+            db.execute_query(
+                "DELETE FROM risk_compliance_mapping WHERE risk_id = %s", (risk_id,)
+            )
+            db.execute_query("DELETE FROM risks WHERE risk_id = %s", (risk_id,))
+        dashboard_metrics.on_risk_deleted(
+            risk[0]['risk_level'], risk[0]['risk_score'],
+            risk[0]['status'], risk[0]['category_id'],
         )
-        db.execute_query("DELETE FROM risks WHERE risk_id = %s", (risk_id,))
+        control_graph.on_risk_deleted(risk_id)
+        invalidate_heatmap()
 
         _log('RISK_DELETED', 'risks', risk_id, {
             'risk_code':  risk_code,
@@ -273,36 +535,90 @@ def delete(risk_id):
 @risk_bp.route('/heatmap-data')
 @login_required
 def heatmap_data():
-    """Return 5×5 heatmap matrix as JSON for dynamic chart rendering."""
+    """
+    5×5 heat-map as JSON: cell_counts[impact-1][prob-1], the top ?top=N
+    (default 3) risks per cell in matrix[impact-1][prob-1], and level counts.
+    Served from cache with an ETag; If-None-Match gets a 304.
+    """
     try:
-        risks = db.execute_query(
-            "SELECT probability, impact, risk_level, risk_title, risk_code, risk_id "
-            "FROM risks",
-            fetch=True,
-        )
+        _, body, etag = get_heatmap(request.args.get('top', 3, type=int))
+    except Exception as exc:
+        return jsonify({'error': str(exc)}), 500
 
-        # matrix[impact_idx 0-4][prob_idx 0-4]  (0-indexed)
-        matrix = [[[] for _ in range(5)] for _ in range(5)]
-        level_counts = {'Low': 0, 'Medium': 0, 'High': 0}
-
-        for risk in risks:
-            p = risk['probability'] - 1
-            i = risk['impact'] - 1
-            matrix[i][p].append({
-                'id':    risk['risk_id'],
-                'code':  risk['risk_code'],
-                'title': risk['risk_title'],
-                'level': risk['risk_level'],
-            })
-            level_counts[risk['risk_level']] = (
-                level_counts.get(risk['risk_level'], 0) + 1
-            )
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
-        return jsonify({
-            'matrix':       matrix,
-            'level_counts': level_counts,
-            'total_risks':  len(risks),
-        })
 
+@risk_bp.route('/api/heatmap/history')
+@login_required
+def heatmap_history():
+    """
+    Daily heat-map snapshots between ?from= and ?to= (YYYY-MM-DD, inclusive;
+    default the last 90 days), oldest first.
+    """
+    try:
+        default_start, default_end = snapshots.default_range()
+        start = snapshots.parse_day(request.args.get('from'), default_start)
+        end = snapshots.parse_day(request.args.get('to'), default_end)
+    except ValueError:
+        return jsonify({'error': 'from/to must be dates in YYYY-MM-DD format'}), 400
+    if start > end:
+        return jsonify({'error': 'from must not be after to'}), 400
+    if (end - start).days > Config.RISK_SNAPSHOT_MAX_DAYS:
+        return jsonify({'error': 'range is limited to {} days'.format(
+            Config.RISK_SNAPSHOT_MAX_DAYS)}), 400
+
+    try:
+        items = snapshots.get_range(start, end)
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    return jsonify({'from': start.isoformat(), 'to': end.isoformat(),
+                    'count': len(items), 'snapshots': items})
+
+
+@risk_bp.route('/api/heatmap/diff')
+@login_required
+def heatmap_diff():
+    """
+    Change in the heat-map between the snapshots in effect on ?from= and ?to=
+    (each resolves to the latest snapshot on or before that date).
+    """
+    try:
+        start = snapshots.parse_day(request.args.get('from'))
+        end = snapshots.parse_day(request.args.get('to'), date.today())
+    except ValueError:
+        return jsonify({'error': 'from/to must be dates in YYYY-MM-DD format'}), 400
+
+    try:
+        result = snapshots.diff(start, end)
     except Exception as exc:
-        return jsonify({'error': str(exc)}), 500
\ No newline at end of file
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    if result is None:
+        return jsonify({'error': 'no snapshot on or before {}'.format(
+            min(start, end).isoformat())}), 404
+    return jsonify(result)
+
+
+# ── Quantitative risk (Monte Carlo) ──────────────────────────────────────────
+
+@risk_bp.route('/api/simulation')
+@any_role_required('admin', 'risk_manager', 'auditor')
+def simulation_api():
+    """
+    Annual loss distribution for the open register: exceedance curve,
+    percentiles and per-category VaR. Optional ?trials= and ?seed=; results
+    are cached until the register changes.
+    """
+    try:
+        trials = request.args.get('trials', type=int)
+        seed = request.args.get('seed', type=int)
+        if seed is not None and seed < 0:
+            return jsonify({'error': 'seed must be a non-negative integer'}), 400
+        return jsonify(simulation.get_simulation(trials=trials, seed=seed))
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
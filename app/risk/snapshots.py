@@ -0,0 +1,269 @@
+"""
+Risk heat-map snapshots - PaySecure Technologies GRC Platform
+Captures the 5×5 matrix, level counts and per-category scores once a day into
+risk_heatmap_snapshots, so "what did the register look like last quarter" is a
+primary-key range read instead of a replay of audit_logs.
+- One row per day; the matrix and category aggregates are packed into fixed
+  little-endian binary columns (see scripts/migrations/007)
+- A background thread takes today's snapshot once RISK_SNAPSHOT_HOUR has
+  passed; every worker runs it, the first to capture wins (INSERT IGNORE)
+- scripts/snapshot_heatmap.py captures on demand (cron) and queries history
+"""
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from app.db import db
+from app.reference import get_risk_categories
+from config.settings import Config
+from .heatmap import _build
+
+CELLS = struct.Struct('<25I')
+CATEGORY = struct.Struct('<IIIIB')   # category_id, risks, score_sum, high_risks, max_score
+
+CATEGORY_STATS_SQL = """
+    SELECT COALESCE(category_id, 0) AS category_id,
+           COUNT(*) AS risks,
+           SUM(risk_score) AS score_sum,
+           SUM(risk_level = 'High') AS high_risks,
+           MAX(risk_score) AS max_score,
+           SUM(status NOT IN ('Accepted', 'Closed')) AS open_risks
+    FROM risks
+    GROUP BY COALESCE(category_id, 0)
+"""
+
+SNAPSHOT_COLUMNS = ("snapshot_date, total_risks, high_risks, medium_risks, low_risks, "
+                    "open_risks, cell_counts, category_stats, captured_at")
+
+INSERT_SQL = """INSERT {ignore}INTO risk_heatmap_snapshots
+    (snapshot_date, total_risks, high_risks, medium_risks, low_risks,
+     open_risks, cell_counts, category_stats)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+INSERT_IGNORE_SQL = INSERT_SQL.format(ignore='IGNORE ')
+UPSERT_SQL = INSERT_SQL.format(ignore='') + """
+    ON DUPLICATE KEY UPDATE
+        total_risks = VALUES(total_risks), high_risks = VALUES(high_risks),
+        medium_risks = VALUES(medium_risks), low_risks = VALUES(low_risks),
+        open_risks = VALUES(open_risks), cell_counts = VALUES(cell_counts),
+        category_stats = VALUES(category_stats)"""
+
+RANGE_SQL = ("SELECT " + SNAPSHOT_COLUMNS + " FROM risk_heatmap_snapshots "
+             "WHERE snapshot_date BETWEEN %s AND %s ORDER BY snapshot_date")
+
+# Latest snapshot on or before a date (PK range scan, one row)
+AS_OF_SQL = ("SELECT " + SNAPSHOT_COLUMNS + " FROM risk_heatmap_snapshots "
+             "WHERE snapshot_date <= %s ORDER BY snapshot_date DESC LIMIT 1")
+
+EXISTS_SQL = "SELECT 1 AS found FROM risk_heatmap_snapshots WHERE snapshot_date = %s"
+
+
+# ── Packing ──────────────────────────────────────────────────────────────────
+
+def pack_cells(cell_counts):
+    """5×5 cell_counts[impact-1][prob-1] -> 100 bytes."""
+    return CELLS.pack(*(n for row in cell_counts for n in row))
+
+
+def unpack_cells(blob):
+    flat = CELLS.unpack(bytes(blob))
+    return [list(flat[i * 5:i * 5 + 5]) for i in range(5)]
+
+
+def pack_categories(rows):
+    return b''.join(CATEGORY.pack(int(r['category_id']), int(r['risks']),
+                                  int(r['score_sum'] or 0), int(r['high_risks'] or 0),
+                                  int(r['max_score'] or 0))
+                    for r in rows)
+
+
+def unpack_categories(blob):
+    """Packed category stats -> {category_id: {'risks', 'score_sum', 'high_risks', 'max_score'}}."""
+    out = {}
+    for cid, risks, score_sum, high, max_score in CATEGORY.iter_unpack(bytes(blob or b'')):
+        out[cid] = {'risks': risks, 'score_sum': score_sum,
+                    'high_risks': high, 'max_score': max_score}
+    return out
+
+
+def decode(row):
+    """A risk_heatmap_snapshots row -> JSON-ready snapshot dict."""
+    names = {c['category_id']: c['category_name'] for c in get_risk_categories()}
+    categories = []
+    for cid, stats in sorted(unpack_categories(row['category_stats']).items()):
+        categories.append(dict(
+            stats,
+            category_id=cid or None,
+            category_name=names.get(cid, 'Uncategorised' if not cid else str(cid)),
+            avg_score=round(stats['score_sum'] / stats['risks'], 2) if stats['risks'] else 0,
+        ))
+    return {
+        'date':         row['snapshot_date'].isoformat(),
+        'cell_counts':  unpack_cells(row['cell_counts']),
+        'level_counts': {'High':   row['high_risks'],
+                         'Medium': row['medium_risks'],
+                         'Low':    row['low_risks']},
+        'total_risks':  row['total_risks'],
+        'open_risks':   row['open_risks'],
+        'categories':   categories,
+        'captured_at':  row['captured_at'].isoformat(timespec='seconds')
+                        if row.get('captured_at') else None,
+    }
+
+
+# ── Capture and queries ──────────────────────────────────────────────────────
+
+def capture(snapshot_date=None, replace=True):
+    """
+    Snapshot the live register under snapshot_date (default: today).
+    replace=False keeps an existing row for the day. Returns the row's values.
+    """
+    snapshot_date = snapshot_date or date.today()
+    heatmap = _build(0)
+    categories = db.execute_query(CATEGORY_STATS_SQL, fetch=True)
+    levels = heatmap['level_counts']
+    params = (
+        snapshot_date,
+        heatmap['total_risks'],
+        levels.get('High', 0), levels.get('Medium', 0), levels.get('Low', 0),
+        sum(int(r['open_risks'] or 0) for r in categories),
+        pack_cells(heatmap['cell_counts']),
+        pack_categories(categories),
+    )
+    db.execute_query(UPSERT_SQL if replace else INSERT_IGNORE_SQL, params)
+    return params
+
+
+def snapshot_exists(snapshot_date):
+    return bool(db.execute_query(EXISTS_SQL, (snapshot_date,), fetch=True, prepared=True))
+
+
+def get_range(start, end):
+    """Decoded snapshots with start <= date <= end, oldest first."""
+    rows = db.execute_query(RANGE_SQL, (start, end), fetch=True, prepared=True)
+    return [decode(r) for r in rows]
+
+
+def get_as_of(day):
+    """The latest snapshot taken on or before `day`, or None."""
+    rows = db.execute_query(AS_OF_SQL, (day,), fetch=True, prepared=True)
+    return decode(rows[0]) if rows else None
+
+
+def diff(start, end):
+    """
+    Change between the snapshots in effect on two dates. Returns None if
+    either date predates the first snapshot.
+    """
+    a, b = get_as_of(start), get_as_of(end)
+    if a is None or b is None:
+        return None
+
+    cells = [[b['cell_counts'][i][p] - a['cell_counts'][i][p] for p in range(5)]
+             for i in range(5)]
+    changed_cells = [
+        {'probability': p + 1, 'impact': i + 1,
+         'from': a['cell_counts'][i][p], 'to': b['cell_counts'][i][p], 'delta': cells[i][p]}
+        for i in range(5) for p in range(5) if cells[i][p]
+    ]
+
+    before = {c['category_id']: c for c in a['categories']}
+    after = {c['category_id']: c for c in b['categories']}
+    empty = {'risks': 0, 'high_risks': 0, 'avg_score': 0, 'max_score': 0}
+    categories = []
+    for cid in sorted(set(before) | set(after), key=lambda c: c or 0):
+        old, new = before.get(cid, empty), after.get(cid, empty)
+        categories.append({
+            'category_id':   cid,
+            'category_name': (new if cid in after else old)['category_name'],
+            'risks':         {'from': old['risks'], 'to': new['risks'],
+                              'delta': new['risks'] - old['risks']},
+            'high_risks':    {'from': old['high_risks'], 'to': new['high_risks'],
+                              'delta': new['high_risks'] - old['high_risks']},
+            'avg_score':     {'from': old['avg_score'], 'to': new['avg_score'],
+                              'delta': round(new['avg_score'] - old['avg_score'], 2)},
+            'max_score':     {'from': old['max_score'], 'to': new['max_score']},
+        })
+
+    return {
+        'from':          a['date'],
+        'to':            b['date'],
+        'cell_delta':    cells,
+        'changed_cells': changed_cells,
+        'level_delta':   {k: b['level_counts'][k] - a['level_counts'][k]
+                          for k in ('High', 'Medium', 'Low')},
+        'total_delta':   b['total_risks'] - a['total_risks'],
+        'open_delta':    b['open_risks'] - a['open_risks'],
+        'categories':    categories,
+    }
+
+
+# ── Scheduler ────────────────────────────────────────────────────────────────
+
+class SnapshotScheduler:
+    """Background thread that takes one snapshot per day after a given hour."""
+
+    def __init__(self, hour=1, check_interval=300):
+        self.hour = hour
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._last_date = None
+        self.stats = {'captured': 0, 'errors': 0, 'last_captured': None}
+
+    def start(self):
+        """Start the scheduler thread (idempotent, re-armed after fork)."""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='heatmap-snapshots', daemon=True)
+            self._thread.start()
+
+    def run_pending(self, now=None):
+        """Capture today's snapshot if it is due and missing. Returns True if taken."""
+        now = now or datetime.now()
+        today = now.date()
+        if now.hour < self.hour or self._last_date == today:
+            return False
+        if snapshot_exists(today):
+            self._last_date = today
+            return False
+        capture(today, replace=False)
+        self._last_date = today
+        self.stats['captured'] += 1
+        self.stats['last_captured'] = today.isoformat()
+        return True
+
+    def snapshot_stats(self):
+        return dict(self.stats, hour=self.hour)
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as exc:
+                self.stats['errors'] += 1
+                print("Heat-map snapshot error: {}".format(exc))
+            time.sleep(self.check_interval)
+
+
+def parse_day(value, default=None):
+    """YYYY-MM-DD -> date; raises ValueError on anything else."""
+    if not value:
+        if default is None:
+            raise ValueError('date is required (YYYY-MM-DD)')
+        return default
+    return date.fromisoformat(value)
+
+
+def default_range(days=90):
+    end = date.today()
+    return end - timedelta(days=days), end
+
+
+snapshot_scheduler = SnapshotScheduler(hour=Config.RISK_SNAPSHOT_HOUR,
+                                       check_interval=Config.RISK_SNAPSHOT_CHECK_INTERVAL)
@@ -0,0 +1,8 @@
+"""
+Search module blueprint
+"""
+from flask import Blueprint
+
+search_bp = Blueprint('search', __name__, url_prefix='/search')
+
+from . import routes
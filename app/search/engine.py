@@ -0,0 +1,186 @@
+"""
+Full-text search - PaySecure Technologies GRC Platform
+One query across the risk register, the control library and the audit trail,
+backed by InnoDB FULLTEXT indexes (scripts/migrations/008):
+- risks:               ft_risks_text (title, description, mitigation plan)
+- compliance_controls: ft_controls_text (code, name, description)
+- audit_log_search:    ft_audit_search_body, fed by the audit writer
+Words are matched as required prefixes ("+word*"), quoted text as a phrase.
+Results are ranked by MATCH() relevance within each source; facet counts
+(risk level, regulation, source) ignore the facet filters so they can drive
+a filter UI.
+"""
+import re
+import time
+
+from app.db import db
+
+SOURCES = ('risk', 'control', 'audit')
+MIN_TERM_LENGTH = 3     # innodb_ft_min_token_size: shorter words are never indexed
+MAX_TERMS = 10
+
+PHRASE_RE = re.compile(r'"([^"]+)"')
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+RISK_MATCH = "MATCH(r.risk_title, r.risk_description, r.mitigation_plan) AGAINST (%s IN BOOLEAN MODE)"
+CONTROL_MATCH = ("MATCH(c.control_code, c.control_name, c.control_description) "
+                 "AGAINST (%s IN BOOLEAN MODE)")
+AUDIT_MATCH = "MATCH(s.body) AGAINST (%s IN BOOLEAN MODE)"
+
+RISK_SQL = """
+    SELECT r.risk_id, r.risk_code, r.risk_title, r.risk_level, r.status,
+           LEFT(r.risk_description, 240) AS snippet, {match} AS score
+    FROM risks r
+    WHERE {match} {extra}
+    ORDER BY score DESC, r.risk_id DESC
+    LIMIT %s
+""".format(match=RISK_MATCH, extra='{extra}')
+RISK_FACET_SQL = """
+    SELECT r.risk_level AS facet, COUNT(*) AS n
+    FROM risks r
+    WHERE {match}
+    GROUP BY r.risk_level
+""".format(match=RISK_MATCH)
+
+CONTROL_SQL = """
+    SELECT c.control_id, c.control_code, c.control_name, c.regulation,
+           c.implementation_status, LEFT(c.control_description, 240) AS snippet,
+           {match} AS score
+    FROM compliance_controls c
+    WHERE c.is_active = TRUE AND {match} {extra}
+    ORDER BY score DESC, c.control_id DESC
+    LIMIT %s
+""".format(match=CONTROL_MATCH, extra='{extra}')
+CONTROL_FACET_SQL = """
+    SELECT c.regulation AS facet, COUNT(*) AS n
+    FROM compliance_controls c
+    WHERE c.is_active = TRUE AND {match}
+    GROUP BY c.regulation
+""".format(match=CONTROL_MATCH)
+
+AUDIT_SQL = """
+    SELECT s.log_id, s.action, s.entity_type, s.entity_id, s.created_at,
+           LEFT(s.body, 240) AS snippet, {match} AS score
+    FROM audit_log_search s
+    WHERE {match}
+    ORDER BY score DESC, s.log_id DESC
+    LIMIT %s
+""".format(match=AUDIT_MATCH)
+AUDIT_COUNT_SQL = "SELECT COUNT(*) AS n FROM audit_log_search s WHERE " + AUDIT_MATCH
+
+# Filtered variants are built once so prepared statements can be reused
+RISK_SQL_ALL = RISK_SQL.format(extra='')
+RISK_SQL_LEVEL = RISK_SQL.format(extra='AND r.risk_level = %s')
+CONTROL_SQL_ALL = CONTROL_SQL.format(extra='')
+CONTROL_SQL_REGULATION = CONTROL_SQL.format(extra='AND c.regulation = %s')
+
+
+def boolean_query(text):
+    """
+    User text -> InnoDB boolean-mode expression, or '' if nothing searchable.
+    Operators typed by the user are dropped rather than interpreted.
+    """
+    clauses = []
+    for phrase in PHRASE_RE.findall(text or ''):
+        words = WORD_RE.findall(phrase.lower())
+        if len(words) > 1:
+            clauses.append('+"{}"'.format(' '.join(words)))
+        elif words and len(words[0]) >= MIN_TERM_LENGTH:
+            clauses.append('+{}*'.format(words[0]))
+    for word in WORD_RE.findall(PHRASE_RE.sub(' ', text or '').lower()):
+        if len(word) >= MIN_TERM_LENGTH:
+            clauses.append('+{}*'.format(word))
+    seen = []
+    for clause in clauses:
+        if clause not in seen:
+            seen.append(clause)
+    return ' '.join(seen[:MAX_TERMS])
+
+
+def _risk_hits(expr, level, limit):
+    sql, params = (RISK_SQL_LEVEL, (expr, expr, level, limit)) if level \
+        else (RISK_SQL_ALL, (expr, expr, limit))
+    return [{
+        'type':   'risk',
+        'id':     r['risk_id'],
+        'code':   r['risk_code'],
+        'title':  r['risk_title'],
+        'level':  r['risk_level'],
+        'status': r['status'],
+        'snippet': r['snippet'] or '',
+        'score':  round(float(r['score']), 4),
+    } for r in db.execute_query(sql, params, fetch=True, prepared=True)]
+
+
+def _control_hits(expr, regulation, limit):
+    sql, params = (CONTROL_SQL_REGULATION, (expr, expr, regulation, limit)) if regulation \
+        else (CONTROL_SQL_ALL, (expr, expr, limit))
+    return [{
+        'type':       'control',
+        'id':         c['control_id'],
+        'code':       c['control_code'],
+        'title':      c['control_name'],
+        'regulation': c['regulation'],
+        'status':     c['implementation_status'],
+        'snippet':    c['snippet'] or '',
+        'score':      round(float(c['score']), 4),
+    } for c in db.execute_query(sql, params, fetch=True, prepared=True)]
+
+
+def _audit_hits(expr, limit):
+    return [{
+        'type':        'audit',
+        'id':          a['log_id'],
+        'action':      a['action'],
+        'entity_type': a['entity_type'],
+        'entity_id':   a['entity_id'],
+        'created_at':  a['created_at'].isoformat() if a['created_at'] else None,
+        'snippet':     a['snippet'] or '',
+        'score':       round(float(a['score']), 4),
+    } for a in db.execute_query(AUDIT_SQL, (expr, expr, limit), fetch=True, prepared=True)]
+
+
+def _facet(sql, expr):
+    return {row['facet']: int(row['n'])
+            for row in db.execute_query(sql, (expr,), fetch=True, prepared=True)
+            if row['facet'] is not None}
+
+
+def search(text, sources=SOURCES, level=None, regulation=None, limit=20):
+    """
+    Run a search. Returns {'query', 'results', 'facets', 'took_ms'}; results
+    are merged across sources by score, at most `limit` of them.
+    Raises ValueError when the text has no searchable words.
+    """
+    started = time.monotonic()
+    expr = boolean_query(text)
+    if not expr:
+        raise ValueError('Search terms must be at least {} characters'.format(MIN_TERM_LENGTH))
+
+    results = []
+    facets = {'source': {}, 'risk_level': {}, 'regulation': {}}
+    if 'risk' in sources:
+        facets['risk_level'] = _facet(RISK_FACET_SQL, expr)
+        facets['source']['risk'] = (facets['risk_level'].get(level, 0) if level
+                                    else sum(facets['risk_level'].values()))
+        if facets['source']['risk']:
+            results.extend(_risk_hits(expr, level, limit))
+    if 'control' in sources:
+        facets['regulation'] = _facet(CONTROL_FACET_SQL, expr)
+        facets['source']['control'] = (facets['regulation'].get(regulation, 0) if regulation
+                                       else sum(facets['regulation'].values()))
+        if facets['source']['control']:
+            results.extend(_control_hits(expr, regulation, limit))
+    if 'audit' in sources:
+        facets['source']['audit'] = int(db.execute_query(
+            AUDIT_COUNT_SQL, (expr,), fetch=True, prepared=True)[0]['n'])
+        if facets['source']['audit']:
+            results.extend(_audit_hits(expr, limit))
+
+    results.sort(key=lambda hit: hit['score'], reverse=True)
+    return {
+        'query':   expr,
+        'results': results[:limit],
+        'facets':  facets,
+        'took_ms': round((time.monotonic() - started) * 1000, 1),
+    }
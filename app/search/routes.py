@@ -0,0 +1,50 @@
+"""
+Search routes - PaySecure Technologies GRC Platform
+Unified full-text search over risks, controls and (for admins and auditors)
+the audit trail. See app/search/engine.py.
+"""
+import traceback
+
+from flask import request, jsonify, session
+
+from app.auth.utils import login_required
+from . import search_bp
+from .engine import SOURCES, search
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 100
+AUDIT_ROLES = ('admin', 'auditor')
+
+
+@search_bp.route('')
+@login_required
+def search_api():
+    """
+    ?q= search text; optional ?types=risk,control,audit, ?level=High,
+    ?regulation=PCI-DSS and ?limit= (max 100). Audit events are only
+    searched for admins and auditors.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'q is required'}), 400
+
+    requested = [t.strip() for t in request.args.get('types', ','.join(SOURCES)).split(',')]
+    unknown = [t for t in requested if t and t not in SOURCES]
+    if unknown:
+        return jsonify({'error': 'Unknown type(s): {}'.format(', '.join(unknown))}), 400
+    sources = [t for t in SOURCES if t in requested]
+    if not any(role in session.get('roles', []) for role in AUDIT_ROLES):
+        sources = [t for t in sources if t != 'audit']
+
+    limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), SEARCH_MAX_PAGE))
+    try:
+        result = search(text, sources,
+                        level=request.args.get('level') or None,
+                        regulation=request.args.get('regulation') or None,
+                        limit=limit)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        print(traceback.format_exc())
+        return jsonify({'error': str(exc)}), 500
+    return jsonify(result)
@@ -0,0 +1,393 @@
+"""
+Server-side sessions - PaySecure Technologies GRC Platform
+Replaces Flask's signed-cookie session: the cookie carries only a random
+session id, the data lives in a SessionStore.
+- Sessions are loaded lazily, on the first access to `session` in a request;
+  requests that never touch it cost at most an expiry bump
+- Payloads are JSON via Flask's tagged serializer (tuples, bytes, Markup,
+  datetimes round-trip); nothing read from a store is ever unpickled, and a
+  payload that does not parse is treated as no session
+- Expiry is enforced server-side (PERMANENT_SESSION_LIFETIME as an idle
+  timeout, PCI-DSS 8.2.8) and swept in bulk every SESSION_SWEEP_INTERVAL
+- session.clear() (login/logout) rotates the session id
+- revoke_user_sessions(user_id) ends every session of a user
+Stores (SESSION_BACKEND): 'sqlite' (default; single node, shared by workers),
+'memory' (single process), 'redis' (shared; optional `redis` package),
+'cookie' (Flask's default signed cookie)
+"""
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+
+from config.settings import Config
+
+SID_RE = re.compile(r'^[A-Za-z0-9_-]{43}$')     # secrets.token_urlsafe(32)
+
+
+# ── Encoding ─────────────────────────────────────────────────────────────────
+
+_serializer = TaggedJSONSerializer()
+
+
+def encode(data):
+    return _serializer.dumps(data).encode('utf-8')
+
+
+def decode(blob):
+    """Session dict from a stored payload; ValueError if it is not one."""
+    data = _serializer.loads(bytes(blob).decode('utf-8'))
+    if not isinstance(data, dict):
+        raise ValueError('session payload is not an object')
+    return data
+
+
+# ── Stores ───────────────────────────────────────────────────────────────────
+# Interface: load(sid) -> bytes|None, save(sid, user_id, blob, expires_at),
+# touch(sid, expires_at), delete(*sids), delete_user(user_id) -> n,
+# sweep() -> n expired sessions removed, size() -> n|None.
+# expires_at is a time.time() timestamp.
+
+class MemorySessionStore:
+    """Per-process dict store; only for single-process deployments and development"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}     # sid -> (expires_at, user_id, blob)
+
+    def load(self, sid):
+        row = self._rows.get(sid)
+        if row is None or row[0] < time.time():
+            return None
+        return row[2]
+
+    def save(self, sid, user_id, blob, expires_at):
+        with self._lock:
+            self._rows[sid] = (expires_at, user_id, blob)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            row = self._rows.get(sid)
+            if row is not None and row[0] >= time.time():
+                self._rows[sid] = (expires_at, row[1], row[2])
+
+    def delete(self, *sids):
+        with self._lock:
+            for sid in sids:
+                self._rows.pop(sid, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            doomed = [sid for sid, row in self._rows.items() if row[1] == user_id]
+            for sid in doomed:
+                del self._rows[sid]
+            return len(doomed)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            doomed = [sid for sid, row in self._rows.items() if row[0] < now]
+            for sid in doomed:
+                del self._rows[sid]
+            return len(doomed)
+
+    def size(self):
+        return len(self._rows)
+
+
+class SQLiteSessionStore:
+    """File-backed store shared by all workers on one host (WAL mode)"""
+
+    TOUCH_SLACK = 60    # seconds; skip expiry bumps smaller than this
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                            sid        TEXT PRIMARY KEY,
+                            user_id    INTEGER,
+                            expires_at REAL NOT NULL,
+                            data       BLOB NOT NULL
+                        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)")
+
+    def _conn(self):
+        # One connection per thread, reopened after fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at >= ?",
+            (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, user_id, blob, expires_at):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, user_id, expires_at, data) VALUES (?, ?, ?, ?)",
+            (sid, user_id, expires_at, blob))
+
+    def touch(self, sid, expires_at):
+        self._conn().execute(
+            "UPDATE sessions SET expires_at = ? "
+            "WHERE sid = ? AND expires_at >= ? AND expires_at < ?",
+            (expires_at, sid, time.time(), expires_at - self.TOUCH_SLACK))
+
+    def delete(self, *sids):
+        if sids:
+            self._conn().executemany("DELETE FROM sessions WHERE sid = ?", [(s,) for s in sids])
+
+    def delete_user(self, user_id):
+        return self._conn().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+
+    def sweep(self):
+        return self._conn().execute(
+            "DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def size(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisSessionStore:
+    """Shared store on any Redis-protocol server; expiry is native TTL"""
+
+    def __init__(self, url, namespace='grc:sess:'):
+        import redis    # optional dependency, only needed when SESSION_BACKEND=redis
+        self._client = redis.Redis.from_url(url)
+        self._ns = namespace
+
+    def _user_key(self, user_id):
+        return '{}user:{}'.format(self._ns, user_id)
+
+    def load(self, sid):
+        return self._client.get(self._ns + sid)
+
+    def save(self, sid, user_id, blob, expires_at):
+        ttl_ms = max(1, int((expires_at - time.time()) * 1000))
+        pipe = self._client.pipeline()
+        pipe.set(self._ns + sid, blob, px=ttl_ms)
+        if user_id is not None:
+            pipe.sadd(self._user_key(user_id), sid)     # index for delete_user
+        pipe.execute()
+
+    def touch(self, sid, expires_at):
+        self._client.pexpire(self._ns + sid, max(1, int((expires_at - time.time()) * 1000)))
+
+    def delete(self, *sids):
+        if sids:
+            self._client.delete(*[self._ns + s for s in sids])
+
+    def delete_user(self, user_id):
+        sids = [s.decode() for s in self._client.smembers(self._user_key(user_id))]
+        removed = self._client.delete(*[self._ns + s for s in sids]) if sids else 0
+        self._client.delete(self._user_key(user_id))
+        return removed
+
+    def sweep(self):
+        return 0    # keys expire server-side
+
+    def size(self):
+        return None
+
+
+# ── Session object and Flask interface ───────────────────────────────────────
+
+class LazySession(SessionMixin):
+    """Session mapping that reads and decodes its payload on first access"""
+
+    def __init__(self, store, sid):
+        self.sid = sid
+        self._store = store
+        self._data = None
+        self.rotated_from = None
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        if self._data is None:
+            self.accessed = True
+            blob = self._store.load(self.sid) if self.sid else None
+            data = None
+            if blob is not None:
+                try:
+                    data = decode(blob)
+                except ValueError:
+                    pass    # unreadable (e.g. written by an older release): start over
+            if data is None:
+                # Unknown or expired id: never resurrect it, issue a fresh one on save
+                self.sid = None
+                self._data = {}
+            else:
+                self._data = data
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        """Drop all data and rotate the session id (prevents session fixation)."""
+        self._load()
+        if self.sid:
+            self.rotated_from = self.rotated_from or self.sid
+            self.sid = None
+        self._data = {}
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface over a SessionStore"""
+
+    def __init__(self, store, sweep_interval=60):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._pid = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.stats = {'loaded': 0, 'saved': 0, 'touched': 0, 'deleted': 0, 'swept': 0}
+
+    def open_session(self, app, request):
+        self._ensure_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and not SID_RE.match(sid):
+            sid = None
+        return LazySession(self.store, sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            self.stats['loaded'] += 1
+            response.vary.add('Cookie')
+
+        if session.rotated_from:
+            self.store.delete(session.rotated_from)
+            self.stats['deleted'] += 1
+
+        expires_at = time.time() + app.permanent_session_lifetime.total_seconds()
+
+        if not session.loaded:
+            # Untouched this request: slide the idle timeout without decoding
+            if session.sid and app.config['SESSION_REFRESH_EACH_REQUEST']:
+                self.store.touch(session.sid, expires_at)
+                self.stats['touched'] += 1
+            return
+
+        if not session:
+            if session.rotated_from or (session.sid and session.modified):
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if not session.modified:
+            if app.config['SESSION_REFRESH_EACH_REQUEST']:
+                self.store.touch(session.sid, expires_at)
+                self.stats['touched'] += 1
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, session.get('user_id'), encode(dict(session)), expires_at)
+        self.stats['saved'] += 1
+        # Session cookie (no Expires): the server-side expiry is the timeout
+        response.set_cookie(
+            name,
+            session.sid,
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            httponly=self.get_cookie_httponly(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def revoke_user(self, user_id):
+        return self.store.delete_user(user_id)
+
+    def snapshot_stats(self):
+        return dict(self.stats, backend=type(self.store).__name__, sessions=self.store.size())
+
+    def _ensure_sweeper(self):
+        if self._thread is None or self._pid != os.getpid():
+            with self._thread_lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(
+                        target=self._sweep_loop, name='session-sweep', daemon=True)
+                    self._thread.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.stats['swept'] += self.store.sweep()
+            except Exception as exc:
+                print("Session sweep error: {}".format(exc))
+
+
+def _make_store():
+    backend = Config.SESSION_BACKEND
+    if backend == 'redis':
+        try:
+            return RedisSessionStore(Config.SESSION_REDIS_URL or Config.CACHE_URL)
+        except ImportError:
+            print("Warning: SESSION_BACKEND=redis but the redis package is not installed; "
+                  "using the SQLite session store")
+    if backend == 'memory':
+        return MemorySessionStore()
+    return SQLiteSessionStore(Config.SESSION_SQLITE_PATH)
+
+
+def init_sessions(app):
+    """Install the configured server-side session interface on app."""
+    if Config.SESSION_BACKEND == 'cookie':
+        return None
+    app.session_interface = ServerSessionInterface(
+        _make_store(), sweep_interval=Config.SESSION_SWEEP_INTERVAL)
+    return app.session_interface
+
+
+def revoke_user_sessions(app, user_id):
+    """End every server-side session belonging to user_id; returns the count removed."""
+    interface = app.session_interface
+    if isinstance(interface, ServerSessionInterface):
+        return interface.revoke_user(user_id)
+    return 0
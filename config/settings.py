@@ -10,4 +10,114 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', '')
     MYSQL_DB = os.environ.get('MYSQL_DB', 'grc_db')
     SESSION_COOKIE_HTTPONLY = True
-    SESSION_COOKIE_SAMESITE = 'Lax'
\ No newline at end of file
+    SESSION_COOKIE_SAMESITE = 'Lax'
+
+    # Connection pool sizing (see app/db.py ConnectionPool)
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 20))
+    DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', 10))      # seconds
+    DB_POOL_HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', 30))  # idle seconds
+    DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))             # seconds
+    # Session reset discards prepared statements; the app keeps no session state
+    DB_POOL_RESET_SESSION = os.environ.get('DB_POOL_RESET_SESSION', 'false').lower() == 'true'
+    DB_STMT_CACHE_SIZE = int(os.environ.get('DB_STMT_CACHE_SIZE', 32))  # per connection
+
+    # Asynchronous audit writer (see app/audit/writer.py)
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))   # seconds
+    AUDIT_ENQUEUE_TIMEOUT = float(os.environ.get('AUDIT_ENQUEUE_TIMEOUT', 0.05))  # seconds
+    AUDIT_SPOOL_DIR = os.environ.get(
+        'AUDIT_SPOOL_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'var', 'audit_spool'),
+    )
+    AUDIT_SPOOL_FSYNC = os.environ.get('AUDIT_SPOOL_FSYNC', 'false').lower() == 'true'
+    # Spool files roll over at this size; committed segments are deleted
+    AUDIT_SPOOL_SEGMENT_BYTES = int(os.environ.get('AUDIT_SPOOL_SEGMENT_BYTES', 1 << 20))
+    # Search indexing only passes a log_id this long after first seeing it, so
+    # inserts with lower ids still uncommitted at the time are not skipped
+    AUDIT_SEARCH_FEED_LAG = float(os.environ.get('AUDIT_SEARCH_FEED_LAG', 30))  # seconds
+    AUDIT_EXPORT_BATCH_SIZE = int(os.environ.get('AUDIT_EXPORT_BATCH_SIZE', 2000))  # rows per fetchmany
+
+    # Dashboard metrics snapshot (see app/dashboard/metrics.py)
+    METRICS_RECONCILE_INTERVAL = float(os.environ.get('METRICS_RECONCILE_INTERVAL', 60))  # seconds
+
+    # Compliance posture engine (see app/compliance/posture.py)
+    COMPLIANCE_MANDATORY_WEIGHT = float(os.environ.get('COMPLIANCE_MANDATORY_WEIGHT', 2.0))  # optional = 1
+    COMPLIANCE_POSTURE_RECONCILE_INTERVAL = float(os.environ.get('COMPLIANCE_POSTURE_RECONCILE_INTERVAL', 60))
+
+    # Risk-control graph index (see app/compliance/graph.py)
+    CONTROL_GRAPH_RECONCILE_INTERVAL = float(os.environ.get('CONTROL_GRAPH_RECONCILE_INTERVAL', 300))  # seconds
+
+    # Bulk mapping editor (see app/compliance/mappings.py)
+    MAPPING_BULK_MAX_CHANGES = int(os.environ.get('MAPPING_BULK_MAX_CHANGES', 2000))  # adds + removes per request
+
+    # Reference-data cache (see app/cache.py); CACHE_URL=redis://host:6379/0 to share across workers
+    CACHE_URL = os.environ.get('CACHE_URL', '')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    CACHE_DEFAULT_TTL = float(os.environ.get('CACHE_DEFAULT_TTL', 300))  # seconds
+
+    # Authorization cache: max seconds a worker may act on a revoked role or
+    # deactivated account before re-reading users.roles_epoch
+    AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 15))
+
+    # Password hashing pool (see app/auth/hashing.py); AUTH_HASH_WORKERS=0 hashes inline
+    AUTH_BCRYPT_ROUNDS = int(os.environ.get('AUTH_BCRYPT_ROUNDS', 12))      # stored hashes migrate on login
+    AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))
+    AUTH_HASH_MAX_PENDING = int(os.environ.get('AUTH_HASH_MAX_PENDING', 16))  # queued + running checks
+    AUTH_HASH_TIMEOUT = float(os.environ.get('AUTH_HASH_TIMEOUT', 5))        # seconds
+
+    # Login throttling / lockout (see app/auth/throttle.py)
+    LOGIN_USER_MAX_ATTEMPTS = int(os.environ.get('LOGIN_USER_MAX_ATTEMPTS', 10))  # per username per window
+    LOGIN_USER_WINDOW = float(os.environ.get('LOGIN_USER_WINDOW', 300))           # seconds
+    LOGIN_IP_MAX_ATTEMPTS = int(os.environ.get('LOGIN_IP_MAX_ATTEMPTS', 30))      # per client IP per window
+    LOGIN_IP_WINDOW = float(os.environ.get('LOGIN_IP_WINDOW', 300))               # seconds
+    LOGIN_LOCKOUT_THRESHOLD = int(os.environ.get('LOGIN_LOCKOUT_THRESHOLD', 5))   # consecutive failures (PCI-DSS 8.3.4)
+    LOGIN_LOCKOUT_SECONDS = int(os.environ.get('LOGIN_LOCKOUT_SECONDS', 1800))
+    LOGIN_THROTTLE_PERSIST_INTERVAL = float(os.environ.get('LOGIN_THROTTLE_PERSIST_INTERVAL', 10))  # seconds
+    # Reverse proxies in front of the app that append to X-Forwarded-For (0 = none).
+    # Per-IP login limits and audit IPs use the client address this yields;
+    # behind an unconfigured proxy every client shares the proxy's address
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+    # Server-side sessions (see app/sessions.py): sqlite | memory | redis | cookie
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite').lower()
+    SESSION_SQLITE_PATH = os.environ.get(
+        'SESSION_SQLITE_PATH',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'var', 'sessions.sqlite3'),
+    )
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', '')  # defaults to CACHE_URL
+    SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 60))  # seconds
+
+    # Bulk risk import (see app/risk/ingest.py)
+    RISK_IMPORT_CHUNK_SIZE = int(os.environ.get('RISK_IMPORT_CHUNK_SIZE', 500))   # rows per executemany
+    RISK_IMPORT_MAX_ROWS = int(os.environ.get('RISK_IMPORT_MAX_ROWS', 50000))
+    RISK_CODE_BLOCK_SIZE = int(os.environ.get('RISK_CODE_BLOCK_SIZE', 20))      # codes reserved per worker refill
+
+    # Risk heat-map cache (see app/risk/heatmap.py)
+    HEATMAP_CACHE_TTL = float(os.environ.get('HEATMAP_CACHE_TTL', 60))  # seconds; writes invalidate sooner
+    HEATMAP_MAX_TOP_N = int(os.environ.get('HEATMAP_MAX_TOP_N', 20))    # risks listed per cell
+
+    # Daily heat-map snapshots (see app/risk/snapshots.py)
+    RISK_SNAPSHOT_HOUR = int(os.environ.get('RISK_SNAPSHOT_HOUR', 1))                        # local hour the daily capture becomes due
+    RISK_SNAPSHOT_CHECK_INTERVAL = float(os.environ.get('RISK_SNAPSHOT_CHECK_INTERVAL', 300))  # seconds
+    RISK_SNAPSHOT_MAX_DAYS = int(os.environ.get('RISK_SNAPSHOT_MAX_DAYS', 1100))              # longest history range per request
+
+    # Monte Carlo risk simulation (see app/risk/simulation.py)
+    RISK_SIM_TRIALS = int(os.environ.get('RISK_SIM_TRIALS', 100000))
+    RISK_SIM_MAX_TRIALS = int(os.environ.get('RISK_SIM_MAX_TRIALS', 1000000))
+    RISK_SIM_SEED = int(os.environ.get('RISK_SIM_SEED', 20240101))      # fixed so reports are reproducible
+    RISK_SIM_WORKERS = int(os.environ.get('RISK_SIM_WORKERS', 4))       # processes; 0 = run in the web worker
+    RISK_SIM_CACHE_TTL = float(os.environ.get('RISK_SIM_CACHE_TTL', 86400))  # seconds; keyed by register version
+
+    # Audit log partitions and archive tier (see app/audit/archive.py)
+    AUDIT_ARCHIVE_DIR = os.environ.get(
+        'AUDIT_ARCHIVE_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'var', 'audit_archive'),
+    )
+    AUDIT_HOT_MONTHS = int(os.environ.get('AUDIT_HOT_MONTHS', 13))                  # months kept in MySQL
+    AUDIT_PARTITION_MONTHS_AHEAD = int(os.environ.get('AUDIT_PARTITION_MONTHS_AHEAD', 3))
+    AUDIT_RETENTION_YEARS = int(os.environ.get('AUDIT_RETENTION_YEARS', 7))         # RBI mandate; archives purged after
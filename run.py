@@ -1,6 +1,8 @@
 from app import create_app
 
-app = create_app()
+# Process-pool workers (bcrypt, simulations) re-import this module as __mp_main__
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='127.0.0.1', port=5000)
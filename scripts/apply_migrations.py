@@ -0,0 +1,100 @@
+"""
+Apply pending schema migrations from scripts/migrations/*.sql, in file-name order.
+Applied versions are recorded in schema_migrations so each file runs once.
+Files may use the mysql-client `DELIMITER` directive for triggers/procedures.
+Run with: python scripts/apply_migrations.py
+"""
+import glob
+import os
+
+import mysql.connector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host':     os.getenv('MYSQL_HOST', 'localhost'),
+    'user':     os.getenv('MYSQL_USER', 'root'),
+    'password': os.getenv('MYSQL_PASSWORD', ''),
+    'database': os.getenv('MYSQL_DB', 'grc_db'),
+}
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Objects that already exist (fresh DB seeded with the latest schema) are not errors
+IGNORABLE_ERRNOS = {
+    1050,  # table already exists
+    1060,  # duplicate column name
+    1061,  # duplicate key name
+    1091,  # can't drop; check that column/key exists
+    1359,  # trigger already exists
+    1826,  # duplicate foreign key constraint name
+}
+
+
+def split_statements(sql):
+    """Split a migration file into statements, honouring DELIMITER directives."""
+    statements, buf, delimiter = [], [], ';'
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not buf and (not stripped or stripped.startswith('--')):
+            continue
+        buf.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(buf).rstrip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            buf = []
+    tail = '\n'.join(buf).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def apply_all(conn, verbose=True):
+    """Apply every migration not yet recorded in schema_migrations."""
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                       version    VARCHAR(100) PRIMARY KEY,
+                       applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                   )""")
+    cur.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+
+    count = 0
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+        version = os.path.splitext(os.path.basename(path))[0]
+        if version in applied:
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            statements = split_statements(f.read())
+        if verbose:
+            print(f"  → {version} ({len(statements)} statements)")
+        for stmt in statements:
+            try:
+                cur.execute(stmt)
+                if cur.with_rows:
+                    cur.fetchall()
+            except mysql.connector.Error as e:
+                if e.errno not in IGNORABLE_ERRNOS:
+                    conn.rollback()
+                    raise
+                if verbose:
+                    print(f"    (skipped: {e.msg})")
+        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+        count += 1
+    cur.close()
+    return count
+
+
+if __name__ == '__main__':
+    print(f"Applying migrations to {DB_CONFIG['database']} at {DB_CONFIG['host']}...")
+    connection = mysql.connector.connect(**DB_CONFIG)
+    try:
+        n = apply_all(connection)
+    finally:
+        connection.close()
+    print(f"✅ {n} migration(s) applied")
@@ -0,0 +1,61 @@
+"""
+Audit log partition and archive maintenance (see app/audit/archive.py).
+Run daily from cron:
+    python scripts/audit_maintenance.py run          # partitions + archive
+Individual steps:
+    python scripts/audit_maintenance.py partitions   # create future monthly partitions
+    python scripts/audit_maintenance.py archive [--dry-run]
+    python scripts/audit_maintenance.py purge [--dry-run]   # archives past retention
+    python scripts/audit_maintenance.py status
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.audit import archive
+from config.settings import Config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audit log partitions and archive tier')
+    parser.add_argument('command', choices=('run', 'partitions', 'archive', 'purge', 'status'))
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list what archive/purge would do without changing anything')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            if args.command in ('run', 'partitions'):
+                created = archive.ensure_partitions()
+                print(f"✅ Partitions created: {', '.join(created) or 'none needed'}")
+
+            if args.command in ('run', 'archive'):
+                result = archive.archive_expired(dry_run=args.dry_run)
+                if args.dry_run:
+                    print(f"Would archive: {', '.join(result) or 'nothing'} "
+                          f"(hot window {Config.AUDIT_HOT_MONTHS} months)")
+                for entry in [] if args.dry_run else result:
+                    print(f"✅ Archived {entry['partition']}: {entry['rows']} rows → "
+                          f"{entry['file']} ({entry['bytes']:,} bytes)")
+
+            if args.command == 'purge':
+                expired = archive.purge_expired(dry_run=args.dry_run)
+                verb = 'Would purge' if args.dry_run else 'Purged'
+                print(f"{verb}: {', '.join(a['month'] for a in expired) or 'nothing'} "
+                      f"(retention {Config.AUDIT_RETENTION_YEARS} years)")
+
+            if args.command == 'status':
+                print(json.dumps(archive.status(), indent=2))
+        except archive.ArchiveError as e:
+            print(f"❌ {e}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
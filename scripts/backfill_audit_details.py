@@ -0,0 +1,82 @@
+"""
+Convert legacy audit_logs.details TEXT into the details_json column
+(scripts/migrations/009) in primary-key batches, one transaction each.
+Converted rows have details set to NULL, so the job is idempotent and
+resumes where it stopped: rerun it after an interruption, or pass
+--start-id to skip the initial scan for the first unconverted row.
+Text that is not valid JSON is kept as {"text": "..."}.
+Run with: python scripts/backfill_audit_details.py [--batch-size 5000] [--pause 0.05]
+"""
+import argparse
+import os
+import sys
+import time
+
+import mysql.connector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host':     os.getenv('MYSQL_HOST', 'localhost'),
+    'user':     os.getenv('MYSQL_USER', 'root'),
+    'password': os.getenv('MYSQL_PASSWORD', ''),
+    'database': os.getenv('MYSQL_DB', 'grc_db'),
+}
+
+CONVERT_SQL = """
+    UPDATE audit_logs
+    SET details_json = CASE WHEN JSON_VALID(details) THEN CAST(details AS JSON)
+                            ELSE JSON_OBJECT('text', details) END,
+        details = NULL
+    WHERE log_id >= %s AND log_id < %s AND details IS NOT NULL
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill audit_logs.details_json')
+    parser.add_argument('--batch-size', type=int, default=5000, help='log_ids per transaction')
+    parser.add_argument('--pause', type=float, default=0.05,
+                        help='seconds to sleep between batches (replication headroom)')
+    parser.add_argument('--start-id', type=int, help='first log_id to convert')
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    try:
+        if args.start_id is None:
+            cur.execute("SELECT MIN(log_id) FROM audit_logs WHERE details IS NOT NULL")
+            start = cur.fetchone()[0]
+        else:
+            start = args.start_id
+        cur.execute("SELECT MAX(log_id) FROM audit_logs")
+        end = cur.fetchone()[0]
+        if start is None or end is None or start > end:
+            print("✅ Nothing to convert")
+            return 0
+
+        print(f"Converting log_id {start} … {end} in batches of {args.batch_size}")
+        converted = 0
+        started = time.monotonic()
+        for lo in range(start, end + 1, args.batch_size):
+            cur.execute(CONVERT_SQL, (lo, lo + args.batch_size))
+            conn.commit()
+            converted += cur.rowcount
+            hi = min(lo + args.batch_size, end + 1) - 1
+            rate = converted / max(time.monotonic() - started, 1e-6)
+            print(f"  up to log_id {hi}: {converted} rows converted ({rate:,.0f} rows/sec)")
+            if args.pause:
+                time.sleep(args.pause)
+        print(f"✅ Converted {converted} rows")
+        return 0
+    except KeyboardInterrupt:
+        conn.rollback()
+        print("Interrupted: rerun to resume from the first unconverted row")
+        return 1
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Benchmark the Monte Carlo risk model (app/risk/simulation.py) against
+synthetic registers of increasing size. No risk data is read.
+Run with: python scripts/benchmark_simulation.py [--sizes 25,250,2500,10000] [--trials 100000] [--workers 4]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.risk.simulation import simulate
+
+
+def synthetic_register(size, categories=8, seed=0):
+    rnd = random.Random(seed)
+    return [{'probability': rnd.randint(1, 5),
+             'impact':      rnd.randint(1, 5),
+             'category_id': rnd.randint(1, categories)}
+            for _ in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo runtime vs register size')
+    parser.add_argument('--sizes', default='25,250,2500,10000',
+                        help='comma-separated register sizes')
+    parser.add_argument('--trials', type=int, default=100000)
+    parser.add_argument('--workers', default='0,4',
+                        help='comma-separated process counts to compare (0 = in-process)')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    workers = [int(w) for w in args.workers.split(',')]
+
+    print(f"{'risks':>8} {'workers':>8} {'seconds':>9} {'trials/s':>11} {'E[loss]':>16} {'VaR 99%':>16}")
+    for size in sizes:
+        risks = synthetic_register(size)
+        for w in workers:
+            started = time.perf_counter()
+            result = simulate(risks, trials=args.trials, seed=1, workers=w)
+            elapsed = time.perf_counter() - started
+            print(f"{size:>8} {w:>8} {elapsed:>9.2f} {args.trials / elapsed:>11,.0f} "
+                  f"{result['expected_loss']:>16,.0f} {result['var_99']:>16,.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
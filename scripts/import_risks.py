@@ -0,0 +1,68 @@
+"""
+Bulk-import risks from a CSV or JSON Lines file (see app/risk/ingest.py).
+Run with: python scripts/import_risks.py risks.csv --as-user sarah.chen [--dry-run] [--skip-invalid]
+Accepted columns: risk_title, probability, impact, category (id or name),
+owner (user id or full name; defaults to --as-user), status, treatment_type,
+review_date, risk_description, mitigation_plan, business_impact
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.db import db
+from app.risk.ingest import IngestError, detect_format, import_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-import risks into the register')
+    parser.add_argument('path', help='CSV or .jsonl file')
+    parser.add_argument('--as-user', required=True,
+                        help='username recorded as created_by (and default owner)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        help='input format (default: from the file extension)')
+    parser.add_argument('--dry-run', action='store_true', help='validate only')
+    parser.add_argument('--skip-invalid', action='store_true',
+                        help='insert valid rows even if some rows fail validation')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        users = db.execute_query(
+            "SELECT user_id FROM users WHERE username = %s AND is_active = TRUE",
+            (args.as_user,), fetch=True)
+        if not users:
+            print(f"❌ Unknown or inactive user: {args.as_user}")
+            return 2
+        user_id = users[0]['user_id']
+
+        with open(args.path, 'r', encoding='utf-8-sig') as f:
+            text = f.read()
+        try:
+            summary = import_text(
+                text, args.format or detect_format(args.path),
+                created_by=user_id,
+                source=os.path.basename(args.path),
+                dry_run=args.dry_run,
+                skip_invalid=args.skip_invalid,
+                default_owner_id=user_id,
+            )
+        except IngestError as e:
+            print(f"❌ {e}")
+            return 2
+
+    for err in summary['errors']:
+        print(f"  row {err['row']}: {err['error']}")
+    print(json.dumps({k: v for k, v in summary.items() if k != 'errors'}, indent=2))
+    if summary['inserted']:
+        print(f"✅ Imported {summary['inserted']} risks "
+              f"({summary['first_code']} … {summary['last_code']}) "
+              f"at {summary['rows_per_sec']} rows/sec")
+    return 1 if summary['invalid'] and not summary['inserted'] and not args.dry_run else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
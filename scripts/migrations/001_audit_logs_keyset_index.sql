@@ -0,0 +1,2 @@
+-- Keyset pagination for the audit trail: seek + ORDER BY on (created_at, log_id)
+ALTER TABLE audit_logs ADD INDEX idx_time_id (created_at, log_id);
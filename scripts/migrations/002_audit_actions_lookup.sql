@@ -0,0 +1,9 @@
+-- Distinct audit action names for the trail filter, maintained by the audit writer
+CREATE TABLE IF NOT EXISTS audit_actions (
+    action     VARCHAR(100) PRIMARY KEY,
+    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One-time backfill from existing history
+INSERT IGNORE INTO audit_actions (action)
+SELECT DISTINCT action FROM audit_logs;
@@ -0,0 +1,33 @@
+-- Authorization freshness: a per-user counter bumped whenever the user's roles
+-- or active flag change, so sessions can detect stale role lists cheaply
+ALTER TABLE users ADD COLUMN roles_epoch INT NOT NULL DEFAULT 0;
+
+DROP TRIGGER IF EXISTS trg_user_roles_ai;
+DROP TRIGGER IF EXISTS trg_user_roles_ad;
+DROP TRIGGER IF EXISTS trg_user_roles_au;
+DROP TRIGGER IF EXISTS trg_users_active_bu;
+
+DELIMITER $$
+CREATE TRIGGER trg_user_roles_ai AFTER INSERT ON user_roles FOR EACH ROW
+BEGIN
+    UPDATE users SET roles_epoch = roles_epoch + 1 WHERE user_id = NEW.user_id;
+END$$
+
+CREATE TRIGGER trg_user_roles_ad AFTER DELETE ON user_roles FOR EACH ROW
+BEGIN
+    UPDATE users SET roles_epoch = roles_epoch + 1 WHERE user_id = OLD.user_id;
+END$$
+
+CREATE TRIGGER trg_user_roles_au AFTER UPDATE ON user_roles FOR EACH ROW
+BEGIN
+    UPDATE users SET roles_epoch = roles_epoch + 1
+    WHERE user_id IN (OLD.user_id, NEW.user_id);
+END$$
+
+CREATE TRIGGER trg_users_active_bu BEFORE UPDATE ON users FOR EACH ROW
+BEGIN
+    IF NOT (NEW.is_active <=> OLD.is_active) THEN
+        SET NEW.roles_epoch = OLD.roles_epoch + 1;
+    END IF;
+END$$
+DELIMITER ;
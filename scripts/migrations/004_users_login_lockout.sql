@@ -0,0 +1,7 @@
+-- Login throttling state (app/auth/throttle.py). reset_and_seed.py creates
+-- failed_login_count/account_locked, seed_fintech_data.sql creates
+-- failed_login_attempts/locked_until; make every database carry the set the
+-- app persists to. failed_login_attempts is left in place but unused.
+ALTER TABLE users ADD COLUMN failed_login_count INT DEFAULT 0;
+ALTER TABLE users ADD COLUMN account_locked BOOLEAN DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN locked_until TIMESTAMP NULL;
@@ -0,0 +1,13 @@
+-- Per-year risk code counters (app/risk/codes.py). next_value is the next
+-- unreserved number; workers advance it atomically in blocks.
+CREATE TABLE IF NOT EXISTS risk_code_sequences (
+    seq_year   SMALLINT UNSIGNED PRIMARY KEY,
+    next_value INT UNSIGNED NOT NULL
+);
+
+INSERT IGNORE INTO risk_code_sequences (seq_year, next_value)
+SELECT CAST(SUBSTRING(risk_code, 6, 4) AS UNSIGNED),
+       MAX(CAST(SUBSTRING(risk_code, 11) AS UNSIGNED)) + 1
+FROM risks
+WHERE risk_code LIKE 'RISK-____-%'
+GROUP BY CAST(SUBSTRING(risk_code, 6, 4) AS UNSIGNED);
@@ -0,0 +1,6 @@
+-- Keyset pagination for /risk/api/risks: each sortable column paired with
+-- risk_id so "seek past the last row" is an index range scan
+ALTER TABLE risks ADD INDEX idx_risks_score (risk_score, risk_id);
+ALTER TABLE risks ADD INDEX idx_risks_created (created_at, risk_id);
+ALTER TABLE risks ADD INDEX idx_risks_updated (updated_at, risk_id);
+ALTER TABLE risks ADD INDEX idx_risks_level (risk_level, risk_score, risk_id);
@@ -0,0 +1,15 @@
+-- Daily risk heat-map snapshots (app/risk/snapshots.py). One row per day;
+-- the matrix and per-category aggregates are packed little-endian:
+--   cell_counts     25 x uint32, index (impact-1)*5 + (probability-1)
+--   category_stats  n x (category_id, risks, score_sum, high_risks: uint32; max_score: uint8)
+CREATE TABLE IF NOT EXISTS risk_heatmap_snapshots (
+    snapshot_date  DATE PRIMARY KEY,
+    total_risks    INT UNSIGNED NOT NULL,
+    high_risks     INT UNSIGNED NOT NULL,
+    medium_risks   INT UNSIGNED NOT NULL,
+    low_risks      INT UNSIGNED NOT NULL,
+    open_risks     INT UNSIGNED NOT NULL,
+    cell_counts    BINARY(100) NOT NULL,
+    category_stats BLOB NOT NULL,
+    captured_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
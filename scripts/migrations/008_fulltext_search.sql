@@ -0,0 +1,23 @@
+-- Full-text search (app/search). InnoDB maintains FULLTEXT indexes on every
+-- INSERT/UPDATE, so risks and controls need no extra write path.
+ALTER TABLE risks ADD FULLTEXT INDEX ft_risks_text (risk_title, risk_description, mitigation_plan);
+ALTER TABLE compliance_controls ADD FULLTEXT INDEX ft_controls_text (control_code, control_name, control_description);
+
+-- Searchable copy of audit_logs, fed by the audit writer after each flush.
+-- Kept out of audit_logs itself so the hot insert path carries no FULLTEXT
+-- index (and audit_logs can be partitioned, which FULLTEXT does not allow).
+CREATE TABLE IF NOT EXISTS audit_log_search (
+    log_id      INT PRIMARY KEY,
+    action      VARCHAR(100) NOT NULL,
+    entity_type VARCHAR(50),
+    entity_id   INT,
+    created_at  TIMESTAMP NULL,
+    body        TEXT,
+    INDEX idx_audit_search_time (created_at),
+    FULLTEXT INDEX ft_audit_search_body (body)
+);
+
+INSERT IGNORE INTO audit_log_search (log_id, action, entity_type, entity_id, created_at, body)
+SELECT log_id, action, entity_type, entity_id, created_at,
+       CONCAT_WS(' ', action, entity_type, details)
+FROM audit_logs;
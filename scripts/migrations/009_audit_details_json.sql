@@ -0,0 +1,22 @@
+-- Structured audit details (app/audit/writer.py writes details_json; the
+-- legacy details TEXT is converted by scripts/backfill_audit_details.py).
+-- Hot keys are exposed as VIRTUAL generated columns: no storage, but
+-- indexable, so /audit/api/events filters are index range scans.
+ALTER TABLE audit_logs ADD COLUMN details_json JSON NULL AFTER details;
+
+ALTER TABLE audit_logs ADD COLUMN d_risk_code VARCHAR(100)
+    GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(details_json, '$.risk_code'))) VIRTUAL;
+ALTER TABLE audit_logs ADD COLUMN d_new_status VARCHAR(100)
+    GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(details_json, '$.new_status'))) VIRTUAL;
+ALTER TABLE audit_logs ADD COLUMN d_previous_status VARCHAR(100)
+    GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(details_json, '$.previous_status'))) VIRTUAL;
+ALTER TABLE audit_logs ADD COLUMN d_control VARCHAR(100)
+    GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(details_json, '$.control'))) VIRTUAL;
+ALTER TABLE audit_logs ADD COLUMN d_affected_user VARCHAR(100)
+    GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(details_json, '$.affected_user'))) VIRTUAL;
+
+ALTER TABLE audit_logs ADD INDEX idx_audit_risk_code (d_risk_code, created_at);
+ALTER TABLE audit_logs ADD INDEX idx_audit_new_status (d_new_status, created_at);
+ALTER TABLE audit_logs ADD INDEX idx_audit_previous_status (d_previous_status, created_at);
+ALTER TABLE audit_logs ADD INDEX idx_audit_control (d_control, created_at);
+ALTER TABLE audit_logs ADD INDEX idx_audit_affected_user (d_affected_user, created_at);
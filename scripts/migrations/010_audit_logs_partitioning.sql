@@ -0,0 +1,15 @@
+-- Monthly RANGE partitioning of audit_logs (managed by scripts/audit_maintenance.py).
+-- MySQL requires the partitioning column in every unique key and allows no
+-- foreign keys on partitioned tables: the primary key becomes
+-- (log_id, created_at) and the user_id foreign key of the original seed
+-- schema is dropped (log_id stays AUTO_INCREMENT and unique in practice).
+ALTER TABLE audit_logs DROP FOREIGN KEY audit_logs_ibfk_1;
+ALTER TABLE audit_logs MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, created_at);
+
+-- One catch-all partition; `audit_maintenance.py partitions` splits it into
+-- months (from the oldest row onward) and keeps AUDIT_PARTITION_MONTHS_AHEAD
+-- empty future months in front of it. Inserts never fail if the job lapses.
+ALTER TABLE audit_logs PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
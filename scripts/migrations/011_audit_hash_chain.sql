@@ -0,0 +1,29 @@
+-- Tamper-evident audit chain (app/audit/chain.py). Rows written by the audit
+-- writer carry a gap-free chain_seq and row_hash = SHA-256(previous row_hash
+-- || canonical record); rows from before this migration stay unchained (NULL).
+-- chain_seq cannot be UNIQUE on the partitioned table; the head row lock keeps
+-- it gap-free and scripts/verify_audit_chain.py checks it.
+ALTER TABLE audit_logs ADD COLUMN chain_seq BIGINT UNSIGNED NULL;
+ALTER TABLE audit_logs ADD COLUMN row_hash CHAR(64) NULL;
+ALTER TABLE audit_logs ADD INDEX idx_audit_chain_seq (chain_seq);
+
+-- Single-row chain head, taken FOR UPDATE once per writer batch
+CREATE TABLE IF NOT EXISTS audit_chain_head (
+    chain_id TINYINT UNSIGNED PRIMARY KEY,
+    last_seq BIGINT UNSIGNED NOT NULL,
+    last_hash CHAR(64) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+INSERT IGNORE INTO audit_chain_head (chain_id, last_seq, last_hash)
+VALUES (1, 0, REPEAT('0', 64));
+
+-- Merkle root and closing chain hash of every completed block of
+-- CHECKPOINT_SIZE rows; kept when the rows themselves are archived
+CREATE TABLE IF NOT EXISTS audit_checkpoints (
+    block_no INT UNSIGNED PRIMARY KEY,
+    first_seq BIGINT UNSIGNED NOT NULL,
+    last_seq BIGINT UNSIGNED NOT NULL,
+    merkle_root CHAR(64) NOT NULL,
+    chain_hash CHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -572,6 +572,13 @@ for entry in log_entries:
 conn.commit()
 print("✅ Audit logs inserted")
 
+# ── Schema migrations ──────────────────────────────────────────────────────
+print("\nApplying schema migrations...")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from apply_migrations import apply_all
+apply_all(conn)
+print("✅ Migrations applied")
+
 cur.close()
 conn.close()
 
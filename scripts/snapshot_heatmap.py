@@ -0,0 +1,63 @@
+"""
+Capture or inspect daily risk heat-map snapshots (see app/risk/snapshots.py).
+Run with: python scripts/snapshot_heatmap.py capture [--date YYYY-MM-DD] [--keep]
+          python scripts/snapshot_heatmap.py history --from 2025-01-01 [--to 2025-03-31]
+          python scripts/snapshot_heatmap.py diff --from 2025-01-01 [--to 2025-03-31]
+The web app takes the daily snapshot itself; use `capture` from cron when it
+is not running, or to re-take today's snapshot after a bulk change.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.risk import snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Risk heat-map snapshots')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cap = sub.add_parser('capture', help='snapshot the live register')
+    cap.add_argument('--date', help='date to file the snapshot under (default: today)')
+    cap.add_argument('--keep', action='store_true',
+                     help="don't replace an existing snapshot for the day")
+    for name in ('history', 'diff'):
+        p = sub.add_parser(name)
+        p.add_argument('--from', dest='start', required=True, help='YYYY-MM-DD')
+        p.add_argument('--to', dest='end', help='YYYY-MM-DD (default: today)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'capture':
+            day = snapshots.parse_day(args.date, date.today())
+        else:
+            start = snapshots.parse_day(args.start)
+            end = snapshots.parse_day(args.end, date.today())
+    except ValueError:
+        print("❌ Dates must be in YYYY-MM-DD format")
+        return 2
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'capture':
+            values = snapshots.capture(day, replace=not args.keep)
+            print(f"✅ Snapshot for {day.isoformat()}: {values[1]} risks "
+                  f"(High {values[2]}, Medium {values[3]}, Low {values[4]})")
+            return 0
+        if args.command == 'history':
+            result = snapshots.get_range(start, end)
+        else:
+            result = snapshots.diff(start, end)
+            if result is None:
+                print(f"❌ No snapshot on or before {min(start, end).isoformat()}")
+                return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Shared test helpers - PaySecure Technologies GRC Platform
+Unit tests run without MySQL: modules under test get a FakeDB in place of
+app.db.db (monkeypatched onto the importing module).
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeDB:
+    """
+    Stand-in for app.db.db. Each handler is (sql fragment, fn(params)); the
+    first whose fragment occurs in the statement answers it. Executed
+    statements are recorded in `calls` as (sql, params).
+    """
+
+    def __init__(self, *handlers):
+        self.handlers = list(handlers)
+        self.calls = []
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def _answer(self, sql, params):
+        self.calls.append((sql, params))
+        for fragment, fn in self.handlers:
+            if fragment in sql:
+                return fn(params)
+        raise AssertionError('unexpected statement: {}'.format(' '.join(sql.split())[:80]))
+
+    def execute_query(self, sql, params=None, fetch=False, prepared=False):
+        return self._answer(sql, params)
+
+    def execute_many(self, sql, seq_params):
+        return self._answer(sql, seq_params)
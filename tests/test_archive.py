@@ -0,0 +1,95 @@
+"""Retention purge and chain verification across the archive tier (app/audit/archive.py)."""
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+import pytest
+
+from app.audit import archive, chain
+from conftest import FakeDB
+
+MONTHS = ('2018-01', '2018-02', '2018-03')
+
+
+def _write_archives(archive_dir, per_month=5):
+    """Chained rows for MONTHS, one newest-first archive file per month, plus the manifest."""
+    records = []
+    for m in range(len(MONTHS)):
+        for day in range(1, per_month + 1):
+            n = len(records) + 1
+            records.append((1, 'EVENT', 'risk', n, '{"n": %d}' % n, '10.0.0.1',
+                            datetime(2018, m + 1, day, 9, 0, 0)))
+    links = chain.chain_rows(chain.GENESIS_HASH, 1, records)
+    manifest = {'table': 'audit_logs', 'format': 'jsonl.gz', 'order': 'log_id desc',
+                'archives': []}
+    for m, month in enumerate(MONTHS):
+        rows = []
+        for (user_id, action, entity_type, entity_id, details, ip, created), (seq, row_hash) \
+                in list(zip(records, links))[m * per_month:(m + 1) * per_month]:
+            rows.append({'log_id': seq, 'user_id': user_id, 'action': action,
+                         'entity_type': entity_type, 'entity_id': entity_id,
+                         'details': details, 'ip_address': ip,
+                         'created_at': created.isoformat(), 'chain_seq': seq,
+                         'row_hash': row_hash, 'full_name': None, 'username': None,
+                         'job_title': None})
+        filename = 'audit_logs_{}.jsonl.gz'.format(month.replace('-', ''))
+        path = os.path.join(archive_dir, filename)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for row in reversed(rows):
+                f.write(json.dumps(row) + '\n')
+        manifest['archives'].append({'month': month, 'file': filename, 'rows': len(rows),
+                                     'sha256': archive._sha256(path)})
+    archive._save_manifest(manifest, archive_dir)
+    return links
+
+
+@pytest.fixture
+def archived(tmp_path, monkeypatch):
+    links = _write_archives(str(tmp_path))
+    head = {'last_seq': links[-1][0], 'last_hash': links[-1][1]}
+    monkeypatch.setattr(chain, 'db', FakeDB(
+        ('FROM audit_chain_head', lambda p: [head]),
+        ('FROM audit_checkpoints', lambda p: []),
+        ('MIN(chain_seq)', lambda p: [{'lo': None, 'hi': None}]),   # everything archived
+    ))
+    monkeypatch.setattr(archive, 'db', FakeDB(('DELETE FROM audit_log_search', lambda p: 0)))
+    return str(tmp_path), links
+
+
+def _verify(archive_dir):
+    return chain.verify_chain(workers=1, archive_dir=archive_dir)
+
+
+def test_verify_after_purge_starts_at_the_purged_boundary(archived):
+    archive_dir, links = archived
+    assert _verify(archive_dir)['ok']
+
+    purged = archive.purge_expired(retention_years=1, today=date(2019, 2, 15),
+                                   archive_dir=archive_dir)
+    assert [a['month'] for a in purged] == ['2018-01']
+    manifest = archive.load_manifest(archive_dir)
+    assert manifest['purged'] == {'last_seq': 5, 'last_hash': links[4][1],
+                                  'through_month': '2018-01'}
+
+    report = _verify(archive_dir)
+    assert report['ok'], report['errors']
+    assert (report['rows'], report['purged_seq']) == (10, 5)
+
+
+def test_verify_without_the_boundary_reports_the_purged_rows(archived):
+    archive_dir, _ = archived
+    archive.purge_expired(retention_years=1, today=date(2019, 2, 15), archive_dir=archive_dir)
+    manifest = archive.load_manifest(archive_dir)
+    del manifest['purged']
+    archive._save_manifest(manifest, archive_dir)
+    assert _verify(archive_dir)['errors'][0]['error'] == 'missing rows 1..5'
+
+
+def test_later_purges_move_the_boundary_forward(archived):
+    archive_dir, links = archived
+    archive.purge_expired(retention_years=1, today=date(2019, 2, 15), archive_dir=archive_dir)
+    archive.purge_expired(retention_years=1, today=date(2019, 3, 15), archive_dir=archive_dir)
+    assert archive.load_manifest(archive_dir)['purged']['last_seq'] == 10
+    report = _verify(archive_dir)
+    assert report['ok'] and report['rows'] == 5
@@ -0,0 +1,48 @@
+"""Shared cache encoding (app/cache.py RedisBackend)."""
+import pickle
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app import cache as cache_module
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, px):
+        assert isinstance(value, bytes)
+        self.data[key] = value
+
+
+@pytest.fixture
+def backend():
+    be = cache_module.RedisBackend.__new__(cache_module.RedisBackend)
+    be._client, be._ns = FakeRedis(), 'grc:'
+    return be
+
+
+def test_rows_round_trip_with_column_types(backend):
+    rows = [{'risk_id': 7, 'score': Decimal('12.50'), 'due': date(2026, 3, 31),
+             'updated_at': datetime(2026, 3, 1, 9, 30, 15, 250000), 'owner': None}]
+    backend.set('rows', rows, 60)
+    assert backend.get('rows') == rows
+    assert type(backend.get('rows')[0]['due']) is date
+
+
+def test_payload_tuples_and_bytes_round_trip(backend):
+    value = ({'matrix': [[[]]], 'top_n': 3}, b'{"matrix":[]}', 'abc123')
+    backend.set('heatmap:3', value, 60)
+    assert backend.get('heatmap:3') == value
+
+
+def test_pickled_values_are_never_loaded(backend):
+    backend._client.data['grc:old'] = pickle.dumps({'x': 1})
+    with pytest.raises(ValueError):
+        backend.get('old')
+    assert backend.get('missing') is cache_module._MISSING
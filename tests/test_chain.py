@@ -0,0 +1,167 @@
+"""Merkle range proofs and checkpoint catch-up (app/audit/chain.py)."""
+import hashlib
+from datetime import datetime
+
+import pytest
+
+from app.audit import chain
+from conftest import FakeDB
+
+
+def _hashes(n):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 8, 13, 16])
+def test_range_proof_round_trip(size):
+    hashes = _hashes(size)
+    root = chain.merkle_root(hashes)
+    for lo in range(size):
+        for hi in range(lo + 1, size + 1):
+            proof = chain.range_proof(hashes, lo, hi)
+            assert chain.root_from_range(size, lo, hashes[lo:hi], proof) == root
+
+
+def test_range_proof_is_logarithmic():
+    size = chain.CHECKPOINT_SIZE
+    proof = chain.range_proof(_hashes(size), 1000, 1001)
+    assert len(proof) == size.bit_length() - 1
+
+
+def test_tampered_row_changes_root():
+    hashes = _hashes(8)
+    proof = chain.range_proof(hashes, 2, 5)
+    forged = hashes[2:5]
+    forged[1] = hashlib.sha256(b'forged').hexdigest()
+    assert chain.root_from_range(8, 2, forged, proof) != chain.merkle_root(hashes)
+
+
+def test_chain_rows_links_each_row_to_the_previous():
+    rows = [(1, 'LOGIN', 'user', 1, '{"a": 1}', '10.0.0.1', '2025-01-01 00:00:00'),
+            (2, 'LOGOUT', 'user', 2, None, None, '2025-01-01 00:00:01')]
+    links = chain.chain_rows(chain.GENESIS_HASH, 5, rows)
+    assert [seq for seq, _ in links] == [5, 6]
+    assert links[1][1] == chain.link_hash(links[0][1], chain._canonical(6, *rows[1]))
+    # Details compare as parsed JSON, the form MySQL returns them in
+    assert chain.chain_rows(chain.GENESIS_HASH, 5, [(1, 'LOGIN', 'user', 1, '{"a":1}',
+                                                     '10.0.0.1', '2025-01-01 00:00:00')])[0] \
+        == links[0]
+
+
+def test_block_of():
+    size = chain.CHECKPOINT_SIZE
+    assert [chain.block_of(s) for s in (1, size, size + 1)] == [0, 0, 1]
+
+
+def _checkpoint_db(monkeypatch, stored, head_seq):
+    hashes = _hashes(head_seq)
+    inserted = []
+    fake = FakeDB(
+        ('COUNT(*)', lambda p: [{'n': len([b for b in stored if b < p[0]])}]),
+        ('SELECT block_no', lambda p: [{'block_no': b} for b in stored if b < p[0]]),
+        ('FROM audit_logs', lambda p: [{'chain_seq': s, 'row_hash': hashes[s - 1]}
+                                       for s in range(p[0], min(p[1], head_seq) + 1)]),
+        ('INSERT IGNORE INTO audit_checkpoints', lambda p: inserted.append(p)),
+    )
+    monkeypatch.setattr(chain, 'db', fake)
+    monkeypatch.setattr(chain, 'CHECKPOINT_SIZE', 4)
+    return fake, hashes, inserted
+
+
+def test_write_checkpoints_catches_up_missing_blocks(monkeypatch):
+    fake, hashes, inserted = _checkpoint_db(monkeypatch, stored={1}, head_seq=14)
+    assert chain.write_checkpoints(14) == 2
+    assert [p[:3] for p in inserted] == [(0, 1, 4), (2, 9, 12)]
+    assert inserted[0][3] == chain.merkle_root(hashes[0:4])
+    assert inserted[1][4] == hashes[11]
+
+
+def test_write_checkpoints_counts_only_when_complete(monkeypatch):
+    fake, _, inserted = _checkpoint_db(monkeypatch, stored={0, 1, 2}, head_seq=14)
+    assert chain.write_checkpoints(14) == 0
+    assert len(fake.calls) == 1 and not inserted
+    assert chain.write_checkpoints(3) == 0
+    assert len(fake.calls) == 1
+
+
+class AuditTable:
+    """audit_logs, audit_checkpoints and the chain head, enough for prove_range()."""
+
+    def __init__(self, rows=10, checkpointed=2):
+        records = [(1, 'EVENT', 'risk', i, '{"n": %d}' % i, '10.0.0.1',
+                    datetime(2025, 1, i)) for i in range(1, rows + 1)]
+        links = chain.chain_rows(chain.GENESIS_HASH, 1, records)
+        self.rows = {seq: dict(zip(('user_id', 'action', 'entity_type', 'entity_id', 'details',
+                                    'ip_address', 'created_at'), record),
+                               chain_seq=seq, row_hash=row_hash)
+                     for record, (seq, row_hash) in zip(records, links)}
+        self.head = links[-1]
+        self.checkpoints = {}
+        for block in range(checkpointed):
+            hashes = [self.rows[s]['row_hash'] for s in range(block * 4 + 1, block * 4 + 5)]
+            self.checkpoints[block] = {'block_no': block, 'merkle_root': chain.merkle_root(hashes),
+                                       'chain_hash': hashes[-1]}
+
+    def _between(self, lo, hi):
+        return [dict(self.rows[s]) for s in sorted(self.rows) if lo <= s <= hi]
+
+    def bounds(self, params):
+        seqs = [s for s, r in self.rows.items() if params[0] <= r['created_at'] <= params[1]]
+        return [{'lo': min(seqs, default=None), 'hi': max(seqs, default=None)}]
+
+    def db(self):
+        return FakeDB(
+            ('MIN(chain_seq)', self.bounds),
+            ('FROM audit_checkpoints', lambda p: [c for b, c in self.checkpoints.items()
+                                                  if p[0] <= b <= p[1]]),
+            ('SELECT chain_seq, row_hash FROM audit_logs', lambda p: self._between(*p)),
+            ('details_json', lambda p: self._between(*p)),
+            ('FROM audit_chain_head', lambda p: [{'last_seq': self.head[0],
+                                                  'last_hash': self.head[1]}]),
+        )
+
+
+@pytest.fixture
+def audit_table(monkeypatch):
+    table = AuditTable()
+    monkeypatch.setattr(chain, 'CHECKPOINT_SIZE', 4)
+    monkeypatch.setattr(chain, 'db', table.db())
+    return table
+
+
+def _prove(day_from, day_to):
+    return chain.prove_range(datetime(2025, 1, day_from), datetime(2025, 1, day_to))
+
+
+def test_prove_range_rehashes_blocks_and_tail(audit_table):
+    proof = _prove(2, 10)
+    assert (proof['first_seq'], proof['last_seq']) == (2, 10)
+    assert [(b['block'], b['first_seq'], b['verified']) for b in proof['blocks']] == \
+        [(0, 2, True), (1, 5, True)]
+    assert proof['tail']['from_seq'] == 9 and proof['tail']['verified']
+    assert proof['verified']
+
+
+def test_prove_range_of_recent_rows_checks_the_tail(audit_table):
+    proof = _prove(10, 10)
+    assert proof['blocks'] == [] and proof['tail']['verified'] and proof['verified']
+    audit_table.rows[10]['details'] = '{"n": 0}'         # row_hash left as it was
+    proof = _prove(10, 10)
+    assert not proof['verified'] and proof['tail']['error'] == 'hash mismatch at seq 10'
+
+
+def test_prove_range_detects_edited_content_under_an_unchanged_hash(audit_table):
+    audit_table.rows[3]['action'] = 'EDITED'
+    proof = _prove(1, 8)
+    assert [b['verified'] for b in proof['blocks']] == [False, True]
+    assert not proof['verified']
+
+
+def test_prove_range_of_an_empty_range_is_not_verified(audit_table):
+    assert _prove(20, 21)['verified'] is False
+
+
+def test_prove_range_refuses_partly_archived_blocks(audit_table):
+    del audit_table.rows[1], audit_table.rows[2]
+    with pytest.raises(chain.ProofError, match='Block 0 has 2 of 4 rows'):
+        _prove(3, 4)
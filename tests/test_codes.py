@@ -0,0 +1,116 @@
+"""Block reservation arithmetic of the risk code allocator (app/risk/codes.py)."""
+import pytest
+
+from app.risk import codes
+
+
+class SequenceDB:
+    """risk_code_sequences / risks just far enough for RiskCodeAllocator._reserve()."""
+
+    def __init__(self, issued=None):
+        self.issued = issued or {}      # year -> highest number already in risks
+        self.sequences = {}             # year -> next_value
+        self.last_insert_id = 0         # per connection in MySQL; one connection here
+        self.statements = []
+        self.commits = self.rollbacks = 0
+
+    def get_connection(self):
+        return self
+
+    def release_connection(self, conn):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql.split()[0])
+        if sql is codes.SEED_SQL:
+            year = params[0]
+            self.sequences.setdefault(year, self.issued.get(year, 0) + 1)
+        elif sql is codes.RESERVE_SQL:
+            count, year = params
+            self.rowcount = int(year in self.sequences)
+            if self.rowcount:
+                self.sequences[year] += count
+                self.last_insert_id = self.sequences[year]
+
+    def fetchone(self):
+        return (self.last_insert_id,)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = SequenceDB(issued={2025: 23})
+    monkeypatch.setattr(codes, 'db', fake)
+    return fake
+
+
+def test_block_is_handed_out_from_memory(fake_db):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    assert [alloc.next_code(2025) for _ in range(5)] == \
+        ['RISK-2025-{:03d}'.format(n) for n in range(24, 29)]
+    assert alloc.stats == {'allocated': 5, 'reservations': 1}
+    assert alloc.next_code(2025) == 'RISK-2025-029'
+    assert alloc.stats['reservations'] == 2
+    assert fake_db.sequences[2025] == 34
+    # The counter is seeded from existing codes once per year
+    assert fake_db.statements.count('INSERT') == 1
+
+
+def test_small_request_beyond_the_block_skips_its_tail(fake_db):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    alloc.allocate(3, 2025)                                     # 24-26 of 24-28
+    assert alloc.allocate(3, 2025) == ['RISK-2025-029', 'RISK-2025-030', 'RISK-2025-031']
+    assert alloc.next_code(2025) == 'RISK-2025-032'
+
+
+def test_large_request_gets_its_own_range_and_keeps_the_block(fake_db):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    assert alloc.next_code(2025) == 'RISK-2025-024'            # block 24-28
+    bulk = alloc.allocate(7, 2025)
+    assert bulk == ['RISK-2025-{:03d}'.format(n) for n in range(29, 36)]
+    assert alloc.next_code(2025) == 'RISK-2025-025'
+    assert alloc.stats == {'allocated': 9, 'reservations': 2}
+
+
+def test_new_year_starts_a_new_counter(fake_db):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    alloc.next_code(2025)
+    assert alloc.next_code(2026) == 'RISK-2026-001'
+    assert alloc.next_code(2025) == 'RISK-2025-029'            # the old block was dropped
+
+
+def test_block_inherited_across_fork_is_not_reused(fake_db, monkeypatch):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    alloc.next_code(2025)
+    monkeypatch.setattr(codes.os, 'getpid', lambda: -1)
+    assert alloc.next_code(2025) == 'RISK-2025-029'
+
+
+def test_missing_counter_row_is_reseeded(fake_db):
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    alloc.next_code(2025)
+    del fake_db.sequences[2025]                 # e.g. the row was deleted
+    alloc.allocate(5, 2025)
+    # Seeded again from the risks table rather than trusting a stale LAST_INSERT_ID()
+    assert fake_db.statements[-4:] == ['UPDATE', 'INSERT', 'UPDATE', 'SELECT']
+    assert fake_db.sequences[2025] == 29
+
+
+def test_reservation_fails_when_seeding_does_not_help(fake_db, monkeypatch):
+    monkeypatch.setattr(SequenceDB, 'execute', lambda self, sql, params=None:
+                        setattr(self, 'rowcount', 0))
+    alloc = codes.RiskCodeAllocator(block_size=5)
+    with pytest.raises(RuntimeError, match='No risk_code_sequences row for 2025'):
+        alloc.next_code(2025)
+    assert fake_db.rollbacks == 1 and 2025 not in alloc._seeded
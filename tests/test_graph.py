@@ -0,0 +1,187 @@
+"""Incremental coverage and gap maintenance of the control graph (app/compliance/graph.py)."""
+import os
+import random
+
+import pytest
+
+from app.compliance import graph
+from conftest import FakeDB
+
+
+def _risk(risk_id, score=10, level='High', status='Identified'):
+    return {'risk_id': risk_id, 'risk_code': 'RISK-{:03d}'.format(risk_id),
+            'risk_title': 'Risk {}'.format(risk_id), 'risk_score': score,
+            'risk_level': level, 'status': status}
+
+
+def _control(control_id, status='Implemented', regulation='PCI-DSS'):
+    return {'control_id': control_id, 'control_code': 'CTL-{:02d}'.format(control_id),
+            'control_name': 'Control {}'.format(control_id), 'regulation': regulation,
+            'implementation_status': status}
+
+
+class Tables:
+    """The three tables ControlGraph.reconcile() reads."""
+
+    def __init__(self, risks, controls, mappings):
+        self.risks = {r['risk_id']: r for r in risks}
+        self.controls = {c['control_id']: c for c in controls}
+        self.mappings = set(mappings)
+
+    def db(self):
+        return FakeDB(
+            ('FROM risks', lambda p: list(self.risks.values())),
+            ('FROM compliance_controls', lambda p: list(self.controls.values())),
+            ('FROM risk_compliance_mapping',
+             lambda p: [{'risk_id': r, 'control_id': c} for r, c in sorted(self.mappings)]),
+        )
+
+
+def _loaded_graph():
+    g = graph.ControlGraph()
+    g._thread, g._pid = object(), os.getpid()      # no reconcile thread in tests
+    g.reconcile()
+    return g
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = Tables(
+        risks=[_risk(1, 20), _risk(2, 15), _risk(3, 5, 'Low'), _risk(4, 12, status='Closed')],
+        controls=[_control(10), _control(11, 'In Progress')],
+        mappings=[(1, 10), (2, 11), (4, 10)],
+    )
+    monkeypatch.setattr(graph, 'db', tables.db())
+    return tables
+
+
+def _levels(g):
+    return {level: (row['unmapped'], row['mapped_not_implemented'], row['covered'])
+            for level, row in g.coverage()['levels'].items()}
+
+
+def _gap_codes(g, level='High'):
+    return [r['risk_code'] for r in g.gaps(level)]
+
+
+def test_reconcile_counts_open_risks_only(tables):
+    g = _loaded_graph()
+    assert _levels(g) == {'Low': (1, 0, 0), 'Medium': (0, 0, 0), 'High': (0, 1, 1)}
+    assert _gap_codes(g) == ['RISK-002']
+    assert [(c['control_code'], c['risk_score']) for c in g.centrality()] == \
+        [('CTL-10', 20), ('CTL-11', 15)]
+
+
+def test_mapping_and_status_deltas(tables):
+    g = _loaded_graph()
+    g.on_mapping_added(2, 10)
+    assert _levels(g)['High'] == (0, 0, 2) and _gap_codes(g) == []
+    assert g.centrality()[0]['risk_score'] == 35
+
+    g.on_control_status_changed(10, 'Not Started')
+    assert _levels(g)['High'] == (0, 2, 0)
+    assert _gap_codes(g) == ['RISK-001', 'RISK-002']
+    exposed = g.blast_radius(11)
+    assert exposed['exposed_score'] == 15 and not exposed['degraded']
+
+    g.on_control_status_changed(11, 'Implemented')
+    g.on_mapping_removed(2, 10)
+    g.on_mapping_removed(2, 11)
+    assert _levels(g)['High'] == (1, 1, 0)
+    assert _gap_codes(g) == ['RISK-001', 'RISK-002']
+
+
+def test_risk_lifecycle_deltas(tables):
+    g = _loaded_graph()
+    g.on_risk_created(5, 'RISK-005', 'Risk 5', 25, 'High', 'Identified')
+    assert _levels(g)['High'] == (1, 1, 1)
+    assert _gap_codes(g) == ['RISK-005', 'RISK-002']
+
+    g.on_risk_status_changed(2, 'Closed')
+    assert _levels(g)['High'] == (1, 0, 1)
+    g.on_risk_status_changed(4, 'Identified')      # reopened, already covered by CTL-10
+    assert _levels(g)['High'] == (1, 0, 2)
+    assert g.centrality()[0]['risk_score'] == 32
+
+
+def test_deleting_a_risk_removes_its_node_and_edges(tables):
+    g = _loaded_graph()
+    g.on_risk_deleted(1)                # the last node (4) moves into its slot
+    assert g.stats['risks'] == 3 and g.stats['edges'] == 2
+    assert _levels(g)['High'] == (0, 1, 0)
+    assert g.blast_radius(10)['exposed'] == []
+    g.on_risk_status_changed(4, 'Identified')
+    assert [r['risk_code'] for r in g.blast_radius(10)['exposed']] == ['RISK-004']
+    g.on_risk_deleted(1)                # unknown now: ignored
+    assert g._loaded
+
+
+def test_unknown_node_schedules_a_reload(tables):
+    g = _loaded_graph()
+    g.on_mapping_added(99, 10)
+    assert not g._loaded
+
+
+def test_random_deltas_match_a_full_reconcile(monkeypatch):
+    rng = random.Random(7)
+    tables = Tables(
+        risks=[_risk(i, rng.randint(1, 25), rng.choice(graph.LEVELS),
+                     rng.choice(['Identified', 'Assessed', 'Closed'])) for i in range(1, 120)],
+        controls=[_control(i, rng.choice(['Implemented', 'Not Started']),
+                           rng.choice(['PCI-DSS', 'GDPR'])) for i in range(1, 15)],
+        mappings=[],
+    )
+    tables.mappings = {(rng.randrange(1, 120), rng.randrange(1, 15)) for _ in range(300)}
+    monkeypatch.setattr(graph, 'db', tables.db())
+    g = _loaded_graph()
+
+    for _ in range(1500):
+        op = rng.random()
+        if op < 0.2 and len(tables.risks) > 20:
+            risk_id = rng.choice(sorted(tables.risks))
+            del tables.risks[risk_id]
+            tables.mappings = {m for m in tables.mappings if m[0] != risk_id}
+            g.on_risk_deleted(risk_id)
+        elif op < 0.45:
+            pair = (rng.choice(sorted(tables.risks)), rng.choice(sorted(tables.controls)))
+            if pair not in tables.mappings:
+                tables.mappings.add(pair)
+                g.on_mapping_added(*pair)
+        elif op < 0.65 and tables.mappings:
+            pair = rng.choice(sorted(tables.mappings))
+            tables.mappings.discard(pair)
+            g.on_mapping_removed(*pair)
+        elif op < 0.8:
+            control_id = rng.choice(sorted(tables.controls))
+            status = rng.choice(['Implemented', 'In Progress'])
+            tables.controls[control_id]['implementation_status'] = status
+            g.on_control_status_changed(control_id, status)
+        elif op < 0.9:
+            risk_id = rng.choice(sorted(tables.risks))
+            status = rng.choice(['Identified', 'Closed'])
+            tables.risks[risk_id]['status'] = status
+            g.on_risk_status_changed(risk_id, status)
+        else:
+            row = _risk(max(tables.risks) + 1, rng.randint(1, 25), rng.choice(graph.LEVELS))
+            tables.risks[row['risk_id']] = row
+            g.on_risk_created(row['risk_id'], row['risk_code'], row['risk_title'],
+                              row['risk_score'], row['risk_level'], row['status'])
+        assert g._loaded
+
+    fresh = _loaded_graph()
+
+    def view(x):
+        return (x.coverage(), [x.gaps(level, 1000) for level in graph.LEVELS],
+                # ties in centrality may rank in either order
+                sorted(x.centrality(100), key=lambda c: c['control_id']),
+                [x.blast_radius(c) for c in tables.controls])
+
+    assert view(g) == view(fresh)
+
+
+def test_invalidate_reloads_on_next_read(tables):
+    g = _loaded_graph()
+    tables.risks[6] = _risk(6, 25)                  # e.g. a bulk import
+    g.invalidate()
+    assert _gap_codes(g) == ['RISK-006', 'RISK-002']
+    assert g.stats['reconciles'] == 2
@@ -0,0 +1,56 @@
+"""Bulk mapping request parsing (app/compliance/mappings.py)."""
+import re
+
+import pytest
+
+from app.compliance import mappings
+from app.compliance.mappings import MappingError, parse_changes
+
+
+def test_parses_adds_and_removes():
+    adds, removes = parse_changes({
+        'add': [{'risk_id': 1, 'control_id': '2'},
+                {'risk_id': '3', 'control_id': 4, 'mapping_type': 'Detective'}],
+        'remove': [{'risk_id': 5, 'control_id': 6}],
+    })
+    assert adds == {(1, 2): 'Mitigating', (3, 4): 'Detective'}
+    assert removes == {(5, 6)}
+
+
+def test_last_add_of_a_pair_wins():
+    adds, _ = parse_changes({'add': [{'risk_id': 1, 'control_id': 2, 'mapping_type': 'Detective'},
+                                     {'risk_id': 1, 'control_id': 2, 'mapping_type': 'Preventive'}]})
+    assert adds == {(1, 2): 'Preventive'}
+
+
+@pytest.mark.parametrize('payload, message', [
+    ([], 'must be a JSON object'),
+    ({'add': {'risk_id': 1, 'control_id': 2}}, 'must be lists'),
+    ({'remove': 'all'}, 'must be lists'),
+    ({}, 'Nothing to change'),
+    ({'add': [], 'remove': None}, 'Nothing to change'),
+    ({'add': ['1:2']}, 'add[0]: expected an object'),
+    ({'add': [{'risk_id': 1}]}, 'add[0]: risk_id and control_id must be integers'),
+    ({'remove': [{'risk_id': 1, 'control_id': 2}, {'risk_id': 'x', 'control_id': 2}]},
+     'remove[1]: risk_id and control_id must be integers'),
+    ({'add': [{'risk_id': None, 'control_id': 2}]}, 'must be integers'),
+    ({'add': [{'risk_id': 1, 'control_id': 2, 'mapping_type': 'Corrective'}]},
+     'add[0]: mapping_type must be one of'),
+    ({'add': [{'risk_id': 1, 'control_id': 2}], 'remove': [{'risk_id': 1, 'control_id': 2}]},
+     'risk 1 / control 2 is both added and removed'),
+])
+def test_rejects_malformed_requests(payload, message):
+    with pytest.raises(MappingError, match=re.escape(message)):
+        parse_changes(payload)
+
+
+def test_change_limit(monkeypatch):
+    monkeypatch.setattr(mappings.Config, 'MAPPING_BULK_MAX_CHANGES', 2)
+    pairs = [{'risk_id': 1, 'control_id': c} for c in range(3)]
+    with pytest.raises(MappingError, match='At most 2 changes'):
+        parse_changes({'add': pairs[:2], 'remove': pairs[2:]})
+    assert len(parse_changes({'add': pairs[:2]})[0]) == 2
+
+
+def test_mapping_error_is_a_value_error():
+    assert issubclass(MappingError, ValueError)
@@ -0,0 +1,65 @@
+"""Session payload encoding and lazy loading (app/sessions.py)."""
+import pickle
+from datetime import datetime, timezone
+
+import pytest
+from markupsafe import Markup
+
+from app import sessions
+
+
+def test_round_trip_keeps_types():
+    data = {
+        'user_id': 7,
+        'roles': ('admin', 'auditor'),
+        'token': b'\x00\xff',
+        'flash': Markup('<b>saved</b>'),
+        'login_at': datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc),
+        'nested': {'ids': [1, 2], 'name': 'Priya'},
+    }
+    blob = sessions.encode(data)
+    assert isinstance(blob, bytes)
+    decoded = sessions.decode(blob)
+    assert decoded == data
+    assert isinstance(decoded['roles'], tuple) and isinstance(decoded['flash'], Markup)
+
+
+def test_decode_accepts_memoryview():
+    # sqlite3 and some drivers hand BLOBs back as memoryview / bytearray
+    blob = sessions.encode({'a': 1})
+    assert sessions.decode(memoryview(blob)) == {'a': 1}
+    assert sessions.decode(bytearray(blob)) == {'a': 1}
+
+
+@pytest.mark.parametrize('blob', [
+    pickle.dumps({'user_id': 1}),   # written by an older release, never unpickled
+    b'not json',
+    b'[1, 2, 3]',
+    b'\xff\xfe',
+])
+def test_decode_rejects_non_session_payloads(blob):
+    with pytest.raises(ValueError):
+        sessions.decode(blob)
+
+
+def test_lazy_session_loads_once_and_drops_unreadable_payloads():
+    store = sessions.MemorySessionStore()
+    store.save('good', 1, sessions.encode({'user_id': 1}), expires_at=float('inf'))
+    store.save('bad', 2, pickle.dumps({'user_id': 2}), expires_at=float('inf'))
+
+    session = sessions.LazySession(store, 'good')
+    assert not session.loaded
+    assert session['user_id'] == 1 and session.accessed and session.sid == 'good'
+
+    session = sessions.LazySession(store, 'bad')
+    assert 'user_id' not in session
+    assert session.sid is None      # a fresh id is issued on save
+
+
+def test_clear_rotates_the_session_id():
+    store = sessions.MemorySessionStore()
+    store.save('old', 1, sessions.encode({'user_id': 1}), expires_at=float('inf'))
+    session = sessions.LazySession(store, 'old')
+    session.clear()
+    assert session.sid is None and session.rotated_from == 'old'
+    assert session.modified and len(session) == 0
@@ -0,0 +1,68 @@
+"""Cached simulation runs (app/risk/simulation.py get_simulation)."""
+import threading
+
+import pytest
+
+from app.cache import Cache, MemoryBackend
+from app.risk import simulation
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Stub model: each run blocks until `release` is set and is recorded in `started`."""
+    started, release = [], threading.Event()
+
+    def simulate(risks, trials, seed, workers):
+        started.append(seed)
+        assert release.wait(5)
+        return {'seed': seed, 'categories': []}
+
+    monkeypatch.setattr(simulation, 'cache', Cache(MemoryBackend()))
+    monkeypatch.setattr(simulation, 'register_version', lambda: '1-00000000')
+    monkeypatch.setattr(simulation, 'simulate', simulate)
+    monkeypatch.setattr(simulation, 'get_risk_categories', lambda: [])
+    monkeypatch.setattr(simulation.db, 'execute_query', lambda *a, **k: [])
+    return started, release
+
+
+def _run(seeds):
+    results = []
+    threads = [threading.Thread(target=lambda s=s: results.append(
+        simulation.get_simulation(trials=1000, seed=s)['seed'])) for s in seeds]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def _wait_for(started, n):
+    for _ in range(500):
+        if len(started) >= n:
+            return
+        threading.Event().wait(0.01)
+
+
+def test_different_keys_run_concurrently(runs):
+    started, release = runs
+    threads, results = _run([1, 2])
+    _wait_for(started, 2)
+    assert sorted(started) == [1, 2]     # neither run waited for the other
+    release.set()
+    for t in threads:
+        t.join()
+    assert sorted(results) == [1, 2] and simulation._load_locks == {}
+
+
+def test_same_key_shares_one_run(runs):
+    started, release = runs
+    threads, results = _run([7, 7, 7])
+    _wait_for(started, 1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert started == [7] and results == [7, 7, 7]
+    assert simulation._load_locks == {}
+
+
+def test_negative_seed_is_rejected(runs):
+    with pytest.raises(ValueError):
+        simulation.get_simulation(seed=-1)
@@ -0,0 +1,63 @@
+"""Per-connection prepared statement LRU (app/db.py StatementCache)."""
+from app.db import StatementCache
+
+
+class Cursor:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Connection:
+    def __init__(self):
+        self.cursors = []
+
+    def cursor(self, prepared=False, dictionary=False):
+        assert prepared and dictionary
+        self.cursors.append(Cursor())
+        return self.cursors[-1]
+
+
+def _counters():
+    return {'hits': 0, 'misses': 0, 'evictions': 0, 'statements': {}}
+
+
+def test_hit_returns_the_cached_sql_and_cursor():
+    conn, counters = Connection(), _counters()
+    cache = StatementCache(2, counters)
+    first = cache.get(conn, 'SELECT 1')
+    # An equal string from elsewhere maps to the cached key object
+    again = cache.get(conn, ''.join(['SELECT ', '1']))
+    assert again is first and again[0] is first[0]
+    assert len(conn.cursors) == 1
+    assert (counters['hits'], counters['misses']) == (1, 1)
+    assert counters['statements']['SELECT 1'] == {'hits': 1, 'misses': 1}
+
+
+def test_least_recently_used_is_evicted_and_closed():
+    conn, counters = Connection(), _counters()
+    cache = StatementCache(2, counters)
+    a = cache.get(conn, 'SELECT a')[1]
+    b = cache.get(conn, 'SELECT b')[1]
+    cache.get(conn, 'SELECT a')             # b is now least recently used
+    cache.get(conn, 'SELECT c')
+    assert b.closed and not a.closed
+    assert counters['evictions'] == 1
+    assert cache.get(conn, 'SELECT a')[1] is a
+    assert cache.get(conn, 'SELECT b')[1] is not b      # re-prepared
+    assert a.closed is False and counters['evictions'] == 2
+
+
+def test_evict_and_discard_close_cursors():
+    conn, counters = Connection(), _counters()
+    cache = StatementCache.for_connection(conn, 4, counters)
+    assert StatementCache.for_connection(conn, 4, counters) is cache
+    x = cache.get(conn, 'SELECT x')[1]
+    y = cache.get(conn, 'SELECT y')[1]
+    cache.evict('SELECT x')
+    assert x.closed and not y.closed
+    StatementCache.discard(conn)
+    assert y.closed
+    assert cache.get(conn, 'SELECT y')[1] is not y
@@ -0,0 +1,132 @@
+"""Login throttle windows, lockout, expiry and persistence (app/auth/throttle.py)."""
+import types
+
+import pytest
+
+from app.auth import throttle
+from conftest import FakeDB
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(throttle, 'time', types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def limiter(clock, monkeypatch):
+    t = throttle.LoginThrottle(user_limit=4, user_window=60, ip_limit=6, ip_window=60,
+                               lockout_threshold=3, lockout_seconds=300)
+    monkeypatch.setattr(t, '_ensure_started', lambda: None)
+    return t
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB(('UPDATE users', lambda rows: len(rows)))
+    monkeypatch.setattr(throttle, 'db', fake)
+    return fake
+
+
+def _persisted(fake_db):
+    names = {throttle.ADD_FAILURES_SQL: 'add', throttle.SET_UNLOCKED_SQL: 'unlock',
+             throttle.SET_LOCKED_SQL: 'lock'}
+    return {names[sql]: rows for sql, rows in fake_db.calls}
+
+
+def test_lockout_after_threshold_then_expiry(limiter, clock):
+    for _ in range(2):
+        assert limiter.check('alice', '10.0.0.1') is None
+        assert limiter.record_failure('alice') is False
+    assert limiter.check('alice', '10.0.0.1') is None
+    assert limiter.record_failure('alice') is True
+
+    reason, retry = limiter.check('alice', '10.0.0.1')
+    assert reason == 'locked' and retry == pytest.approx(300)
+
+    clock.now += 301
+    assert limiter.check('alice', '10.0.0.1') is None
+    assert limiter.record_failure('alice') is False     # streak restarted
+
+
+def test_success_clears_streak_and_lock(limiter):
+    for _ in range(2):
+        limiter.record_failure('bob')
+    limiter.record_success('bob')
+    assert limiter.record_failure('bob') is False
+    assert limiter.record_failure('bob') is False
+
+    limiter.record_failure('bob')
+    assert limiter.check('bob', '10.0.0.2')[0] == 'locked'
+    limiter.unlock('bob')
+    assert limiter.check('bob', '10.0.0.2') is None
+
+
+def test_sliding_windows(limiter, clock):
+    for _ in range(4):
+        assert limiter.check('carol', '10.0.0.3') is None
+    reason, retry = limiter.check('carol', '10.0.0.3')
+    assert reason == 'throttled' and retry == pytest.approx(60)
+    # The IP window is separate: other users from the same address still pass
+    assert limiter.check('dave', '10.0.0.3') is None
+    assert limiter.check('erin', '10.0.0.3') is None
+    assert limiter.check('frank', '10.0.0.3')[0] == 'throttled'
+    clock.now += 61
+    assert limiter.check('carol', '10.0.0.3') is None
+
+
+def test_stored_lock_state(limiter):
+    user = {'username': 'gina', 'account_locked': True, 'lock_seconds': 120}
+    assert limiter.check_stored(user) == ('locked', 120)
+    assert limiter.check('gina', '10.0.0.4')[0] == 'locked'
+
+    admin_lock = {'username': 'hank', 'account_locked': True, 'lock_seconds': None}
+    assert limiter.check_stored(admin_lock) == ('locked', None)
+
+    # Failures recorded by another worker count towards the lockout here
+    assert limiter.check_stored({'username': 'ivan', 'failed_login_count': 2}) is None
+    assert limiter.record_failure('ivan') is True
+
+
+def test_expired_stored_lock_is_cleared_on_flush(limiter, fake_db):
+    user = {'username': 'judy', 'account_locked': True, 'lock_seconds': -5}
+    assert limiter.check_stored(user) is None
+    assert limiter.flush() == 1
+    assert _persisted(fake_db) == {'unlock': [(0, 'judy')]}
+
+
+def test_flush_persists_counts_and_remaining_lock_time(limiter, clock, fake_db):
+    limiter.record_failure('kim')
+    limiter.record_failure('kim')
+    for _ in range(3):
+        limiter.record_failure('lee')
+    limiter.record_failure('nobody', known=False)
+    clock.now += 100
+    assert limiter.flush() == 2
+    assert _persisted(fake_db) == {
+        'add': [(2, 'kim')],
+        'lock': [(0, 200, 'lee')],
+    }
+    assert limiter.flush() == 0
+
+
+def test_failed_flush_keeps_updates(limiter, monkeypatch):
+    def down(rows):
+        raise RuntimeError('db down')
+    monkeypatch.setattr(throttle, 'db', FakeDB(('UPDATE users', down)))
+    limiter.record_failure('mia')
+    with pytest.raises(RuntimeError):
+        limiter.flush()
+    fake = FakeDB(('UPDATE users', lambda rows: len(rows)))
+    monkeypatch.setattr(throttle, 'db', fake)
+    assert limiter.flush() == 1
+    assert fake.calls[0][1] == [(1, 'mia')]
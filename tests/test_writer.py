@@ -0,0 +1,123 @@
+"""Audit writer spool: fallback writes and spool recovery (app/audit/writer.py)."""
+import glob
+import json
+import os
+
+import pytest
+
+from app.audit import writer
+from conftest import FakeDB
+
+
+class AuditLog:
+    """audit_logs, the chain head and the audit_actions lookup; `down` fails writes."""
+
+    def __init__(self):
+        self.rows, self.actions, self.down = [], set(), False
+
+    def head(self, params):
+        if self.down:
+            raise RuntimeError('database unavailable')
+        return [{'last_seq': len(self.rows), 'last_hash': '0' * 64}]
+
+    def db(self):
+        return FakeDB(
+            ('FOR UPDATE', self.head),
+            ('INTO audit_logs', lambda rows: self.rows.extend(rows)),
+            ('UPDATE audit_chain_head', lambda p: 1),
+            ('INTO audit_actions', lambda rows: self.actions.update(r[0] for r in rows)),
+            ('MAX(log_id)', lambda p: [{'last_id': 0}]),
+        )
+
+
+@pytest.fixture
+def audit_log(monkeypatch):
+    log = AuditLog()
+    monkeypatch.setattr(writer, 'db', log.db())
+    monkeypatch.setattr(writer, 'write_checkpoints', lambda seq: 0)
+    monkeypatch.setattr(writer, 'invalidate_audit_actions', lambda: None)
+    return log
+
+
+def _writer(spool_dir, pid=None, **kwargs):
+    """An AuditWriter set up as start() would, without the flusher thread."""
+    aw = writer.AuditWriter(str(spool_dir), max_queue=1, enqueue_timeout=0, **kwargs)
+    aw._pid = pid or os.getpid()
+    aw._thread = object()
+    aw._pending = aw._recover_spools()
+    return aw
+
+
+def _spooled(spool_dir):
+    lines = []
+    for path in sorted(glob.glob(os.path.join(str(spool_dir), '*.jsonl'))):
+        with open(path, encoding='utf-8') as f:
+            lines += [json.loads(line)['action'] for line in f]
+    return lines
+
+
+def _drain(aw):
+    while not aw._queue.empty():
+        aw._pending.append(aw._queue.get_nowait())
+    aw._flush_pending()
+    aw._flush_retries()
+
+
+def test_failed_fallback_write_is_spooled_and_retried(tmp_path, audit_log):
+    aw = _writer(tmp_path)
+    audit_log.down = True
+    aw.submit(1, 'QUEUED')
+    aw.submit(1, 'FALLBACK')            # queue full: written on this thread, fails
+    assert aw.stats['fallback_writes'] == 1 and list(aw._retry) == [2]
+    assert _spooled(tmp_path) == ['QUEUED', 'FALLBACK']
+
+    audit_log.down = False
+    aw._pending.append(aw._queue.get_nowait())
+    aw._flush_pending()
+    # QUEUED is committed but FALLBACK is not: the spool keeps both
+    assert _spooled(tmp_path) == ['QUEUED', 'FALLBACK']
+    aw._flush_retries()
+    assert [row[1] for row in audit_log.rows] == ['QUEUED', 'FALLBACK']
+    assert audit_log.actions == {'QUEUED', 'FALLBACK'}
+    assert _spooled(tmp_path) == [] and aw.stats['fallback_retries'] == 1
+
+
+def test_successful_fallback_registers_its_action(tmp_path, audit_log):
+    aw = _writer(tmp_path)
+    aw.submit(1, 'QUEUED')
+    aw.submit(1, 'FALLBACK')
+    assert [row[1] for row in audit_log.rows] == ['FALLBACK']
+    assert audit_log.actions == {'FALLBACK'}
+    assert _spooled(tmp_path) == ['QUEUED', 'FALLBACK']     # QUEUED still outstanding
+    _drain(aw)
+    assert _spooled(tmp_path) == []
+
+
+def test_a_dead_workers_spool_is_replayed_once(tmp_path, audit_log, monkeypatch):
+    dead, first, second = 990001, 990002, 990003
+    with open(tmp_path / '{}.0.jsonl'.format(dead), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'action': 'ORPHAN'}) + '\n')
+    monkeypatch.setattr(writer, '_pid_alive', lambda pid: pid != dead)
+    listing = list(writer._spool_files(str(tmp_path)))
+    # Both workers list the directory before either claims the file
+    monkeypatch.setattr(writer, '_spool_files', lambda spool_dir: iter(listing))
+
+    a = _writer(tmp_path, pid=first)
+    b = _writer(tmp_path, pid=second)
+    assert [e['action'] for _, e in a._pending] == ['ORPHAN']
+    assert b._pending == []
+    assert not os.path.exists(tmp_path / '{}.0.jsonl'.format(dead))
+    _drain(a)
+    assert [row[1] for row in audit_log.rows] == ['ORPHAN']
+
+
+def test_claimed_file_of_a_dead_claimer_is_recovered(tmp_path, audit_log, monkeypatch):
+    # A worker died after claiming an orphan but before re-spooling it
+    with open(tmp_path / '990004.claim-990001-0.jsonl', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'action': 'CLAIMED'}) + '\n')
+    monkeypatch.setattr(writer, '_pid_alive', lambda pid: False)
+    aw = _writer(tmp_path)
+    assert [e['action'] for _, e in aw._pending] == ['CLAIMED']
+    assert _spooled(tmp_path) == ['CLAIMED']
+    _drain(aw)
+    assert _spooled(tmp_path) == []